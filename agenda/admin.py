@@ -1,8 +1,10 @@
 from django.contrib import admin
-from .models import Especialidade, Medico, Paciente, Consulta
+from .models import Especialidade, Medico, Paciente, Consulta, SerieConsulta, BloqueioAgenda, ListaEspera
 
 admin.site.register(Especialidade)
 admin.site.register(Medico)
 admin.site.register(Paciente)
 admin.site.register(Consulta)
-
+admin.site.register(SerieConsulta)
+admin.site.register(BloqueioAgenda)
+admin.site.register(ListaEspera)
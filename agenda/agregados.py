@@ -0,0 +1,173 @@
+from collections import Counter
+from datetime import date, timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth
+from django.utils import timezone
+
+from .cache import data_local
+from .models import Consulta, ConsultaAgregado
+
+STATUS = [valor for valor, _ in Consulta._meta.get_field('status').choices]
+
+# Campos (id, nome) de cada dimensão do painel
+DIMENSOES = {
+    'medico': ('medico_id', 'medico__nome'),
+    'especialidade': ('medico__especialidade_id', 'medico__especialidade__nome'),
+}
+
+
+def chave_agregado(medico_id, data_hora, status):
+    """(data local, medico_id, status) da consulta, ou None se ainda não tem médico ou horário"""
+    if medico_id is None or data_hora is None or status is None:
+        return None
+    return data_local(data_hora), medico_id, status
+
+
+def deltas_alteracao(anterior, atual):
+    """Counter de ajustes para uma consulta que passou da chave `anterior` para `atual` (None = não existe)"""
+    deltas = Counter()
+    if anterior != atual:
+        if anterior:
+            deltas[anterior] -= 1
+        if atual:
+            deltas[atual] += 1
+    return deltas
+
+
+def ajustar_agregados(deltas):
+    """Soma os deltas {(data, medico_id, status): n} aos totais, com um upsert por chave.
+
+    O upsert (INSERT ... ON CONFLICT DO UPDATE) incrementa a linha existente ou a cria,
+    sem leitura prévia, e roda na transação de quem alterou as consultas. Deltas
+    negativos só atualizam linhas existentes: numa exclusão em cascata (da especialidade,
+    por exemplo) a linha do médico já foi removida e não pode ser recriada.
+    """
+    operacoes = connection.ops
+    linhas = [
+        (operacoes.adapt_datefield_value(data), medico_id, status, delta)
+        for (data, medico_id, status), delta in deltas.items()
+        if delta
+    ]
+    if not linhas:
+        return
+    tabela = operacoes.quote_name(ConsultaAgregado._meta.db_table)
+    incrementos = [linha for linha in linhas if linha[3] > 0]
+    decrementos = [(delta, data, medico_id, status) for data, medico_id, status, delta in linhas if delta < 0]
+    with transaction.atomic(savepoint=False), connection.cursor() as cursor:
+        if incrementos:
+            cursor.executemany(
+                f'INSERT INTO {tabela} (data, medico_id, status, total) VALUES (%s, %s, %s, %s) '
+                f'ON CONFLICT (data, medico_id, status) DO UPDATE SET total = {tabela}.total + excluded.total',
+                incrementos,
+            )
+        if decrementos:
+            cursor.executemany(
+                f'UPDATE {tabela} SET total = total + %s WHERE data = %s AND medico_id = %s AND status = %s',
+                decrementos,
+            )
+
+
+def reconstruir_agregados(medico_ids=None):
+    """Recalcula os agregados a partir das consultas (todos ou apenas os dos médicos informados).
+
+    O agrupamento é feito no banco, com um único INSERT ... SELECT; retorna o número de linhas geradas.
+    """
+    consultas = Consulta.objects.all()
+    agregados = ConsultaAgregado.objects.all()
+    if medico_ids is not None:
+        medico_ids = list(medico_ids)
+        consultas = consultas.filter(medico_id__in=medico_ids)
+        agregados = agregados.filter(medico_id__in=medico_ids)
+
+    totais = (
+        consultas.annotate(dia=TruncDate('data_hora')).order_by()
+        .values('dia', 'medico_id', 'status').annotate(quantidade=Count('id'))
+    )
+    consulta_sql, parametros = totais.query.sql_with_params()
+    tabela = connection.ops.quote_name(ConsultaAgregado._meta.db_table)
+    with transaction.atomic():
+        agregados.delete()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {tabela} (data, medico_id, status, total) '
+                f'SELECT dia, medico_id, status, quantidade FROM ({consulta_sql}) totais',
+                parametros,
+            )
+            return cursor.rowcount
+
+
+def agregados_periodo(inicio, fim, medico=None, especialidade=None):
+    """Agregados de inicio a fim (inclusive), opcionalmente de um médico ou especialidade"""
+    agregados = ConsultaAgregado.objects.filter(data__gte=inicio, data__lte=fim)
+    if medico:
+        agregados = agregados.filter(medico=medico)
+    if especialidade:
+        agregados = agregados.filter(medico__especialidade=especialidade)
+    return agregados
+
+
+def _pivotar(linhas, chave):
+    """Agrupa linhas {..., status, total} em uma linha por `chave`, com o total de cada status"""
+    resultado = {}
+    for linha in linhas:
+        item = resultado.get(linha[chave])
+        if item is None:
+            item = {campo: valor for campo, valor in linha.items() if campo not in ('status', 'total')}
+            item.update(dict.fromkeys(STATUS, 0), total=0)
+            resultado[linha[chave]] = item
+        item[linha['status']] += linha['total']
+        item['total'] += linha['total']
+    return list(resultado.values())
+
+
+def totais_por_periodo(agregados, agrupamento='dia'):
+    """Uma linha por dia (ou mês) com o total de cada status"""
+    periodo = TruncMonth('data') if agrupamento == 'mes' else F('data')
+    linhas = (
+        agregados.annotate(periodo=periodo).values('periodo', 'status')
+        .annotate(soma=Sum('total')).order_by('periodo', 'status')
+    )
+    return _pivotar(
+        ({'periodo': linha['periodo'], 'status': linha['status'], 'total': linha['soma']} for linha in linhas),
+        'periodo',
+    )
+
+
+def totais_por_dimensao(agregados, dimensao='medico'):
+    """Uma linha por médico (ou especialidade) com o total de cada status, da maior para a menor"""
+    campo_id, campo_nome = DIMENSOES[dimensao]
+    linhas = agregados.values(campo_id, campo_nome, 'status').annotate(soma=Sum('total')).order_by(campo_id)
+    itens = _pivotar(
+        ({'id': linha[campo_id], 'nome': linha[campo_nome], 'status': linha['status'], 'total': linha['soma']}
+         for linha in linhas),
+        'id',
+    )
+    return sorted(itens, key=lambda item: (-item['total'], item['nome']))
+
+
+def total_consultas_medico():
+    """Expressão com o total de consultas do médico (para annotate), lida dos agregados"""
+    soma = (
+        ConsultaAgregado.objects.filter(medico=OuterRef('pk')).order_by()
+        .values('medico').annotate(soma=Sum('total')).values('soma')
+    )
+    return Coalesce(Subquery(soma), 0)
+
+
+def consultas_do_dia(dia=None):
+    """Consultas não canceladas do dia (hoje, por padrão), lidas dos agregados"""
+    dia = dia or timezone.localdate()
+    return (
+        ConsultaAgregado.objects.filter(data=dia).exclude(status='cancelada')
+        .aggregate(soma=Coalesce(Sum('total'), 0))['soma']
+    )
+
+
+def periodo_padrao(hoje):
+    """Do primeiro dia de 11 meses atrás até o último dia do mês atual (12 meses)"""
+    meses = hoje.year * 12 + hoje.month - 1
+    ano, mes = divmod(meses - 11, 12)
+    ano_seguinte, mes_seguinte = divmod(meses + 1, 12)
+    return date(ano, mes + 1, 1), date(ano_seguinte, mes_seguinte + 1, 1) - timedelta(days=1)
@@ -0,0 +1,186 @@
+import threading
+import uuid
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.utils import timezone
+
+
+class EstatisticasCache:
+    """Contadores de acertos e falhas do cache (por processo)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+
+    def registrar(self, acertos, falhas):
+        with self._lock:
+            self.acertos += acertos
+            self.falhas += falhas
+
+    @property
+    def taxa_acerto(self):
+        total = self.acertos + self.falhas
+        return self.acertos / total if total else 0.0
+
+    def como_dict(self):
+        return {'acertos': self.acertos, 'falhas': self.falhas, 'taxa_acerto': round(self.taxa_acerto, 4)}
+
+    def zerar(self):
+        with self._lock:
+            self.acertos = 0
+            self.falhas = 0
+
+
+estatisticas = EstatisticasCache()
+
+
+def cache_agenda():
+    return caches[settings.AGENDA_CACHE_ALIAS]
+
+
+def chave_versao(medico_id, data):
+    return f'agenda:ocupacao:versao:{medico_id}:{data.isoformat()}'
+
+
+def chave_ocupacao(medico_id, data, versao):
+    return f'agenda:ocupacao:{medico_id}:{data.isoformat()}:{versao}'
+
+
+def _nova_versao():
+    return uuid.uuid4().hex
+
+
+def _chaves_versao(medico_id, inicio, fim):
+    datas = [inicio + timedelta(days=i) for i in range((fim - inicio).days + 1)]
+    return {chave_versao(medico_id, data): data for data in datas}
+
+
+def _versoes_ausentes(chaves, encontradas):
+    return {chave: _nova_versao() for chave in chaves if chave not in encontradas}
+
+
+def _chaves_periodo(medico_id, chaves, versoes):
+    """Retorna {chave da ocupação: data} para as versões atuais de cada dia"""
+    return {
+        chave_ocupacao(medico_id, data, versoes[chave]): data
+        for chave, data in chaves.items()
+    }
+
+
+def _versoes(cache, medico_id, inicio, fim):
+    """Retorna {chave da versão: versão} dos dias, criando as versões ausentes.
+
+    A versão é lida antes do banco: se uma invalidação ocorrer entre a leitura do
+    banco e a gravação no cache, os dados antigos ficam sob uma chave que não é
+    mais lida. Uma versão que expira apenas provoca uma falha no cache.
+    """
+    chaves = _chaves_versao(medico_id, inicio, fim)
+    versoes = cache.get_many(chaves)
+    ausentes = _versoes_ausentes(chaves, versoes)
+    if ausentes:
+        for chave, versao in ausentes.items():
+            cache.add(chave, versao, timeout=settings.AGENDA_CACHE_TIMEOUT)
+        # Em requisições simultâneas, prevalece a versão de quem gravou primeiro
+        versoes.update(ausentes | cache.get_many(ausentes))
+    return chaves, versoes
+
+
+async def _aversoes(cache, medico_id, inicio, fim):
+    chaves = _chaves_versao(medico_id, inicio, fim)
+    versoes = await cache.aget_many(chaves)
+    ausentes = _versoes_ausentes(chaves, versoes)
+    if ausentes:
+        for chave, versao in ausentes.items():
+            await cache.aadd(chave, versao, timeout=settings.AGENDA_CACHE_TIMEOUT)
+        versoes.update(ausentes | await cache.aget_many(ausentes))
+    return chaves, versoes
+
+
+def _separar(chaves, encontrados):
+    """Retorna (ocupação encontrada por data, datas ausentes em ordem) e registra acertos/falhas"""
+    ocupacao = {chaves[chave]: valor for chave, valor in encontrados.items()}
+    faltando = [data for data in chaves.values() if data not in ocupacao]
+    estatisticas.registrar(len(ocupacao), len(faltando))
+    return ocupacao, faltando
+
+
+def _novos(chaves, faltando, carregados):
+    novos = {data: carregados.get(data, {}) for data in faltando}
+    return novos, {chave: novos[data] for chave, data in chaves.items() if data in novos}
+
+
+def _em_transacao():
+    return connection.in_atomic_block
+
+
+def obter_ocupacao(medico_id, inicio, fim, carregar):
+    """Retorna {data: ocupação do dia (consultas e bloqueios)} de inicio a fim (inclusive), buscando no cache.
+
+    Os dias ausentes do cache são carregados com uma única chamada a carregar(medico_id,
+    primeiro, último) e gravados sob a versão lida antes da carga. Nada é gravado dentro
+    de uma transação, para que o cache só contenha dados já confirmados no banco.
+    """
+    cache = cache_agenda()
+    chaves = _chaves_periodo(medico_id, *_versoes(cache, medico_id, inicio, fim))
+    ocupacao, faltando = _separar(chaves, cache.get_many(chaves))
+
+    if faltando:
+        novos, valores = _novos(chaves, faltando, carregar(medico_id, faltando[0], faltando[-1]))
+        ocupacao.update(novos)
+        if not _em_transacao():
+            cache.set_many(valores, timeout=settings.AGENDA_CACHE_TIMEOUT)
+    return ocupacao
+
+
+async def aobter_ocupacao(medico_id, inicio, fim, carregar):
+    """Versão assíncrona de obter_ocupacao; `carregar` é uma corrotina"""
+    cache = cache_agenda()
+    chaves = _chaves_periodo(medico_id, *await _aversoes(cache, medico_id, inicio, fim))
+    ocupacao, faltando = _separar(chaves, await cache.aget_many(chaves))
+
+    if faltando:
+        novos, valores = _novos(chaves, faltando, await carregar(medico_id, faltando[0], faltando[-1]))
+        ocupacao.update(novos)
+        # A conexão do ORM vive na thread síncrona, onde a transação é verificada
+        if not await sync_to_async(_em_transacao)():
+            await cache.aset_many(valores, timeout=settings.AGENDA_CACHE_TIMEOUT)
+    return ocupacao
+
+
+def data_local(data_hora):
+    # Datetimes ingênuos são gravados pelo Django como horário local
+    return (timezone.localtime(data_hora) if timezone.is_aware(data_hora) else data_hora).date()
+
+
+def _renovar_versoes(chaves):
+    """Troca a versão dos dias após o commit; a ocupação gravada sob a versão anterior deixa de ser lida"""
+    versoes = {chave: _nova_versao() for chave in chaves}
+    transaction.on_commit(lambda: cache_agenda().set_many(versoes, timeout=settings.AGENDA_CACHE_TIMEOUT))
+
+
+def invalidar_ocupacao(pares):
+    """Invalida no cache a ocupação dos pares (medico_id, data_hora) após o commit da transação"""
+    chaves = {
+        chave_versao(medico_id, data_local(data_hora))
+        for medico_id, data_hora in pares
+        if medico_id is not None and data_hora is not None
+    }
+    if chaves:
+        _renovar_versoes(chaves)
+
+
+def invalidar_bloqueio(medico_id, inicio, fim):
+    """Invalida no cache a ocupação dos dias de um bloqueio após o commit da transação.
+
+    Bloqueios da clínica (medico_id None) atingem a agenda de todos os médicos; como
+    são raros (feriados), o cache da agenda é limpo por inteiro.
+    """
+    if medico_id is None:
+        transaction.on_commit(lambda: cache_agenda().clear())
+        return
+    _renovar_versoes(_chaves_versao(medico_id, inicio, fim))
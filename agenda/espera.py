@@ -0,0 +1,176 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time, timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Consulta, ListaEspera, Medico
+from .scheduling import (
+    DURACAO_MAXIMA_MINUTOS, MINUTOS_DIA, STATUS_OCUPADOS, horarios_indisponiveis, minutos_do_dia, ocupacao_do_banco,
+)
+
+logger = logging.getLogger(__name__)
+
+# Entradas compatíveis avaliadas por horário liberado, em ordem de chegada
+CANDIDATOS_POR_VAGA = 20
+OBSERVACAO_ENCAIXE = 'Encaixe automático da lista de espera.'
+
+
+def vaga_cancelada(antes, depois, duracao=None):
+    """(medico_id, data_hora, duracao) do horário liberado se a alteração cancelou um agendamento futuro.
+
+    `antes` e `depois` no formato (medico_id, data_hora, status) ou None, como em registrar_alteracoes.
+    """
+    if antes and depois and antes[2] == 'agendada' and depois[2] == 'cancelada' and antes[1] > timezone.now():
+        return antes[0], antes[1], duracao
+    return None
+
+
+@lru_cache(maxsize=None)
+def _executor():
+    return ThreadPoolExecutor(max_workers=settings.AGENDA_ESPERA_WORKERS, thread_name_prefix='agenda-espera')
+
+
+def _preencher_em_segundo_plano(vagas):
+    try:
+        preencher_vagas(vagas)
+    except Exception:
+        logger.exception('Falha ao encaixar pacientes da lista de espera', extra={'vagas': len(vagas)})
+    finally:
+        # Cada thread do pool abre a própria conexão com o banco
+        connection.close()
+
+
+def agendar_encaixes(vagas):
+    """Após o commit, oferece os horários liberados [(medico_id, data_hora, duracao)] à lista de espera.
+
+    O encaixe roda no pool de threads, sem atrasar quem cancelou; com
+    AGENDA_ESPERA_SINCRONA, roda na própria thread, logo após o commit.
+    """
+    vagas = [vaga for vaga in vagas if vaga]
+    if not vagas:
+        return
+
+    def enviar():
+        if settings.AGENDA_ESPERA_SINCRONA:
+            preencher_vagas(vagas)
+        else:
+            _executor().submit(_preencher_em_segundo_plano, vagas)
+
+    transaction.on_commit(enviar)
+
+
+def slots_liberados(medico, data_hora, duracao=None):
+    """Horários (aware) da grade do médico que começam em [data_hora, data_hora + duracao)"""
+    local = timezone.localtime(data_hora)
+    if not medico.trabalha_na_data(local.date()):
+        return []
+    inicio = minutos_do_dia(local)
+    fim = inicio + (duracao or medico.duracao_slot)
+    return [
+        timezone.make_aware(datetime.combine(local.date(), horario))
+        for horario in medico.grade_horarios.horarios
+        if inicio <= minutos_do_dia(horario) < fim
+    ]
+
+
+def candidatos(medico, data_hora, duracao):
+    """Entradas aguardando cuja janela comporta [data_hora, data_hora + duracao), por ordem de chegada.
+
+    Entradas do médico ou da especialidade dele sem médico definido, pelos índices parciais.
+    """
+    local = timezone.localtime(data_hora)
+    inicio = minutos_do_dia(local)
+    fim = inicio + duracao
+    # Consultas que terminam à meia-noite (ou depois) só cabem em janelas sem horário
+    hora_fim = time.max if fim >= MINUTOS_DIA else time(*divmod(fim, 60))
+    return (
+        ListaEspera.objects.filter(
+            Q(medico=medico) | Q(medico__isnull=True, especialidade_id=medico.especialidade_id),
+            status='aguardando', data_inicio__lte=local.date(), data_fim__gte=local.date(),
+        )
+        .filter(Q(hora_inicio__isnull=True) | Q(hora_inicio__lte=local.time(), hora_fim__gte=hora_fim))
+        .order_by('criada_em', 'id')
+    )
+
+
+def _pacientes_ocupados(paciente_ids, inicio, fim):
+    """Pacientes com algum agendamento ativo (com qualquer médico) sobreposto a [inicio, fim)"""
+    agendadas = Consulta.objects.filter(
+        paciente_id__in=paciente_ids,
+        status__in=STATUS_OCUPADOS,
+        data_hora__gt=inicio - timedelta(minutes=DURACAO_MAXIMA_MINUTOS),
+        data_hora__lt=fim,
+    ).values_list('paciente_id', 'data_hora', 'duracao_minutos')
+    return {paciente_id for paciente_id, data_hora, duracao in agendadas if data_hora + timedelta(minutes=duracao) > inicio}
+
+
+def _encaixar(medico, data_hora):
+    """Agenda no horário o primeiro paciente compatível da lista de espera; retorna a consulta ou None.
+
+    Com a agenda do médico travada, o horário só é usado se ainda estiver livre (demais
+    agendamentos e bloqueios) e a entrada só é atendida se ninguém a atendeu antes.
+    """
+    local = timezone.localtime(data_hora)
+    duracao = medico.duracao_slot
+    try:
+        with transaction.atomic():
+            Medico.objects.select_for_update().filter(pk=medico.pk).first()
+            indisponiveis = horarios_indisponiveis(medico, ocupacao_do_banco(medico.pk, local.date(), local.date()))
+            if local.strftime('%H:%M') in indisponiveis.get(local.date(), ()):
+                return None
+            entradas = list(candidatos(medico, data_hora, duracao)[:CANDIDATOS_POR_VAGA])
+            ocupados = _pacientes_ocupados(
+                {entrada.paciente_id for entrada in entradas}, data_hora, data_hora + timedelta(minutes=duracao),
+            )
+            for entrada in entradas:
+                if entrada.paciente_id in ocupados:
+                    continue
+                # UPDATE condicional: outra vaga da especialidade pode ter atendido a entrada
+                if not ListaEspera.objects.filter(pk=entrada.pk, status='aguardando').update(status='atendida'):
+                    continue
+                consulta = Consulta.objects.create(
+                    paciente_id=entrada.paciente_id, medico=medico, data_hora=data_hora, duracao_minutos=duracao,
+                    observacoes=OBSERVACAO_ENCAIXE,
+                )
+                ListaEspera.objects.filter(pk=entrada.pk).update(consulta=consulta)
+                logger.info(
+                    'Paciente da lista de espera encaixado',
+                    extra={'espera_id': entrada.pk, 'consulta_id': consulta.pk, 'medico_id': medico.pk},
+                )
+                return consulta
+    except IntegrityError:
+        # Outro agendamento ocupou o mesmo horário ao mesmo tempo
+        return None
+    return None
+
+
+def preencher_vaga(medico, data_hora, duracao=None):
+    """Encaixa pacientes da lista de espera nos horários futuros da grade liberados em [data_hora, data_hora + duracao)"""
+    agora = timezone.now()
+    criadas = []
+    for inicio in slots_liberados(medico, data_hora, duracao):
+        if inicio > agora:
+            consulta = _encaixar(medico, inicio)
+            if consulta:
+                criadas.append(consulta)
+    return criadas
+
+
+def preencher_vagas(vagas):
+    """Processa os horários liberados [(medico_id, data_hora, duracao)]; retorna as consultas criadas"""
+    por_medico = {}
+    for medico_id, data_hora, duracao in vagas:
+        por_medico.setdefault(medico_id, []).append((data_hora, duracao))
+    medicos = Medico.objects.in_bulk(por_medico)
+    criadas = []
+    for medico_id, liberadas in por_medico.items():
+        medico = medicos.get(medico_id)
+        if medico is not None:
+            for data_hora, duracao in sorted(liberadas, key=lambda vaga: vaga[0]):
+                criadas += preencher_vaga(medico, data_hora, duracao)
+    return criadas
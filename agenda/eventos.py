@@ -0,0 +1,166 @@
+import asyncio
+import json
+import queue
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .scheduling import STATUS_OCUPADOS
+
+OCUPADO = 'ocupado'
+LIBERADO = 'liberado'
+
+
+class BrokerMemoria:
+    """Pub/sub em memória do processo: cada evento publicado é entregue aos assinantes do canal.
+
+    Outros brokers (ex.: Redis) podem substituí-lo em AGENDA_BROKER_EVENTOS desde que
+    implementem publicar(canal, evento) e assinar(canal, callback) -> cancelar().
+    Os callbacks são chamados na thread de quem publica e não devem bloquear.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._assinantes = {}  # canal -> set(callbacks)
+
+    def publicar(self, canal, evento):
+        with self._lock:
+            assinantes = list(self._assinantes.get(canal, ()))
+        for callback in assinantes:
+            callback(evento)
+
+    def assinar(self, canal, callback):
+        with self._lock:
+            self._assinantes.setdefault(canal, set()).add(callback)
+
+        def cancelar():
+            with self._lock:
+                assinantes = self._assinantes.get(canal)
+                if assinantes is not None:
+                    assinantes.discard(callback)
+                    if not assinantes:
+                        del self._assinantes[canal]
+
+        return cancelar
+
+    def assinantes(self, canal):
+        with self._lock:
+            return len(self._assinantes.get(canal, ()))
+
+
+@lru_cache(maxsize=None)
+def broker():
+    return import_string(settings.AGENDA_BROKER_EVENTOS)()
+
+
+def canal_agenda(medico_id, data):
+    """Canal dos eventos da agenda do médico na data (date ou AAAA-MM-DD)"""
+    return f'agenda:{medico_id}:{data}'
+
+
+def _local(data_hora):
+    # Horário local sem fuso; datetimes ingênuos são gravados pelo Django como horário local
+    return timezone.localtime(data_hora).replace(tzinfo=None) if timezone.is_aware(data_hora) else data_hora
+
+
+def evento_horario(tipo, medico_id, data_hora, consulta_id):
+    local = _local(data_hora)
+    return {
+        'tipo': tipo,
+        'medico_id': medico_id,
+        'data': local.date().isoformat(),
+        'hora': local.strftime('%H:%M'),
+        'consulta_id': consulta_id,
+    }
+
+
+def formatar_sse(evento):
+    """Serializa o evento no formato text/event-stream"""
+    return f'event: {evento["tipo"]}\ndata: {json.dumps(evento)}\n\n'
+
+
+def publicar_eventos(eventos):
+    """Publica os eventos no canal (médico, data) de cada um após o commit da transação"""
+    eventos = list(eventos)
+    if not eventos:
+        return
+
+    def publicar():
+        atual = broker()
+        for evento in eventos:
+            atual.publicar(canal_agenda(evento['medico_id'], evento['data']), evento)
+
+    transaction.on_commit(publicar)
+
+
+def horario_ocupado(medico_id, data_hora, status):
+    """(medico_id, data_hora) se a consulta ocupa o horário, senão None"""
+    if medico_id is None or data_hora is None or status not in STATUS_OCUPADOS:
+        return None
+    return medico_id, data_hora
+
+
+def eventos_alteracao(consulta_id, ocupava, ocupa):
+    """Eventos de uma alteração de consulta; ocupava e ocupa vêm de horario_ocupado (antes e depois)"""
+    if ocupava and ocupa and ocupava[0] == ocupa[0] and _local(ocupava[1]) == _local(ocupa[1]):
+        return []
+    eventos = []
+    if ocupava:
+        eventos.append(evento_horario(LIBERADO, ocupava[0], ocupava[1], consulta_id))
+    if ocupa:
+        eventos.append(evento_horario(OCUPADO, ocupa[0], ocupa[1], consulta_id))
+    return eventos
+
+
+# Sugestão de intervalo (ms) para o navegador reconectar após o fim de uma conexão
+RECONEXAO_MS = 3000
+
+
+def fluxo_eventos(canal, keepalive, duracao):
+    """Gera o text/event-stream do canal em uma thread (WSGI), por no máximo `duracao` segundos"""
+    fila = queue.SimpleQueue()
+    cancelar = broker().assinar(canal, fila.put)
+    try:
+        yield f'retry: {RECONEXAO_MS}\n\n'
+        prazo = time.monotonic() + duracao
+        while (restante := prazo - time.monotonic()) > 0:
+            try:
+                evento = fila.get(timeout=min(keepalive, restante))
+            except queue.Empty:
+                yield ': keep-alive\n\n'
+                continue
+            yield formatar_sse(evento)
+    finally:
+        cancelar()
+
+
+async def afluxo_eventos(canal, keepalive, duracao):
+    """Versão assíncrona (ASGI) de fluxo_eventos; a conexão aberta não ocupa uma thread"""
+    loop = asyncio.get_running_loop()
+    fila = asyncio.Queue()
+
+    def entregar(evento):
+        # Os eventos são publicados na thread de quem salvou a consulta
+        try:
+            loop.call_soon_threadsafe(fila.put_nowait, evento)
+        except RuntimeError:
+            pass  # event loop já encerrado
+
+    cancelar = broker().assinar(canal, entregar)
+    try:
+        yield f'retry: {RECONEXAO_MS}\n\n'
+        prazo = time.monotonic() + duracao
+        while (restante := prazo - time.monotonic()) > 0:
+            try:
+                evento = await asyncio.wait_for(fila.get(), timeout=min(keepalive, restante))
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+            yield formatar_sse(evento)
+    finally:
+        cancelar()
@@ -0,0 +1,120 @@
+import csv
+from datetime import timezone as dt_timezone
+
+from django.utils import timezone
+
+# Linhas buscadas por vez do banco (cursor no servidor quando suportado)
+TAMANHO_CHUNK = 2000
+
+CABECALHO_CSV = [
+    'id', 'data', 'hora', 'status', 'paciente', 'paciente_cpf',
+    'medico', 'medico_crm', 'especialidade', 'observacoes',
+]
+
+STATUS_ICS = {
+    'agendada': 'CONFIRMED',
+    'realizada': 'CONFIRMED',
+    'cancelada': 'CANCELLED',
+}
+
+
+def consultas_para_exportar(queryset):
+    """Itera as consultas com paciente, médico e especialidade em chunks, sem carregar tudo em memória"""
+    return (
+        queryset.select_related('paciente', 'medico__especialidade')
+        .order_by('data_hora', 'id')
+        .iterator(chunk_size=TAMANHO_CHUNK)
+    )
+
+
+class Eco:
+    """Arquivo falso que devolve o que foi escrito, para usar csv.writer como gerador"""
+
+    def write(self, valor):
+        return valor
+
+
+def linhas_csv(consultas):
+    """Gera o CSV linha a linha"""
+    escritor = csv.writer(Eco())
+    yield escritor.writerow(CABECALHO_CSV)
+    for consulta in consultas:
+        local = timezone.localtime(consulta.data_hora)
+        yield escritor.writerow([
+            consulta.id,
+            local.strftime('%Y-%m-%d'),
+            local.strftime('%H:%M'),
+            consulta.status,
+            consulta.paciente.nome,
+            consulta.paciente.cpf,
+            consulta.medico.nome,
+            consulta.medico.crm,
+            consulta.medico.especialidade.nome,
+            consulta.observacoes,
+        ])
+
+
+def _escapar_ics(valor):
+    return (
+        str(valor).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+    )
+
+
+def _dobrar_linha_ics(linha):
+    """Quebra linhas com mais de 75 octetos, como exige a RFC 5545"""
+    dados = linha.encode('utf-8')
+    if len(dados) <= 75:
+        return linha + '\r\n'
+    partes, atual = [], b''
+    for caractere in linha:
+        codificado = caractere.encode('utf-8')
+        limite = 75 if not partes else 74
+        if len(atual) + len(codificado) > limite:
+            partes.append(atual.decode('utf-8'))
+            atual = b''
+        atual += codificado
+    partes.append(atual.decode('utf-8'))
+    return '\r\n '.join(partes) + '\r\n'
+
+
+def _data_ics(valor):
+    return valor.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def evento_ics(consulta, carimbo):
+    """Retorna o VEVENT de uma consulta (com paciente, médico e especialidade carregados)"""
+    linhas = [
+        'BEGIN:VEVENT',
+        f'UID:consulta-{consulta.id}@agenda',
+        f'DTSTAMP:{_data_ics(carimbo)}',
+        f'DTSTART:{_data_ics(consulta.data_hora)}',
+        f'DTEND:{_data_ics(consulta.fim)}',
+        f'SUMMARY:{_escapar_ics(f"Consulta: {consulta.paciente.nome} - {consulta.medico.nome}")}',
+        f'DESCRIPTION:{_escapar_ics(consulta.observacoes)}',
+        f'CATEGORIES:{_escapar_ics(consulta.medico.especialidade.nome)}',
+        f'STATUS:{STATUS_ICS.get(consulta.status, "CONFIRMED")}',
+        'END:VEVENT',
+    ]
+    return ''.join(_dobrar_linha_ics(linha) for linha in linhas)
+
+
+def linhas_ics(consultas, nome='Agenda Médica'):
+    """Gera o calendário iCalendar (.ics) evento a evento"""
+    carimbo = timezone.now()
+    yield ''.join(_dobrar_linha_ics(linha) for linha in [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//Agenda Médica//Consultas//PT-BR',
+        'CALSCALE:GREGORIAN',
+        f'X-WR-CALNAME:{_escapar_ics(nome)}',
+    ])
+    for consulta in consultas:
+        yield evento_ics(consulta, carimbo)
+    yield _dobrar_linha_ics('END:VCALENDAR')
+
+
+FORMATOS = {
+    'csv': (linhas_csv, 'text/csv; charset=utf-8'),
+    'ics': (linhas_ics, 'text/calendar; charset=utf-8'),
+}
@@ -1,15 +1,21 @@
 from django import forms
-from .models import Especialidade, Medico, Paciente, Consulta
+from django.urls import reverse_lazy
+from .models import Especialidade, Medico, Paciente, Consulta, SerieConsulta, BloqueioAgenda, ListaEspera
+from .widgets import AutocompleteSelect
 
 class EspecialidadeForm(forms.ModelForm):
     class Meta:
         model = Especialidade
-        fields = ['nome', 'descricao']
+        fields = ['nome', 'descricao', 'duracao_consulta']
         widgets = {
             'nome': forms.TextInput(attrs={
                 'class': 'form-control',
                 'placeholder': 'Digite o nome da especialidade'
             }),
+            'duracao_consulta': forms.NumberInput(attrs={
+                'class': 'form-control',
+                'step': 5
+            }),
             'descricao': forms.Textarea(attrs={
                 'class': 'form-control',
                 'rows': 4,
@@ -28,7 +34,10 @@ class MedicoForm(forms.ModelForm):
     
     class Meta:
         model = Medico
-        fields = ['nome', 'crm', 'especialidade', 'telefone', 'email', 'dias_trabalho', 'hora_inicio', 'hora_fim']
+        fields = [
+            'nome', 'crm', 'especialidade', 'telefone', 'email', 'dias_trabalho', 'hora_inicio', 'hora_fim',
+            'duracao_consulta',
+        ]
         widgets = {
             'nome': forms.TextInput(attrs={
                 'class': 'form-control',
@@ -56,18 +65,27 @@ class MedicoForm(forms.ModelForm):
             'hora_fim': forms.TimeInput(attrs={
                 'class': 'form-control',
                 'type': 'time'
+            }),
+            'duracao_consulta': forms.NumberInput(attrs={
+                'class': 'form-control',
+                'step': 5,
+                'placeholder': 'Da especialidade'
             })
         }
         labels = {
             'hora_inicio': 'Horário de Início',
-            'hora_fim': 'Horário de Fim'
+            'hora_fim': 'Horário de Fim',
+            'duracao_consulta': 'Duração das Consultas (min)'
         }
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         if self.instance.pk:
-            # Se estamos editando um médico existente, pré-selecionar os dias
-            self.fields['dias_trabalho'].initial = self.instance.dias_trabalho.split(',')
+            # Se estamos editando um médico existente, pré-selecionar os dias; self.initial (que traria
+            # o texto separado por vírgulas) tem precedência no formulário e em changed_data
+            self.fields['dias_trabalho'].initial = self.initial['dias_trabalho'] = [
+                dia for dia, _ in Medico.DIAS_SEMANA if self.instance.trabalha_no_dia(dia)
+            ]
     
     def save(self, commit=True):
         instance = super().save(commit=False)
@@ -126,14 +144,21 @@ class ConsultaForm(forms.ModelForm):
     
     class Meta:
         model = Consulta
-        fields = ['paciente', 'medico', 'data', 'hora', 'status', 'observacoes']
+        fields = ['paciente', 'medico', 'data', 'hora', 'duracao_minutos', 'status', 'observacoes']
         widgets = {
-            'paciente': forms.Select(attrs={
-                'class': 'form-select'
-            }),
-            'medico': forms.Select(attrs={
-                'class': 'form-select',
-                'id': 'id_medico'
+            'paciente': AutocompleteSelect(
+                url=reverse_lazy('paciente_busca_api'),
+                placeholder='Digite o nome ou CPF do paciente'
+            ),
+            'medico': AutocompleteSelect(
+                url=reverse_lazy('medico_busca_api'),
+                attrs={'id': 'id_medico'},
+                placeholder='Digite o nome ou CRM do médico'
+            ),
+            'duracao_minutos': forms.NumberInput(attrs={
+                'class': 'form-control',
+                'step': 5,
+                'placeholder': 'Padrão do médico'
             }),
             'status': forms.Select(attrs={
                 'class': 'form-select'
@@ -145,35 +170,29 @@ class ConsultaForm(forms.ModelForm):
             })
         }
     
-    def _generate_time_slots(self, hora_inicio, hora_fim):
-        """Gera slots de horário em intervalos de 45 minutos"""
-        from datetime import datetime, timedelta
-        
-        slots = []
-        if hora_inicio and hora_fim:
-            # Converter hora_inicio para datetime para facilitar cálculos
-            inicio = datetime.combine(datetime.today(), hora_inicio)
-            fim = datetime.combine(datetime.today(), hora_fim)
-            
-            # Gerar slots de 45 minutos
-            current_time = inicio
-            while current_time < fim:
-                time_str = current_time.time().strftime('%H:%M')
-                slots.append((time_str, time_str))
-                current_time += timedelta(minutes=45)
-        
-        return slots
-    
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         
+        # Carregar a especialidade junto com os médicos (usada na representação de cada opção)
+        self.fields['medico'].queryset = self.fields['medico'].queryset.select_related('especialidade')
+        
         # Configurar choices iniciais para o widget Select
         self.fields['hora'].widget.choices = [('', 'Selecione um horário')]
         
         if self.instance.pk and self.instance.data_hora:
-            # Se estamos editando uma consulta existente, separar data e hora
-            self.fields['data'].initial = self.instance.data_hora.date()
-            self.fields['hora'].initial = self.instance.data_hora.time().strftime('%H:%M')
+            # Se estamos editando uma consulta existente, separar data e hora no horário local da clínica
+            from django.utils import timezone
+            local = timezone.localtime(self.instance.data_hora)
+            self.fields['data'].initial = local.date()
+            self.fields['hora'].initial = local.strftime('%H:%M')
+        
+        # Guardar o horário inicial para que o JavaScript o selecione ao carregar os horários livres
+        if self.is_bound:
+            hora_inicial = self.data.get(self.add_prefix('hora'))
+        else:
+            hora_inicial = self.initial.get('hora') or self.fields['hora'].initial
+        if hora_inicial:
+            self.fields['hora'].widget.attrs['data-initial'] = hora_inicial
     
     def clean_hora(self):
         """Validação dinâmica do horário baseada no médico selecionado"""
@@ -186,25 +205,334 @@ class ConsultaForm(forms.ModelForm):
         if not medico:
             raise forms.ValidationError('Selecione um médico primeiro.')
         
+        # Verificar se o médico atende no dia da semana selecionado
+        data = self.cleaned_data.get('data')
+        if data and not medico.trabalha_na_data(data):
+            raise forms.ValidationError(f'O médico não atende neste dia da semana. Dias de atendimento: {medico.get_dias_trabalho_display()}.')
+        
         # Verificar se o horário está dentro dos horários disponíveis do médico
         if medico.hora_inicio and medico.hora_fim:
-            valid_slots = [slot[0] for slot in self._generate_time_slots(medico.hora_inicio, medico.hora_fim)]
-            if hora not in valid_slots:
-                raise forms.ValidationError(f'Horário inválido. Horários disponíveis: {medico.hora_inicio.strftime("%H:%M")} às {medico.hora_fim.strftime("%H:%M")} em intervalos de 45 minutos.')
+            if hora not in medico.grade_horarios.rotulos_set:
+                raise forms.ValidationError(f'Horário inválido. Horários disponíveis: {medico.hora_inicio.strftime("%H:%M")} às {medico.hora_fim.strftime("%H:%M")} em intervalos de {medico.duracao_slot} minutos.')
         
         return hora
     
+    def clean(self):
+        dados = super().clean()
+        medico, data, hora = dados.get('medico'), dados.get('data'), dados.get('hora')
+        if not (medico and data and hora) or self.has_error('hora'):
+            return dados
+        duracao = dados.get('duracao_minutos') or medico.duracao_slot
+        dados['duracao_minutos'] = duracao
+        
+        # A consulta inteira precisa caber no expediente (nunca passa da meia-noite)
+        from datetime import datetime
+        from .scheduling import termina_no_expediente
+        if not termina_no_expediente(medico, datetime.strptime(hora, '%H:%M'), duracao):
+            self.add_error(
+                'hora',
+                f'Uma consulta de {duracao} minutos neste horário termina após o fim do expediente '
+                f'({medico.hora_fim.strftime("%H:%M")}).'
+            )
+            return dados
+        
+        # Verificar bloqueios da agenda (férias, feriados, horários bloqueados) durante toda a consulta;
+        # consultas marcadas antes do bloqueio continuam editáveis enquanto não mudarem de horário
+        if not self._mantem_horario(medico, data, hora, duracao):
+            from .scheduling import bloqueios_na_data, intervalo_consulta, sobrepoe
+            inicio, fim = intervalo_consulta(datetime.strptime(hora, '%H:%M'), duracao)
+            if sobrepoe(inicio, fim, bloqueios_na_data(medico, data)):
+                self.add_error('hora', 'Horário bloqueado na agenda do médico (férias, feriado ou indisponibilidade).')
+        return dados
+    
+    def _mantem_horario(self, medico, data, hora, duracao):
+        """True se a consulta em edição continua com o mesmo médico, data, horário e duração"""
+        if not self.instance.pk or not self.instance.data_hora:
+            return False
+        from django.utils import timezone
+        data_hora = self.instance.data_hora
+        if timezone.is_aware(data_hora):
+            data_hora = timezone.localtime(data_hora)
+        return (
+            (self.instance.medico_id, data_hora.date(), data_hora.strftime('%H:%M'), self.instance.duracao_minutos)
+            == (medico.pk, data, hora, duracao)
+        )
+    
     def save(self, commit=True):
         instance = super().save(commit=False)
         # Combinar data e hora em um único campo datetime
         if self.cleaned_data.get('data') and self.cleaned_data.get('hora'):
-            from datetime import datetime, time
+            from datetime import datetime
+            from django.utils import timezone
             data = self.cleaned_data['data']
             hora_str = self.cleaned_data['hora']
             # Converter string de hora para objeto time
             hora = datetime.strptime(hora_str, '%H:%M').time()
-            instance.data_hora = datetime.combine(data, hora)
+            # Horário local da clínica, gravado com fuso (em UTC no banco)
+            instance.data_hora = timezone.make_aware(datetime.combine(data, hora))
         
         if commit:
             instance.save()
         return instance
+
+class SerieConsultaForm(forms.ModelForm):
+    """Série de consultas recorrentes: mesmo médico e horário a cada N semanas, por M ocorrências"""
+    ignorar_conflitos = forms.BooleanField(
+        required=False,
+        label='Agendar apenas as datas livres',
+        help_text='Sem esta opção, nenhuma consulta é agendada se alguma data estiver indisponível',
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
+
+    class Meta:
+        model = SerieConsulta
+        fields = ['paciente', 'medico', 'data_inicio', 'hora', 'intervalo_semanas', 'ocorrencias', 'observacoes']
+        labels = {
+            'data_inicio': 'Primeira consulta',
+            'hora': 'Horário',
+            'intervalo_semanas': 'Repetir a cada (semanas)',
+            'ocorrencias': 'Número de consultas',
+        }
+        widgets = {
+            'paciente': AutocompleteSelect(
+                url=reverse_lazy('paciente_busca_api'),
+                placeholder='Digite o nome ou CPF do paciente'
+            ),
+            'medico': AutocompleteSelect(
+                url=reverse_lazy('medico_busca_api'),
+                placeholder='Digite o nome ou CRM do médico'
+            ),
+            'data_inicio': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+            'hora': forms.TimeInput(attrs={'class': 'form-control', 'type': 'time', 'step': 60}),
+            'intervalo_semanas': forms.NumberInput(attrs={'class': 'form-control', 'min': 1, 'max': 52}),
+            'ocorrencias': forms.NumberInput(attrs={'class': 'form-control', 'min': 1, 'max': SerieConsulta.MAX_OCORRENCIAS}),
+            'observacoes': forms.Textarea(attrs={
+                'class': 'form-control',
+                'rows': 3,
+                'placeholder': 'Observações copiadas para cada consulta (opcional)'
+            })
+        }
+
+    def clean(self):
+        dados = super().clean()
+        medico, data_inicio, hora = dados.get('medico'), dados.get('data_inicio'), dados.get('hora')
+        if medico and data_inicio and not medico.trabalha_na_data(data_inicio):
+            self.add_error('data_inicio', f'O médico não atende neste dia da semana. Dias de atendimento: {medico.get_dias_trabalho_display()}.')
+        if medico and hora and hora.strftime('%H:%M') not in medico.grade_horarios.rotulos_set:
+            self.add_error('hora', f'Horário fora da grade do médico. Horários disponíveis: {", ".join(medico.grade_horarios.rotulos)}.')
+        return dados
+
+    def add_conflitos(self, conflitos):
+        """Registra as datas indisponíveis (de recorrencia.conflitos_horarios) como erros do formulário"""
+        for data, motivo in conflitos.items():
+            self.add_error(None, f'{data.strftime("%d/%m/%Y")}: {motivo}')
+
+
+class SerieAlteracaoForm(forms.Form):
+    """Novo horário e observações das ocorrências futuras de uma série"""
+    hora = forms.TimeField(
+        label='Novo horário',
+        widget=forms.TimeInput(attrs={'class': 'form-control', 'type': 'time', 'step': 60})
+    )
+    observacoes = forms.CharField(
+        label='Observações',
+        required=False,
+        widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 3})
+    )
+
+    add_conflitos = SerieConsultaForm.add_conflitos
+
+
+class BloqueioAgendaForm(forms.ModelForm):
+    """Férias, feriado ou horário bloqueado de um médico (ou de toda a clínica, sem médico)"""
+    class Meta:
+        model = BloqueioAgenda
+        fields = ['medico', 'data_inicio', 'data_fim', 'hora_inicio', 'hora_fim', 'motivo']
+        widgets = {
+            'medico': AutocompleteSelect(
+                url=reverse_lazy('medico_busca_api'),
+                placeholder='Toda a clínica'
+            ),
+            'data_inicio': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+            'data_fim': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+            'hora_inicio': forms.TimeInput(attrs={'class': 'form-control', 'type': 'time', 'step': 60}),
+            'hora_fim': forms.TimeInput(attrs={'class': 'form-control', 'type': 'time', 'step': 60}),
+            'motivo': forms.TextInput(attrs={
+                'class': 'form-control',
+                'placeholder': 'Ex.: Férias, Feriado, Congresso'
+            }),
+        }
+
+
+class ListaEsperaForm(forms.ModelForm):
+    """Paciente à espera de um horário com um médico (ou qualquer médico da especialidade) em uma janela preferida"""
+    class Meta:
+        model = ListaEspera
+        fields = ['paciente', 'especialidade', 'medico', 'data_inicio', 'data_fim', 'hora_inicio', 'hora_fim', 'observacoes']
+        widgets = {
+            'paciente': AutocompleteSelect(
+                url=reverse_lazy('paciente_busca_api'),
+                placeholder='Digite o nome ou CPF do paciente'
+            ),
+            'especialidade': forms.Select(attrs={'class': 'form-select'}),
+            'medico': AutocompleteSelect(
+                url=reverse_lazy('medico_busca_api'),
+                placeholder='Qualquer médico da especialidade'
+            ),
+            'data_inicio': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+            'data_fim': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+            'hora_inicio': forms.TimeInput(attrs={'class': 'form-control', 'type': 'time', 'step': 60}),
+            'hora_fim': forms.TimeInput(attrs={'class': 'form-control', 'type': 'time', 'step': 60}),
+            'observacoes': forms.Textarea(attrs={'class': 'form-control', 'rows': 2}),
+        }
+        labels = {
+            'hora_inicio': 'A partir das',
+            'hora_fim': 'Até as',
+        }
+
+
+class ConsultaFiltroForm(forms.Form):
+    """Filtros da lista de consultas (também usados pelas exportações)"""
+    STATUS_CHOICES = [('', 'Todos os status')] + Consulta._meta.get_field('status').choices
+    
+    status = forms.ChoiceField(
+        choices=STATUS_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    medico = forms.ModelChoiceField(
+        queryset=Medico.objects.select_related('especialidade'),
+        required=False,
+        widget=AutocompleteSelect(url=reverse_lazy('medico_busca_api'), placeholder='Todos os médicos')
+    )
+    paciente = forms.ModelChoiceField(
+        queryset=Paciente.objects.all(),
+        required=False,
+        widget=AutocompleteSelect(url=reverse_lazy('paciente_busca_api'), placeholder='Todos os pacientes')
+    )
+    especialidade = forms.ModelChoiceField(
+        queryset=Especialidade.objects.all(),
+        required=False,
+        empty_label='Todas as especialidades',
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    data_inicio = forms.DateField(
+        required=False,
+        label='De',
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'})
+    )
+    data_fim = forms.DateField(
+        required=False,
+        label='Até',
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'})
+    )
+    
+    def filtrar(self, queryset):
+        """Aplica os filtros válidos ao queryset de consultas"""
+        from datetime import timedelta
+        from .scheduling import inicio_do_dia
+        
+        if not self.is_valid():
+            return queryset
+        
+        dados = self.cleaned_data
+        if dados.get('status'):
+            queryset = queryset.filter(status=dados['status'])
+        if dados.get('medico'):
+            queryset = queryset.filter(medico=dados['medico'])
+        if dados.get('paciente'):
+            queryset = queryset.filter(paciente=dados['paciente'])
+        if dados.get('especialidade'):
+            queryset = queryset.filter(medico__especialidade=dados['especialidade'])
+        # Intervalo de datas no fuso local, como intervalo semiaberto em data_hora (usa o índice)
+        if dados.get('data_inicio'):
+            queryset = queryset.filter(data_hora__gte=inicio_do_dia(dados['data_inicio']))
+        if dados.get('data_fim'):
+            queryset = queryset.filter(data_hora__lt=inicio_do_dia(dados['data_fim'] + timedelta(days=1)))
+        return queryset
+
+
+class PainelFiltroForm(forms.Form):
+    """Período, agrupamento e filtros do painel de consultas (lido da tabela de agregados)"""
+    MAX_DIAS = 3 * 366
+
+    inicio = forms.DateField(
+        label='De',
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'})
+    )
+    fim = forms.DateField(
+        label='Até',
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'})
+    )
+    agrupamento = forms.ChoiceField(
+        choices=[('mes', 'Por mês'), ('dia', 'Por dia')],
+        initial='mes',
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    dimensao = forms.ChoiceField(
+        choices=[('medico', 'Por médico'), ('especialidade', 'Por especialidade')],
+        initial='medico',
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    especialidade = forms.ModelChoiceField(
+        queryset=Especialidade.objects.all(),
+        required=False,
+        empty_label='Todas as especialidades',
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    medico = forms.ModelChoiceField(
+        queryset=Medico.objects.select_related('especialidade'),
+        required=False,
+        widget=AutocompleteSelect(url=reverse_lazy('medico_busca_api'), placeholder='Todos os médicos')
+    )
+
+    def clean(self):
+        dados = super().clean()
+        inicio, fim = dados.get('inicio'), dados.get('fim')
+        if inicio and fim:
+            if fim < inicio:
+                raise forms.ValidationError('A data final deve ser igual ou posterior à data inicial.')
+            if (fim - inicio).days >= self.MAX_DIAS:
+                raise forms.ValidationError(f'O período máximo é de {self.MAX_DIAS} dias.')
+        dados['agrupamento'] = dados.get('agrupamento') or 'mes'
+        dados['dimensao'] = dados.get('dimensao') or 'medico'
+        return dados
+
+
+class UtilizacaoFiltroForm(forms.Form):
+    """Período e especialidade do relatório de utilização dos médicos"""
+    MAX_DIAS = 366
+
+    inicio = forms.DateField(
+        label='De',
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'})
+    )
+    fim = forms.DateField(
+        label='Até',
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'})
+    )
+    especialidade = forms.ModelChoiceField(
+        queryset=Especialidade.objects.all(),
+        required=False,
+        empty_label='Todas as especialidades',
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+
+    def clean(self):
+        dados = super().clean()
+        inicio, fim = dados.get('inicio'), dados.get('fim')
+        if inicio and fim:
+            if fim < inicio:
+                raise forms.ValidationError('A data final deve ser igual ou posterior à data inicial.')
+            if (fim - inicio).days >= self.MAX_DIAS:
+                raise forms.ValidationError(f'O período máximo é de {self.MAX_DIAS} dias.')
+        return dados
+
+    def medicos(self):
+        """Médicos do relatório (todos ou os da especialidade escolhida)"""
+        medicos = Medico.objects.all()
+        if self.cleaned_data.get('especialidade'):
+            medicos = medicos.filter(especialidade=self.cleaned_data['especialidade'])
+        return medicos
@@ -0,0 +1,212 @@
+import random
+from array import array
+from datetime import date, datetime, time, timedelta
+
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .agregados import reconstruir_agregados
+from .cache import cache_agenda
+from .importacao import em_lotes
+from .models import Consulta, Especialidade, Medico, MedicoTermo, Paciente, PacienteTermo
+
+TAMANHO_LOTE_GERACAO = 5000
+
+ESPECIALIDADES = [
+    'Cardiologia', 'Dermatologia', 'Endocrinologia', 'Gastroenterologia', 'Geriatria', 'Ginecologia',
+    'Hematologia', 'Infectologia', 'Nefrologia', 'Neurologia', 'Oftalmologia', 'Oncologia', 'Ortopedia',
+    'Otorrinolaringologia', 'Pediatria', 'Pneumologia', 'Psiquiatria', 'Reumatologia', 'Urologia',
+    'Clínica Geral', 'Alergologia', 'Angiologia', 'Cirurgia Geral', 'Mastologia', 'Nutrologia',
+]
+
+NOMES = [
+    'Ana', 'Maria', 'José', 'João', 'Antônio', 'Francisco', 'Carlos', 'Paulo', 'Pedro', 'Lucas', 'Luiz',
+    'Marcos', 'Luís', 'Gabriel', 'Rafael', 'Fernanda', 'Juliana', 'Márcia', 'Patrícia', 'Aline', 'Sandra',
+    'Camila', 'Amanda', 'Bruna', 'Letícia', 'Júlia', 'Mariana', 'Beatriz', 'Vitória', 'Larissa', 'Ângela',
+]
+SOBRENOMES = [
+    'Silva', 'Santos', 'Oliveira', 'Souza', 'Rodrigues', 'Ferreira', 'Alves', 'Pereira', 'Lima', 'Gomes',
+    'Costa', 'Ribeiro', 'Martins', 'Carvalho', 'Almeida', 'Lopes', 'Soares', 'Fernandes', 'Vieira',
+    'Barbosa', 'Rocha', 'Dias', 'Nascimento', 'Andrade', 'Moreira', 'Nunes', 'Marques', 'Machado',
+    'Mendes', 'Freitas', 'Cardoso', 'Ramos', 'Gonçalves', 'Santana', 'Teixeira', 'Simões', 'Araújo',
+]
+
+# Padrões de expediente (dias de trabalho, início, fim)
+EXPEDIENTES = [
+    ('segunda,terca,quarta,quinta,sexta', time(8, 0), time(17, 0)),
+    ('segunda,terca,quarta,quinta,sexta', time(13, 0), time(19, 0)),
+    ('segunda,quarta,sexta', time(7, 0), time(13, 0)),
+    ('terca,quinta', time(8, 0), time(18, 0)),
+    ('segunda,terca,quarta,quinta,sexta,sabado', time(9, 0), time(12, 0)),
+    ('terca,quarta,quinta,sexta,sabado', time(10, 0), time(16, 0)),
+]
+
+# Fração dos horários ocupados em cada dia de trabalho
+OCUPACAO_PADRAO = 0.75
+
+
+class GeradorDados:
+    """Gera especialidades, médicos, pacientes e consultas sintéticos com inserções em lote.
+
+    As consultas respeitam o expediente e a grade de cada médico e nunca ocupam
+    duas vezes o mesmo horário; consultas passadas ficam realizadas (ou
+    canceladas) e as futuras, agendadas.
+    """
+
+    def __init__(self, semente=None, tamanho_lote=TAMANHO_LOTE_GERACAO, ocupacao=OCUPACAO_PADRAO,
+                 inicio=None, progresso=None):
+        self.aleatorio = random.Random(semente)
+        self.tamanho_lote = tamanho_lote
+        self.ocupacao = ocupacao
+        self.hoje = timezone.localdate()
+        self.inicio = inicio or self.hoje - timedelta(days=365)
+        self.progresso = progresso or (lambda modelo, quantidade: None)
+
+    def _nome(self):
+        escolha = self.aleatorio.choice
+        return f'{escolha(NOMES)} {escolha(SOBRENOMES)} {escolha(SOBRENOMES)}'
+
+    def _inserir(self, modelo, objetos, depois=None):
+        total = 0
+        for lote in em_lotes(objetos, self.tamanho_lote):
+            with transaction.atomic():
+                modelo.objects.bulk_create(lote)
+                if depois:
+                    depois(lote)
+            total += len(lote)
+            self.progresso(modelo._meta.verbose_name_plural, total)
+        return total
+
+    def _inserir_linhas(self, modelo, campos, linhas):
+        """Insere tuplas de valores já convertidos para o banco com executemany, sem instanciar modelos"""
+        operacoes = connection.ops
+        colunas = ', '.join(operacoes.quote_name(modelo._meta.get_field(campo).column) for campo in campos)
+        sql = (
+            f'INSERT INTO {operacoes.quote_name(modelo._meta.db_table)} ({colunas}) '
+            f'VALUES ({", ".join(["%s"] * len(campos))})'
+        )
+        total = 0
+        for lote in em_lotes(linhas, self.tamanho_lote):
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(sql, lote)
+            total += len(lote)
+            self.progresso(modelo._meta.verbose_name_plural, total)
+        return total
+
+    def especialidades(self, quantidade):
+        nomes = (
+            ESPECIALIDADES[i] if i < len(ESPECIALIDADES) else f'{ESPECIALIDADES[i % len(ESPECIALIDADES)]} {i // len(ESPECIALIDADES) + 1}'
+            for i in range(quantidade)
+        )
+        return self._inserir(Especialidade, (Especialidade(nome=nome) for nome in nomes))
+
+    @staticmethod
+    def _proximo_id(modelo):
+        return (modelo.objects.aggregate(maior=Max('id'))['maior'] or 0) + 1
+
+    def medicos(self, quantidade):
+        duracoes = dict(Especialidade.objects.values_list('id', 'duracao_consulta'))
+        especialidades = list(duracoes)
+        if not especialidades:
+            raise ValueError('Gere as especialidades antes dos médicos.')
+        # CRMs com prefixo próprio para não colidir com cadastros reais
+        crm_inicial = self._proximo_id(Medico)
+
+        def construir(indice):
+            dias, inicio, fim = self.aleatorio.choice(EXPEDIENTES)
+            medico = Medico(
+                nome=f'Dr(a). {self._nome()}', crm=f'SIM{crm_inicial + indice}',
+                especialidade_id=self.aleatorio.choice(especialidades),
+                dias_trabalho=dias, hora_inicio=inicio, hora_fim=fim,
+            )
+            medico.preencher_campos_derivados(duracoes[medico.especialidade_id])
+            return medico
+
+        def indexar(lote):
+            MedicoTermo.objects.bulk_create(
+                termo for medico in lote for termo in MedicoTermo.para_medico(medico)
+            )
+
+        return self._inserir(Medico, (construir(i) for i in range(quantidade)), depois=indexar)
+
+    def pacientes(self, quantidade):
+        # CPFs a partir de 900.000.000-00, fora da faixa usada nos cadastros reais
+        cpf_inicial = 90000000000 + self._proximo_id(Paciente)
+
+        def construir(indice):
+            digitos = f'{cpf_inicial + indice:011d}'
+            paciente = Paciente(
+                nome=self._nome(),
+                cpf=f'{digitos[:3]}.{digitos[3:6]}.{digitos[6:9]}-{digitos[9:]}',
+                data_nascimento=date(1930, 1, 1) + timedelta(days=self.aleatorio.randrange(34000)),
+            )
+            paciente.preencher_campos_busca()
+            return paciente
+
+        def indexar(lote):
+            PacienteTermo.objects.bulk_create(
+                termo for paciente in lote for termo in PacienteTermo.para_paciente(paciente)
+            )
+
+        return self._inserir(Paciente, (construir(i) for i in range(quantidade)), depois=indexar)
+
+    def _status(self, data):
+        sorteio = self.aleatorio.random()
+        if data < self.hoje:
+            return 'cancelada' if sorteio < 0.1 else 'realizada'
+        return 'cancelada' if sorteio < 0.05 else 'agendada'
+
+    def _consultas_do_medico(self, medico, quantidade, pacientes):
+        """Gera `quantidade` linhas de consulta em horários livres da agenda do médico a partir de self.inicio"""
+        grade = medico.grade_horarios.horarios
+        if not grade or not medico.dias_trabalho_mascara:
+            return
+        local_tz = timezone.get_current_timezone()
+        adaptar = connection.ops.adapt_datetimefield_value
+        data, geradas = self.inicio, 0
+        while geradas < quantidade:
+            if medico.trabalha_na_data(data):
+                for slot in grade:
+                    if geradas >= quantidade:
+                        break
+                    if self.aleatorio.random() >= self.ocupacao:
+                        continue
+                    yield (
+                        pacientes[self.aleatorio.randrange(len(pacientes))],
+                        medico.id,
+                        adaptar(timezone.make_aware(datetime.combine(data, slot), local_tz)),
+                        medico.duracao_slot,
+                        self._status(data),
+                        '',
+                    )
+                    geradas += 1
+            data += timedelta(days=1)
+
+    def consultas(self, quantidade):
+        """Distribui `quantidade` consultas entre os médicos ainda sem consultas (geradas médico a médico, em lotes)"""
+        medicos = list(
+            Medico.objects.filter(consultas__isnull=True)
+            .only('id', 'dias_trabalho_mascara', 'hora_inicio', 'hora_fim', 'duracao_slot')
+            .order_by('id')
+        )
+        pacientes = array('q', Paciente.objects.values_list('id', flat=True).order_by('id').iterator(chunk_size=10000))
+        if not medicos or not pacientes:
+            raise ValueError('As consultas precisam de pacientes e de médicos ainda sem consultas.')
+
+        por_medico, resto = divmod(quantidade, len(medicos))
+
+        def todas():
+            for indice, medico in enumerate(medicos):
+                yield from self._consultas_do_medico(medico, por_medico + (indice < resto), pacientes)
+
+        total = self._inserir_linhas(
+            Consulta, ('paciente', 'medico', 'data_hora', 'duracao_minutos', 'status', 'observacoes'), todas(),
+        )
+        # A inserção em lote não dispara sinais: avançar os marcadores das agendas, descartar o
+        # cache de ocupação e recalcular os agregados dos médicos gerados
+        medico_ids = [medico.id for medico in medicos]
+        Medico.marcar_agenda_alterada(medico_ids)
+        cache_agenda().clear()
+        reconstruir_agregados(medico_ids)
+        return total
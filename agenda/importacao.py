@@ -0,0 +1,374 @@
+import csv
+import json
+import time
+from bisect import bisect_right, insort
+from datetime import datetime, timedelta
+from functools import reduce
+from itertools import islice
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Consulta, Especialidade, Medico, MedicoTermo, Paciente, PacienteTermo
+from .scheduling import DIAS_SEMANA_INDICE, DURACAO_MAXIMA_MINUTOS, DURACAO_SLOT_MINUTOS, termina_no_expediente
+from .services import registrar_alteracoes
+
+TAMANHO_LOTE_PADRAO = 1000
+# Janelas de conflito por consulta ao banco (3 parâmetros cada, abaixo do limite de 999 do SQLite)
+JANELAS_POR_CONSULTA = 300
+
+FORMATOS_DATA = ['%Y-%m-%d', '%d/%m/%Y']
+FORMATOS_DATA_HORA = ['%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%d/%m/%Y %H:%M']
+
+
+def ler_linhas(arquivo, formato):
+    """Gera (número da linha, dicionário) a partir de um arquivo CSV ou JSONL, sem carregá-lo inteiro"""
+    if formato == 'csv':
+        leitor = csv.DictReader(arquivo)
+        for numero, linha in enumerate(leitor, start=2):
+            yield numero, {chave.strip(): (valor or '').strip() for chave, valor in linha.items() if chave}
+    else:
+        for numero, texto in enumerate(arquivo, start=1):
+            if texto.strip():
+                try:
+                    yield numero, json.loads(texto)
+                except json.JSONDecodeError as exc:
+                    yield numero, {'__erro__': f'JSON inválido: {exc}'}
+
+
+def em_lotes(iteravel, tamanho):
+    iterador = iter(iteravel)
+    while True:
+        lote = list(islice(iterador, tamanho))
+        if not lote:
+            return
+        yield lote
+
+
+def _converter(valor, formatos):
+    valor = str(valor or '').strip()
+    for formato in formatos:
+        try:
+            return datetime.strptime(valor, formato)
+        except ValueError:
+            continue
+    raise ValidationError(f'Valor "{valor}" fora dos formatos aceitos.')
+
+
+def _mensagens(erro):
+    if hasattr(erro, 'message_dict'):
+        return [f'{campo}: {mensagem}' for campo, mensagens in erro.message_dict.items() for mensagem in mensagens]
+    return list(erro.messages)
+
+
+class Importador:
+    """Valida e insere um lote de linhas de um modelo.
+
+    Cada lote é validado com um número fixo de consultas (buscas por __in), e os
+    registros válidos são inseridos com bulk_create. Como os lotes anteriores já
+    estão no banco quando o próximo é validado, duplicidades entre lotes também são
+    detectadas sem manter em memória as chaves do arquivo inteiro.
+    """
+    modelo = None
+
+    def validar_lote(self, linhas):
+        """Retorna (objetos válidos, [(número, dados, erros)])"""
+        raise NotImplementedError
+
+    def inserir(self, objetos):
+        self.modelo.objects.bulk_create(objetos)
+
+    def _construir(self, numero, dados, construtor, rejeitados, exclude=()):
+        if '__erro__' in dados:
+            rejeitados.append((numero, dados, [dados['__erro__']]))
+            return None
+        try:
+            objeto = construtor(dados)
+            objeto.full_clean(exclude=list(exclude), validate_unique=False, validate_constraints=False)
+        except ValidationError as erro:
+            rejeitados.append((numero, dados, _mensagens(erro)))
+            return None
+        except (KeyError, TypeError, ValueError) as erro:
+            rejeitados.append((numero, dados, [f'Valor inválido: {erro}']))
+            return None
+        return objeto
+
+
+class ImportadorEspecialidade(Importador):
+    modelo = Especialidade
+
+    def validar_lote(self, linhas):
+        rejeitados, candidatos = [], []
+        for numero, dados in linhas:
+            objeto = self._construir(numero, dados, lambda d: Especialidade(
+                nome=d['nome'], descricao=d.get('descricao', ''),
+                duracao_consulta=d.get('duracao_consulta') or DURACAO_SLOT_MINUTOS,
+            ), rejeitados)
+            if objeto:
+                candidatos.append((numero, dados, objeto))
+
+        existentes = set(Especialidade.objects.filter(
+            nome__in=[objeto.nome for _, _, objeto in candidatos]
+        ).values_list('nome', flat=True))
+        validos = []
+        for numero, dados, objeto in candidatos:
+            if objeto.nome in existentes:
+                rejeitados.append((numero, dados, [f'Especialidade "{objeto.nome}" já cadastrada.']))
+            else:
+                existentes.add(objeto.nome)
+                validos.append(objeto)
+        return validos, rejeitados
+
+
+class ImportadorMedico(Importador):
+    modelo = Medico
+
+    def __init__(self):
+        # Poucas especialidades: carregadas uma única vez (por nome e por id), com a duração das consultas
+        self.especialidades = {}
+        self.duracoes = {}
+        for pk, nome, duracao in Especialidade.objects.values_list('id', 'nome', 'duracao_consulta'):
+            self.especialidades[str(pk)] = pk
+            self.especialidades.setdefault(nome, pk)
+            self.duracoes[pk] = duracao
+
+    def _novo(self, dados):
+        especialidade = self.especialidades.get(str(dados.get('especialidade', '')).strip())
+        if especialidade is None:
+            raise ValidationError({'especialidade': f'Especialidade "{dados.get("especialidade")}" não encontrada.'})
+        dias = dados.get('dias_trabalho') or 'segunda,terca,quarta,quinta,sexta'
+        if isinstance(dias, list):
+            dias = ','.join(dias)
+        dias_invalidos = [dia for dia in dias.split(',') if dia.strip() not in DIAS_SEMANA_INDICE]
+        if dias_invalidos:
+            raise ValidationError({'dias_trabalho': f'Dias inválidos: {", ".join(dias_invalidos)}.'})
+        medico = Medico(
+            nome=dados['nome'], crm=str(dados['crm']).strip(), especialidade_id=especialidade,
+            telefone=dados.get('telefone', ''), email=dados.get('email', ''),
+            dias_trabalho=','.join(dia.strip() for dia in dias.split(',')),
+            hora_inicio=dados.get('hora_inicio') or '09:00', hora_fim=dados.get('hora_fim') or '18:00',
+            duracao_consulta=dados.get('duracao_consulta') or None,
+        )
+        medico.preencher_campos_derivados(self.duracoes[especialidade])
+        return medico
+
+    def validar_lote(self, linhas):
+        rejeitados, candidatos = [], []
+        for numero, dados in linhas:
+            objeto = self._construir(numero, dados, self._novo, rejeitados, exclude=['especialidade'])
+            if objeto:
+                candidatos.append((numero, dados, objeto))
+
+        existentes = set(Medico.objects.filter(
+            crm__in=[objeto.crm for _, _, objeto in candidatos]
+        ).values_list('crm', flat=True))
+        validos = []
+        for numero, dados, objeto in candidatos:
+            if objeto.crm in existentes:
+                rejeitados.append((numero, dados, [f'CRM {objeto.crm} já cadastrado.']))
+            else:
+                existentes.add(objeto.crm)
+                validos.append(objeto)
+        return validos, rejeitados
+
+    def inserir(self, objetos):
+        Medico.objects.bulk_create(objetos)
+        MedicoTermo.objects.bulk_create(
+            termo for medico in objetos for termo in MedicoTermo.para_medico(medico)
+        )
+
+
+class ImportadorPaciente(Importador):
+    modelo = Paciente
+
+    def _novo(self, dados):
+        paciente = Paciente(
+            nome=dados['nome'], cpf=str(dados['cpf']).strip(),
+            data_nascimento=_converter(dados['data_nascimento'], FORMATOS_DATA).date(),
+            telefone=dados.get('telefone', ''), email=dados.get('email', ''),
+        )
+        paciente.preencher_campos_busca()
+        return paciente
+
+    def validar_lote(self, linhas):
+        rejeitados, candidatos = [], []
+        for numero, dados in linhas:
+            objeto = self._construir(numero, dados, self._novo, rejeitados)
+            if objeto:
+                candidatos.append((numero, dados, objeto))
+
+        # CPF é único tanto no formato digitado quanto nos dígitos
+        cpfs = [objeto.cpf for _, _, objeto in candidatos]
+        digitos = [objeto.cpf_digitos for _, _, objeto in candidatos]
+        existentes = set()
+        for cpf, cpf_digitos in Paciente.objects.filter(cpf__in=cpfs).values_list('cpf', 'cpf_digitos'):
+            existentes.update((cpf, cpf_digitos))
+        existentes.update(Paciente.objects.filter(cpf_digitos__in=digitos).values_list('cpf_digitos', flat=True))
+
+        validos = []
+        for numero, dados, objeto in candidatos:
+            if objeto.cpf in existentes or objeto.cpf_digitos in existentes:
+                rejeitados.append((numero, dados, [f'CPF {objeto.cpf} já cadastrado.']))
+            else:
+                existentes.update((objeto.cpf, objeto.cpf_digitos))
+                validos.append(objeto)
+        return validos, rejeitados
+
+    def inserir(self, objetos):
+        Paciente.objects.bulk_create(objetos)
+        PacienteTermo.objects.bulk_create(
+            termo for paciente in objetos for termo in PacienteTermo.para_paciente(paciente)
+        )
+
+
+class ImportadorConsulta(Importador):
+    modelo = Consulta
+    STATUS_VALIDOS = {valor for valor, _ in Consulta._meta.get_field('status').choices}
+
+    def _novo(self, dados):
+        data_hora = timezone.make_aware(_converter(dados['data_hora'], FORMATOS_DATA_HORA))
+        return Consulta(
+            data_hora=data_hora,
+            duracao_minutos=dados.get('duracao_minutos') or None,
+            status=dados.get('status') or 'agendada',
+            observacoes=dados.get('observacoes', ''),
+        )
+
+    def inserir(self, objetos):
+        super().inserir(objetos)
+        # bulk_create não dispara os sinais de post_save
+        registrar_alteracoes(
+            (objeto.pk, None, (objeto.medico_id, objeto.data_hora, objeto.status), objeto.duracao_minutos)
+            for objeto in objetos
+        )
+
+    def validar_lote(self, linhas):
+        rejeitados, candidatos = [], []
+        for numero, dados in linhas:
+            objeto = self._construir(numero, dados, self._novo, rejeitados, exclude=['paciente', 'medico'])
+            if objeto:
+                candidatos.append((numero, dados, objeto))
+
+        # Resolver pacientes (por CPF) e médicos (por CRM) do lote com uma consulta cada
+        cpfs = {str(dados.get('paciente_cpf', '')).strip() for _, dados, _ in candidatos}
+        crms = {str(dados.get('medico_crm', '')).strip() for _, dados, _ in candidatos}
+        pacientes = dict(Paciente.objects.filter(cpf__in=cpfs).values_list('cpf', 'id'))
+        medicos = {medico.crm: medico for medico in Medico.objects.filter(crm__in=crms)}
+
+        resolvidos = []
+        for numero, dados, objeto in candidatos:
+            paciente_id = pacientes.get(str(dados.get('paciente_cpf', '')).strip())
+            medico = medicos.get(str(dados.get('medico_crm', '')).strip())
+            erros = []
+            if paciente_id is None:
+                erros.append(f'Paciente com CPF "{dados.get("paciente_cpf")}" não encontrado.')
+            if medico is None:
+                erros.append(f'Médico com CRM "{dados.get("medico_crm")}" não encontrado.')
+            elif objeto.status != 'cancelada':
+                local = timezone.localtime(objeto.data_hora)
+                if not medico.trabalha_na_data(local.date()):
+                    erros.append('O médico não atende neste dia da semana.')
+                elif local.strftime('%H:%M') not in medico.grade_horarios.rotulos_set or local.second:
+                    erros.append('Horário fora da grade de atendimento do médico.')
+                elif not termina_no_expediente(medico, local, objeto.duracao_minutos or medico.duracao_slot):
+                    erros.append('A consulta termina após o fim do expediente do médico.')
+            if erros:
+                rejeitados.append((numero, dados, erros))
+                continue
+            objeto.paciente_id = paciente_id
+            objeto.medico = medico
+            objeto.duracao_minutos = objeto.duracao_minutos or medico.duracao_slot
+            resolvidos.append((numero, dados, objeto))
+
+        # Conflitos com agendamentos ativos já existentes e dentro do próprio lote. Cada consulta do
+        # lote gera uma janela (começa até DURACAO_MAXIMA_MINUTOS antes dela e antes do fim dela);
+        # janelas do mesmo médico que se encostam são unidas, para que um lote fora de ordem
+        # cronológica não leia todos os agendamentos entre a primeira e a última data dele
+        margem = timedelta(minutes=DURACAO_MAXIMA_MINUTOS)
+        janelas = []
+        ativos = sorted(
+            (objeto for _, _, objeto in resolvidos if objeto.status != 'cancelada'),
+            key=lambda objeto: (objeto.medico_id, objeto.data_hora),
+        )
+        for objeto in ativos:
+            inicio, fim = objeto.data_hora - margem, objeto.data_hora + timedelta(minutes=objeto.duracao_minutos)
+            if janelas and janelas[-1][0] == objeto.medico_id and inicio <= janelas[-1][2]:
+                janelas[-1][2] = max(janelas[-1][2], fim)
+            else:
+                janelas.append([objeto.medico_id, inicio, fim])
+        ocupados = {}
+        for janelas_lote in em_lotes(janelas, JANELAS_POR_CONSULTA):
+            existentes = Consulta.objects.filter(reduce(or_, (
+                Q(medico_id=medico_id, data_hora__gt=inicio, data_hora__lt=fim)
+                for medico_id, inicio, fim in janelas_lote
+            ))).exclude(status='cancelada').values_list('medico_id', 'data_hora', 'duracao_minutos')
+            for medico_id, data_hora, duracao in existentes:
+                ocupados.setdefault(medico_id, []).append((data_hora, data_hora + timedelta(minutes=duracao)))
+        for intervalos in ocupados.values():
+            intervalos.sort()
+
+        validos = []
+        for numero, dados, objeto in resolvidos:
+            if objeto.status != 'cancelada':
+                inicio, fim = objeto.data_hora, objeto.data_hora + timedelta(minutes=objeto.duracao_minutos)
+                intervalos = ocupados.setdefault(objeto.medico_id, [])
+                # Só os intervalos que começam até DURACAO_MAXIMA_MINUTOS antes podem alcançar o início
+                indice = bisect_right(intervalos, (inicio - timedelta(minutes=DURACAO_MAXIMA_MINUTOS),))
+                while indice < len(intervalos) and intervalos[indice][0] < fim and intervalos[indice][1] <= inicio:
+                    indice += 1
+                if indice < len(intervalos) and intervalos[indice][0] < fim:
+                    rejeitados.append((numero, dados, ['Horário já ocupado para este médico.']))
+                    continue
+                insort(intervalos, (inicio, fim))
+            validos.append(objeto)
+        return validos, rejeitados
+
+
+IMPORTADORES = {
+    'especialidade': ImportadorEspecialidade,
+    'medico': ImportadorMedico,
+    'paciente': ImportadorPaciente,
+    'consulta': ImportadorConsulta,
+}
+
+
+class ResultadoImportacao:
+    def __init__(self):
+        self.lidas = 0
+        self.importadas = 0
+        self.rejeitadas = 0
+        self.inicio = time.perf_counter()
+
+    @property
+    def segundos(self):
+        return max(time.perf_counter() - self.inicio, 1e-9)
+
+    @property
+    def linhas_por_segundo(self):
+        return self.lidas / self.segundos
+
+
+def importar(modelo, linhas, tamanho_lote=TAMANHO_LOTE_PADRAO, rejeitar=None, progresso=None):
+    """Importa as linhas (iterável de (número, dados)) em lotes.
+
+    `rejeitar(numero, dados, erros)` é chamado para cada linha rejeitada e
+    `progresso(resultado)` ao fim de cada lote.
+    """
+    importador = IMPORTADORES[modelo]()
+    resultado = ResultadoImportacao()
+    for lote in em_lotes(linhas, tamanho_lote):
+        validos, rejeitados = importador.validar_lote(lote)
+        with transaction.atomic():
+            importador.inserir(validos)
+        resultado.lidas += len(lote)
+        resultado.importadas += len(validos)
+        resultado.rejeitadas += len(rejeitados)
+        if rejeitar:
+            for numero, dados, erros in rejeitados:
+                rejeitar(numero, dados, erros)
+        if progresso:
+            progresso(resultado)
+    return resultado
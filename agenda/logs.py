@@ -0,0 +1,61 @@
+import atexit
+import copy
+import json
+import logging
+import queue
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Atributos padrão de LogRecord; os demais vieram de `extra` e entram no registro estruturado
+ATRIBUTOS_PADRAO = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class FormatadorJSON(logging.Formatter):
+    """Formata cada registro como uma linha JSON, incluindo os campos passados em `extra`"""
+
+    def format(self, record):
+        dados = {
+            'momento': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'mensagem': record.getMessage(),
+        }
+        dados.update({chave: valor for chave, valor in vars(record).items() if chave not in ATRIBUTOS_PADRAO})
+        if record.exc_text:
+            dados['excecao'] = record.exc_text
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+
+class HandlerFila(QueueHandler):
+    """Handler que apenas enfileira o registro; a formatação e a escrita ocorrem em outra thread.
+
+    As threads das requisições nunca esperam por I/O de log: o QueueListener
+    interno grava os registros no `stream` (stderr por padrão) como JSON.
+    """
+
+    def __init__(self, stream=None, formatador=None):
+        super().__init__(queue.SimpleQueue())
+        destino = logging.StreamHandler(stream or sys.stderr)
+        destino.setFormatter(formatador or FormatadorJSON())
+        self.listener = QueueListener(self.queue, destino, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.parar)
+
+    def prepare(self, record):
+        # Resolver a mensagem aqui (os argumentos podem mudar depois), mas deixar o JSON para o listener
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def parar(self):
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+    def close(self):
+        self.parar()
+        super().close()
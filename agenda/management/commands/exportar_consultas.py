@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from agenda.exportacao import FORMATOS, consultas_para_exportar
+from agenda.forms import ConsultaFiltroForm
+from agenda.models import Consulta
+
+
+class Command(BaseCommand):
+    help = (
+        'Exporta consultas em CSV ou iCalendar (.ics), filtrando por médico, especialidade, '
+        'status ou datas. As linhas são lidas do banco em chunks e gravadas à medida que chegam.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--formato', choices=sorted(FORMATOS), default='csv')
+        parser.add_argument('--saida', help='Arquivo de saída (padrão: saída padrão)')
+        parser.add_argument('--medico', type=int, help='ID do médico')
+        parser.add_argument('--especialidade', type=int, help='ID da especialidade')
+        parser.add_argument('--paciente', type=int, help='ID do paciente')
+        parser.add_argument('--status', choices=[valor for valor, _ in Consulta._meta.get_field('status').choices])
+        parser.add_argument('--data-inicio', help='AAAA-MM-DD')
+        parser.add_argument('--data-fim', help='AAAA-MM-DD')
+
+    def handle(self, *args, **options):
+        filtros = {
+            campo: options[campo]
+            for campo in ('medico', 'especialidade', 'paciente', 'status', 'data_inicio', 'data_fim')
+            if options[campo] is not None
+        }
+        filtro_form = ConsultaFiltroForm(filtros)
+        if not filtro_form.is_valid():
+            erros = '; '.join(f'{campo}: {" ".join(mensagens)}' for campo, mensagens in filtro_form.errors.items())
+            raise CommandError(f'Filtros inválidos: {erros}')
+
+        gerar_linhas, _ = FORMATOS[options['formato']]
+        consultas = consultas_para_exportar(filtro_form.filtrar(Consulta.objects.all()))
+
+        if options['saida']:
+            with open(options['saida'], 'w', encoding='utf-8', newline='') as saida:
+                saida.writelines(gerar_linhas(consultas))
+            self.stderr.write(self.style.SUCCESS(f'Exportação gravada em {options["saida"]}.'))
+        else:
+            for linha in gerar_linhas(consultas):
+                self.stdout.write(linha, ending='')
@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from agenda.geracao import OCUPACAO_PADRAO, TAMANHO_LOTE_GERACAO, GeradorDados
+
+
+class Command(BaseCommand):
+    help = (
+        'Gera dados sintéticos (especialidades, médicos, pacientes e consultas) com inserções em lote, '
+        'para testes de carga e benchmarks. Ex.: --especialidades 50 --medicos 2000 --pacientes 500000 '
+        '--consultas 10000000'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--especialidades', type=int, default=0)
+        parser.add_argument('--medicos', type=int, default=0)
+        parser.add_argument('--pacientes', type=int, default=0)
+        parser.add_argument('--consultas', type=int, default=0,
+                            help='Distribuídas entre os médicos que ainda não têm consultas')
+        parser.add_argument('--lote', type=int, default=TAMANHO_LOTE_GERACAO, help='Registros por lote')
+        parser.add_argument('--ocupacao', type=float, default=OCUPACAO_PADRAO,
+                            help='Fração dos horários de cada dia de trabalho ocupados (0 a 1)')
+        parser.add_argument('--semente', type=int, help='Semente do gerador aleatório, para datasets reproduzíveis')
+
+    def handle(self, *args, **options):
+        if options['lote'] < 1:
+            raise CommandError('O tamanho do lote deve ser positivo.')
+        if not 0 < options['ocupacao'] <= 1:
+            raise CommandError('A ocupação deve estar entre 0 (exclusive) e 1.')
+
+        def progresso(modelo, quantidade):
+            if options['verbosity'] >= 2:
+                self.stdout.write(f'{quantidade} {modelo} inseridos')
+
+        gerador = GeradorDados(
+            semente=options['semente'], tamanho_lote=options['lote'],
+            ocupacao=options['ocupacao'], progresso=progresso,
+        )
+        etapas = [
+            ('especialidades', gerador.especialidades),
+            ('medicos', gerador.medicos),
+            ('pacientes', gerador.pacientes),
+            ('consultas', gerador.consultas),
+        ]
+        for nome, gerar in etapas:
+            if options[nome] <= 0:
+                continue
+            inicio = time.perf_counter()
+            try:
+                total = gerar(options[nome])
+            except ValueError as exc:
+                raise CommandError(str(exc)) from exc
+            segundos = max(time.perf_counter() - inicio, 1e-9)
+            self.stdout.write(self.style.SUCCESS(
+                f'{nome}: {total} registros gerados em {segundos:.1f}s ({total / segundos:.0f} registros/s).'
+            ))
@@ -0,0 +1,57 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from agenda.importacao import IMPORTADORES, TAMANHO_LOTE_PADRAO, importar, ler_linhas
+
+
+class Command(BaseCommand):
+    help = (
+        'Importa especialidades, médicos, pacientes ou consultas de arquivos CSV ou JSONL, '
+        'validando e inserindo em lotes. Linhas rejeitadas são gravadas em um arquivo à parte.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('modelo', choices=sorted(IMPORTADORES))
+        parser.add_argument('arquivo')
+        parser.add_argument('--formato', choices=['csv', 'jsonl'], help='Padrão: deduzido da extensão do arquivo')
+        parser.add_argument('--lote', type=int, default=TAMANHO_LOTE_PADRAO, help='Linhas por lote')
+        parser.add_argument('--rejeitados', help='Arquivo JSONL das linhas rejeitadas (padrão: <arquivo>.rejeitados.jsonl)')
+
+    def handle(self, *args, **options):
+        caminho = Path(options['arquivo'])
+        if not caminho.exists():
+            raise CommandError(f'Arquivo não encontrado: {caminho}')
+        if options['lote'] < 1:
+            raise CommandError('O tamanho do lote deve ser positivo.')
+
+        formato = options['formato'] or ('jsonl' if caminho.suffix.lower() in ('.jsonl', '.json') else 'csv')
+        caminho_rejeitados = Path(options['rejeitados'] or f'{caminho}.rejeitados.jsonl')
+
+        with caminho.open(newline='', encoding='utf-8') as arquivo, \
+                caminho_rejeitados.open('w', encoding='utf-8') as rejeitados:
+
+            def rejeitar(numero, dados, erros):
+                rejeitados.write(json.dumps({'linha': numero, 'erros': erros, 'dados': dados}, ensure_ascii=False) + '\n')
+
+            def progresso(resultado):
+                if options['verbosity'] >= 2:
+                    self.stdout.write(
+                        f'{resultado.lidas} linhas lidas, {resultado.importadas} importadas '
+                        f'({resultado.linhas_por_segundo:.0f} linhas/s)'
+                    )
+
+            resultado = importar(
+                options['modelo'], ler_linhas(arquivo, formato),
+                tamanho_lote=options['lote'], rejeitar=rejeitar, progresso=progresso,
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{resultado.importadas} de {resultado.lidas} linhas importadas em {resultado.segundos:.1f}s '
+            f'({resultado.linhas_por_segundo:.0f} linhas/s).'
+        ))
+        if resultado.rejeitadas:
+            self.stdout.write(self.style.WARNING(
+                f'{resultado.rejeitadas} linhas rejeitadas gravadas em {caminho_rejeitados}.'
+            ))
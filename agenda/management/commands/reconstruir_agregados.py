@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from agenda.agregados import reconstruir_agregados
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula a tabela de agregados de consultas (dia, médico, status) a partir das consultas. '
+        'Use após alterações feitas fora do ORM ou para conferir os totais mantidos incrementalmente.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--medico', type=int, action='append', dest='medicos',
+                            help='Recalcula apenas os agregados deste médico (pode ser repetido)')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        total = reconstruir_agregados(options['medicos'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} agregados gerados em {time.perf_counter() - inicio:.1f}s.'
+        ))
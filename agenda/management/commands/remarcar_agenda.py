@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from agenda.models import Medico
+from agenda.remarcacao import aplicar_remarcacao, propor_remarcacao
+
+
+class Command(BaseCommand):
+    help = (
+        'Remarca (ou cancela) as consultas futuras que ficaram fora do expediente atual do médico. '
+        'Sem --aplicar, apenas lista as propostas (dry-run).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('medico', type=int, help='Id do médico')
+        parser.add_argument('--aplicar', action='store_true', help='Grava as remarcações em uma única transação')
+        parser.add_argument('--cancelar-todas', action='store_true',
+                            help='Cancela as consultas afetadas em vez de remarcá-las')
+
+    def handle(self, *args, **options):
+        try:
+            medico = Medico.objects.get(pk=options['medico'])
+        except Medico.DoesNotExist:
+            raise CommandError(f'Médico {options["medico"]} não encontrado.')
+
+        inicio = time.perf_counter()
+        if options['aplicar']:
+            remarcadas, canceladas = aplicar_remarcacao(medico, cancelar_todas=options['cancelar_todas'])
+            self.stdout.write(self.style.SUCCESS(
+                f'{len(remarcadas)} consultas remarcadas e {len(canceladas)} canceladas '
+                f'em {time.perf_counter() - inicio:.1f}s.'
+            ))
+            return
+
+        propostas = propor_remarcacao(medico)
+        for consulta, nova_data_hora in propostas:
+            atual = timezone.localtime(consulta.data_hora).strftime('%d/%m/%Y %H:%M')
+            if nova_data_hora is None or options['cancelar_todas']:
+                destino = 'cancelar'
+            else:
+                destino = timezone.localtime(nova_data_hora).strftime('%d/%m/%Y %H:%M')
+            self.stdout.write(f'{consulta.pk}\t{consulta.paciente.nome}\t{atual} -> {destino}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(propostas)} consultas afetadas (dry-run, nada foi gravado) em {time.perf_counter() - inicio:.1f}s.'
+        ))
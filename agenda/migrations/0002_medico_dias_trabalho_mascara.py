@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:36
+
+from django.db import migrations, models
+
+DIAS_SEMANA_INDICE = {
+    'segunda': 0,
+    'terca': 1,
+    'quarta': 2,
+    'quinta': 3,
+    'sexta': 4,
+    'sabado': 5,
+    'domingo': 6,
+}
+
+
+def preencher_mascara(apps, schema_editor):
+    Medico = apps.get_model('agenda', 'Medico')
+    medicos = list(Medico.objects.only('id', 'dias_trabalho'))
+    for medico in medicos:
+        mascara = 0
+        for dia in medico.dias_trabalho.split(','):
+            indice = DIAS_SEMANA_INDICE.get(dia.strip())
+            if indice is not None:
+                mascara |= 1 << indice
+        medico.dias_trabalho_mascara = mascara
+    Medico.objects.bulk_update(medicos, ['dias_trabalho_mascara'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agenda', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medico',
+            name='dias_trabalho_mascara',
+            field=models.PositiveSmallIntegerField(default=31, editable=False, help_text='Dias de trabalho como máscara de bits (calculado a partir de dias_trabalho)'),
+        ),
+        migrations.RunPython(preencher_mascara, migrations.RunPython.noop),
+    ]
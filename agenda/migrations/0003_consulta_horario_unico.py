@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:37
+
+from django.db import migrations, models
+
+
+def cancelar_agendamentos_duplicados(apps, schema_editor):
+    # Mantém o agendamento mais antigo de cada médico/horário e cancela os demais,
+    # para que a restrição única possa ser criada sobre dados existentes
+    Consulta = apps.get_model('agenda', 'Consulta')
+    duplicados = (
+        Consulta.objects.exclude(status='cancelada')
+        .values('medico_id', 'data_hora')
+        .annotate(total=models.Count('id'), primeiro=models.Min('id'))
+        .filter(total__gt=1)
+    )
+    for grupo in duplicados:
+        (
+            Consulta.objects.exclude(status='cancelada')
+            .filter(medico_id=grupo['medico_id'], data_hora=grupo['data_hora'])
+            .exclude(id=grupo['primeiro'])
+            .update(status='cancelada')
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agenda', '0002_medico_dias_trabalho_mascara'),
+    ]
+
+    operations = [
+        migrations.RunPython(cancelar_agendamentos_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='consulta',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'cancelada'), _negated=True), fields=('medico', 'data_hora'), name='consulta_horario_unico_por_medico', violation_error_message='Este horário já está ocupado para o médico selecionado.'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from agenda.search import normalizar_texto, somente_digitos, termos_busca
+
+
+def preencher_campos_busca(apps, schema_editor):
+    Medico = apps.get_model('agenda', 'Medico')
+    Paciente = apps.get_model('agenda', 'Paciente')
+    PacienteTermo = apps.get_model('agenda', 'PacienteTermo')
+
+    medicos = list(Medico.objects.only('id', 'nome'))
+    for medico in medicos:
+        medico.nome_busca = normalizar_texto(medico.nome)
+    Medico.objects.bulk_update(medicos, ['nome_busca'], batch_size=500)
+
+    pacientes = Paciente.objects.only('id', 'nome', 'cpf').order_by('id')
+    lote = []
+    for paciente in pacientes.iterator(chunk_size=2000):
+        paciente.cpf_digitos = somente_digitos(paciente.cpf)
+        paciente.nome_busca = normalizar_texto(paciente.nome)
+        lote.append(paciente)
+        if len(lote) >= 2000:
+            _salvar_lote(Paciente, PacienteTermo, lote)
+            lote = []
+    _salvar_lote(Paciente, PacienteTermo, lote)
+
+
+def _salvar_lote(Paciente, PacienteTermo, pacientes):
+    Paciente.objects.bulk_update(pacientes, ['cpf_digitos', 'nome_busca'])
+    PacienteTermo.objects.bulk_create(
+        PacienteTermo(paciente_id=paciente.id, termo=termo)
+        for paciente in pacientes
+        for termo in termos_busca(paciente.nome)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agenda', '0004_consulta_indices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medico',
+            name='nome_busca',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='paciente',
+            name='cpf_digitos',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=14),
+        ),
+        migrations.AddField(
+            model_name='paciente',
+            name='nome_busca',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=100),
+        ),
+        migrations.CreateModel(
+            name='PacienteTermo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('termo', models.CharField(max_length=100)),
+                ('paciente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='termos_busca', to='agenda.paciente')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['termo', 'paciente'], name='paciente_termo_idx')],
+            },
+        ),
+        migrations.RunPython(preencher_campos_busca, migrations.RunPython.noop),
+    ]
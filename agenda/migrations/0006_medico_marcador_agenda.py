@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agenda', '0005_busca_pacientes_medicos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medico',
+            name='agenda_atualizada_em',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='medico',
+            name='agenda_versao',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def preencher_agregados(apps, schema_editor):
+    """Calcula os agregados das consultas existentes (mesmo INSERT ... SELECT de reconstruir_agregados)"""
+    Consulta = apps.get_model('agenda', 'Consulta')
+    ConsultaAgregado = apps.get_model('agenda', 'ConsultaAgregado')
+    conexao = schema_editor.connection
+    totais = (
+        Consulta.objects.using(conexao.alias).annotate(dia=TruncDate('data_hora')).order_by()
+        .values('dia', 'medico_id', 'status').annotate(quantidade=Count('id'))
+    )
+    consulta_sql, parametros = totais.query.sql_with_params()
+    with conexao.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {conexao.ops.quote_name(ConsultaAgregado._meta.db_table)} (data, medico_id, status, total) '
+            f'SELECT dia, medico_id, status, quantidade FROM ({consulta_sql}) totais',
+            parametros,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agenda', '0006_medico_marcador_agenda'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsultaAgregado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('status', models.CharField(max_length=20)),
+                ('total', models.IntegerField(default=0)),
+                ('medico', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='agregados', to='agenda.medico')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['medico', 'data'], name='consulta_agregado_medico_idx')],
+                'constraints': [models.UniqueConstraint(fields=('data', 'medico', 'status'), name='consulta_agregado_unico')],
+            },
+        ),
+        migrations.RunPython(preencher_agregados, migrations.RunPython.noop),
+    ]
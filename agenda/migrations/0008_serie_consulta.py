@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:20
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agenda', '0007_consulta_agregado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SerieConsulta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_inicio', models.DateField()),
+                ('hora', models.TimeField()),
+                ('intervalo_semanas', models.PositiveSmallIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(52)])),
+                ('ocorrencias', models.PositiveSmallIntegerField(validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(104)])),
+                ('observacoes', models.TextField(blank=True)),
+                ('cancelada', models.BooleanField(default=False)),
+                ('criada_em', models.DateTimeField(auto_now_add=True)),
+                ('medico', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='series', to='agenda.medico')),
+                ('paciente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='series', to='agenda.paciente')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='consulta',
+            name='serie',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='consultas', to='agenda.serieconsulta'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agenda', '0008_serie_consulta'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BloqueioAgenda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_inicio', models.DateField()),
+                ('data_fim', models.DateField()),
+                ('hora_inicio', models.TimeField(blank=True, help_text='Em branco: dia inteiro', null=True)),
+                ('hora_fim', models.TimeField(blank=True, help_text='Em branco: dia inteiro', null=True)),
+                ('motivo', models.CharField(max_length=100)),
+                ('medico', models.ForeignKey(blank=True, help_text='Deixe em branco para bloquear a agenda de toda a clínica (ex.: feriados)', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='bloqueios', to='agenda.medico')),
+            ],
+            options={
+                'ordering': ['data_inicio', 'hora_inicio', 'id'],
+                'indexes': [models.Index(fields=['medico', 'data_fim', 'data_inicio'], name='bloqueio_medico_data_idx')],
+                'constraints': [models.CheckConstraint(condition=models.Q(('data_fim__gte', models.F('data_inicio'))), name='bloqueio_periodo_valido')],
+            },
+        ),
+    ]
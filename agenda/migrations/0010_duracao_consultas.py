@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:32
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agenda', '0009_bloqueioagenda'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consulta',
+            name='duracao_minutos',
+            field=models.PositiveSmallIntegerField(blank=True, default=45, help_text='Duração da consulta, em minutos (em branco: a do médico)', validators=[django.core.validators.MinValueValidator(5), django.core.validators.MaxValueValidator(240)]),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='especialidade',
+            name='duracao_consulta',
+            field=models.PositiveSmallIntegerField(default=45, help_text='Duração padrão das consultas, em minutos', validators=[django.core.validators.MinValueValidator(5), django.core.validators.MaxValueValidator(240)]),
+        ),
+        migrations.AddField(
+            model_name='medico',
+            name='duracao_consulta',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Duração das consultas, em minutos (em branco: a da especialidade)', null=True, validators=[django.core.validators.MinValueValidator(5), django.core.validators.MaxValueValidator(240)]),
+        ),
+        migrations.AddField(
+            model_name='medico',
+            name='duracao_slot',
+            field=models.PositiveSmallIntegerField(default=45, editable=False),
+        ),
+    ]
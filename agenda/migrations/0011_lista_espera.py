@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agenda', '0010_duracao_consultas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListaEspera',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_inicio', models.DateField()),
+                ('data_fim', models.DateField()),
+                ('hora_inicio', models.TimeField(blank=True, help_text='Em branco: qualquer horário', null=True)),
+                ('hora_fim', models.TimeField(blank=True, help_text='Em branco: qualquer horário', null=True)),
+                ('status', models.CharField(choices=[('aguardando', 'Aguardando'), ('atendida', 'Atendida'), ('cancelada', 'Cancelada')], default='aguardando', max_length=20)),
+                ('observacoes', models.TextField(blank=True)),
+                ('criada_em', models.DateTimeField(auto_now_add=True)),
+                ('consulta', models.OneToOneField(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='espera', to='agenda.consulta')),
+                ('especialidade', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='esperas', to='agenda.especialidade')),
+                ('medico', models.ForeignKey(blank=True, help_text='Em branco: qualquer médico da especialidade', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='esperas', to='agenda.medico')),
+                ('paciente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='esperas', to='agenda.paciente')),
+            ],
+            options={
+                'ordering': ['criada_em', 'id'],
+                'indexes': [models.Index(condition=models.Q(('status', 'aguardando')), fields=['medico', 'data_fim', 'data_inicio'], name='espera_medico_idx'), models.Index(condition=models.Q(('status', 'aguardando')), fields=['especialidade', 'data_fim', 'data_inicio'], name='espera_especialidade_idx')],
+                'constraints': [models.CheckConstraint(condition=models.Q(('medico__isnull', False), ('especialidade__isnull', False), _connector='OR'), name='espera_medico_ou_especialidade'), models.CheckConstraint(condition=models.Q(('data_fim__gte', models.F('data_inicio'))), name='espera_periodo_valido')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from agenda.search import termos_busca
+
+
+def indexar_medicos(apps, schema_editor):
+    Medico = apps.get_model('agenda', 'Medico')
+    MedicoTermo = apps.get_model('agenda', 'MedicoTermo')
+
+    MedicoTermo.objects.bulk_create(
+        (
+            MedicoTermo(medico_id=medico_id, termo=termo)
+            for medico_id, nome in Medico.objects.values_list('id', 'nome').iterator(chunk_size=2000)
+            for termo in termos_busca(nome)
+        ),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agenda', '0011_lista_espera'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MedicoTermo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('termo', models.CharField(max_length=100)),
+                ('medico', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='termos_busca', to='agenda.medico')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['termo', 'medico'], name='medico_termo_idx')],
+            },
+        ),
+        migrations.RunPython(indexar_medicos, migrations.RunPython.noop),
+    ]
@@ -1,14 +1,45 @@
+from datetime import datetime, timedelta
+
 from django.db import models
+from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 
+from .scheduling import (
+    DURACAO_MAXIMA_MINUTOS, DURACAO_MINIMA_MINUTOS, DURACAO_SLOT_MINUTOS, dias_para_mascara, grade_horarios,
+    mascara_para_indices,
+)
+from .search import normalizar_texto, somente_digitos, termos_busca
+
+
+def _validadores_duracao():
+    return [MinValueValidator(DURACAO_MINIMA_MINUTOS), MaxValueValidator(DURACAO_MAXIMA_MINUTOS)]
+
 
 class Especialidade(models.Model):
     nome = models.CharField(max_length=100)
     descricao = models.TextField(blank=True)
+    duracao_consulta = models.PositiveSmallIntegerField(
+        default=DURACAO_SLOT_MINUTOS, validators=_validadores_duracao(),
+        help_text="Duração padrão das consultas, em minutos",
+    )
 
     def __str__(self):
         return self.nome
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._duracao_salva = instance.__dict__.get('duracao_consulta')
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Médicos sem duração própria herdam a da especialidade (consultas que saírem da
+        # grade são revisadas em medico_remarcacao, para onde EspecialidadeUpdateView leva)
+        if getattr(self, '_duracao_salva', None) not in (None, self.duracao_consulta):
+            self.medicos.filter(duracao_consulta__isnull=True).update(duracao_slot=self.duracao_consulta)
+        self._duracao_salva = self.duracao_consulta
+
 class Medico(models.Model):
     DIAS_SEMANA = [
         ('segunda', 'Segunda-feira'),
@@ -40,55 +71,432 @@ class Medico(models.Model):
         default="18:00",
         help_text="Horário de fim do expediente"
     )
+    duracao_consulta = models.PositiveSmallIntegerField(
+        null=True, blank=True, validators=_validadores_duracao(),
+        help_text="Duração das consultas, em minutos (em branco: a da especialidade)"
+    )
+    # Duração efetiva dos slots (a do médico ou a da especialidade), derivada no save()
+    # para montar a grade sem carregar a especialidade
+    duracao_slot = models.PositiveSmallIntegerField(default=DURACAO_SLOT_MINUTOS, editable=False)
+    # Máscara de bits dos dias de trabalho (bit 0=segunda ... bit 6=domingo),
+    # derivada de dias_trabalho no save() para evitar parsing do CSV a cada verificação
+    dias_trabalho_mascara = models.PositiveSmallIntegerField(
+        default=0b0011111,
+        editable=False,
+        help_text="Dias de trabalho como máscara de bits (calculado a partir de dias_trabalho)"
+    )
+    # Nome sem acentos e em minúsculas, usado pela busca
+    nome_busca = models.CharField(max_length=100, blank=True, editable=False, db_index=True)
+    # Marcador de alteração da agenda: incrementado sempre que uma consulta do médico
+    # é salva ou excluída, usado como ETag/Last-Modified do feed iCalendar
+    agenda_versao = models.PositiveIntegerField(default=0, editable=False)
+    agenda_atualizada_em = models.DateTimeField(null=True, blank=True, editable=False)
     
     def __str__(self):
         return f"{self.nome} ({self.especialidade})"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Guardar o nome normalizado carregado para saber se os termos de busca mudaram
+        instance._nome_busca_salvo = instance.__dict__.get('nome_busca')
+        return instance
+    
+    @classmethod
+    def marcar_agenda_alterada(cls, medico_ids):
+        """Avança o marcador de alteração da agenda dos médicos (também usado após operações em lote)"""
+        medico_ids = {medico_id for medico_id in medico_ids if medico_id is not None}
+        if medico_ids:
+            cls.objects.filter(pk__in=medico_ids).update(
+                agenda_versao=models.F('agenda_versao') + 1,
+                agenda_atualizada_em=timezone.now(),
+            )
+    
+    def preencher_campos_derivados(self, duracao_especialidade=None):
+        """Recalcula a máscara de dias, a duração dos slots e o nome de busca (também usado em inserções em lote).
+
+        Em lote, informe `duracao_especialidade` para não carregar a especialidade de cada médico.
+        """
+        # Normalizar horários informados como texto (ex.: valores padrão)
+        self.hora_inicio = self._meta.get_field('hora_inicio').to_python(self.hora_inicio)
+        self.hora_fim = self._meta.get_field('hora_fim').to_python(self.hora_fim)
+        self.duracao_consulta = self._meta.get_field('duracao_consulta').to_python(self.duracao_consulta)
+        self.dias_trabalho_mascara = dias_para_mascara(self.dias_trabalho.split(','))
+        if self.duracao_consulta:
+            self.duracao_slot = self.duracao_consulta
+        elif duracao_especialidade:
+            self.duracao_slot = duracao_especialidade
+        elif self.especialidade_id is not None:
+            self.duracao_slot = self.especialidade.duracao_consulta
+        self.nome_busca = normalizar_texto(self.nome)
+    
+    def save(self, *args, **kwargs):
+        self.preencher_campos_derivados()
+        if kwargs.get('update_fields') is not None:
+            if 'dias_trabalho' in kwargs['update_fields']:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'dias_trabalho_mascara'}
+            if {'duracao_consulta', 'especialidade'} & set(kwargs['update_fields']):
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'duracao_slot'}
+            if 'nome' in kwargs['update_fields']:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'nome_busca'}
+        super().save(*args, **kwargs)
+        
+        # Reindexar as palavras do nome apenas quando ele mudou
+        if getattr(self, '_nome_busca_salvo', None) != self.nome_busca:
+            MedicoTermo.objects.filter(medico=self).delete()
+            MedicoTermo.objects.bulk_create(MedicoTermo.para_medico(self))
+            self._nome_busca_salvo = self.nome_busca
+    
+    @property
+    def dias_trabalho_indices(self):
+        """Índices (weekday) dos dias de trabalho, 0=segunda ... 6=domingo"""
+        return mascara_para_indices(self.dias_trabalho_mascara)
+    
+    @property
+    def grade_horarios(self):
+        """Grade pré-calculada com os horários de início dos slots do expediente"""
+        return grade_horarios(
+            self._meta.get_field('hora_inicio').to_python(self.hora_inicio),
+            self._meta.get_field('hora_fim').to_python(self.hora_fim),
+            self.duracao_slot,
+        )
+    
     def get_dias_trabalho_display(self):
         """Retorna os dias de trabalho em formato legível"""
-        dias_dict = dict(self.DIAS_SEMANA)
-        dias_lista = self.dias_trabalho.split(',')
-        return ', '.join([dias_dict.get(dia.strip(), dia.strip()) for dia in dias_lista if dia.strip()])
+        return ', '.join(nome for indice, (dia, nome) in enumerate(self.DIAS_SEMANA)
+                         if self.dias_trabalho_mascara & (1 << indice))
     
     def trabalha_no_dia(self, dia_semana):
-        """Verifica se o médico trabalha em um determinado dia da semana"""
-        return dia_semana in self.dias_trabalho.split(',')
+        """Verifica se o médico trabalha em um determinado dia da semana (nome ou índice weekday)"""
+        if isinstance(dia_semana, str):
+            return bool(self.dias_trabalho_mascara & dias_para_mascara([dia_semana]))
+        return bool(self.dias_trabalho_mascara & (1 << dia_semana))
+    
+    def trabalha_na_data(self, data):
+        """Verifica se o médico trabalha no dia da semana da data informada"""
+        return bool(self.dias_trabalho_mascara & (1 << data.weekday()))
     
     def esta_disponivel(self, data_hora):
         """Verifica se o médico está disponível em uma data/hora específica"""
-        dias_semana_map = {
-            0: 'segunda',
-            1: 'terca', 
-            2: 'quarta',
-            3: 'quinta',
-            4: 'sexta',
-            5: 'sabado',
-            6: 'domingo'
-        }
-        
-        dia_semana = dias_semana_map.get(data_hora.weekday())
-        if not self.trabalha_no_dia(dia_semana):
+        if not self.trabalha_na_data(data_hora):
             return False
             
         hora = data_hora.time()
         return self.hora_inicio <= hora <= self.hora_fim
 
+class MedicoTermo(models.Model):
+    """Índice invertido das palavras (normalizadas) do nome de cada médico, para busca por prefixo"""
+    medico = models.ForeignKey(Medico, on_delete=models.CASCADE, related_name='termos_busca')
+    termo = models.CharField(max_length=100)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['termo', 'medico'], name='medico_termo_idx'),
+        ]
+
+    def __str__(self):
+        return self.termo
+    
+    @classmethod
+    def para_medico(cls, medico):
+        return [cls(medico=medico, termo=termo) for termo in termos_busca(medico.nome)]
+
 class Paciente(models.Model):
     nome = models.CharField(max_length=100)
     data_nascimento = models.DateField()
     cpf = models.CharField(max_length=14, unique=True)
     telefone = models.CharField(max_length=20, blank=True)
     email = models.EmailField(blank=True)
+    
+    # Campos derivados para a busca: CPF só com dígitos e nome sem acentos/minúsculo
+    cpf_digitos = models.CharField(max_length=14, blank=True, editable=False, db_index=True)
+    nome_busca = models.CharField(max_length=100, blank=True, editable=False, db_index=True)
 
     def __str__(self):
         return self.nome
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Guardar o nome normalizado carregado para saber se os termos de busca mudaram
+        instance._nome_busca_salvo = instance.__dict__.get('nome_busca')
+        return instance
+    
+    def preencher_campos_busca(self):
+        """Atualiza os campos derivados usados pela busca (também usado em inserções em lote)"""
+        self.cpf_digitos = somente_digitos(self.cpf)
+        self.nome_busca = normalizar_texto(self.nome)
+    
+    def save(self, *args, **kwargs):
+        self.preencher_campos_busca()
+        if kwargs.get('update_fields') is not None:
+            if 'cpf' in kwargs['update_fields']:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'cpf_digitos'}
+            if 'nome' in kwargs['update_fields']:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'nome_busca'}
+        super().save(*args, **kwargs)
+        
+        # Reindexar as palavras do nome apenas quando ele mudou
+        if getattr(self, '_nome_busca_salvo', None) != self.nome_busca:
+            PacienteTermo.objects.filter(paciente=self).delete()
+            PacienteTermo.objects.bulk_create(PacienteTermo.para_paciente(self))
+            self._nome_busca_salvo = self.nome_busca
+
+class PacienteTermo(models.Model):
+    """Índice invertido das palavras (normalizadas) do nome de cada paciente, para busca por prefixo"""
+    paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE, related_name='termos_busca')
+    termo = models.CharField(max_length=100)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['termo', 'paciente'], name='paciente_termo_idx'),
+        ]
+
+    def __str__(self):
+        return self.termo
+    
+    @classmethod
+    def para_paciente(cls, paciente):
+        return [cls(paciente=paciente, termo=termo) for termo in termos_busca(paciente.nome)]
 
 class Consulta(models.Model):
     paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE, related_name='consultas')
     medico = models.ForeignKey(Medico, on_delete=models.CASCADE, related_name='consultas')
     data_hora = models.DateTimeField()
     status = models.CharField(max_length=20, choices=[('agendada', 'Agendada'), ('realizada', 'Realizada'), ('cancelada', 'Cancelada')], default='agendada')
+    # Preenchida no save() com a duração do médico quando não informada
+    duracao_minutos = models.PositiveSmallIntegerField(
+        blank=True, validators=_validadores_duracao(),
+        help_text="Duração da consulta, em minutos (em branco: a do médico)"
+    )
     observacoes = models.TextField(blank=True)
+    serie = models.ForeignKey(
+        'SerieConsulta', on_delete=models.SET_NULL, null=True, blank=True, related_name='consultas',
+    )
+
+    class Meta:
+        constraints = [
+            # Impede dois agendamentos ativos (não cancelados) no mesmo horário para o mesmo médico
+            models.UniqueConstraint(
+                fields=['medico', 'data_hora'],
+                condition=~models.Q(status='cancelada'),
+                name='consulta_horario_unico_por_medico',
+                violation_error_message='Este horário já está ocupado para o médico selecionado.',
+            ),
+        ]
+        indexes = [
+            # Índices compostos para filtragem e paginação por cursor em (data_hora, id)
+            models.Index(fields=['data_hora', 'id'], name='consulta_data_hora_id_idx'),
+            models.Index(fields=['status', 'data_hora', 'id'], name='consulta_status_data_idx'),
+            models.Index(fields=['medico', 'data_hora', 'id'], name='consulta_medico_data_idx'),
+            models.Index(fields=['paciente', 'data_hora', 'id'], name='consulta_paciente_data_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Guardar médico e horário carregados para atualizar também a agenda antiga quando mudarem
+        instance._medico_id_salvo = instance.__dict__.get('medico_id')
+        instance._data_hora_salva = instance.__dict__.get('data_hora')
+        instance._status_salvo = instance.__dict__.get('status')
+        return instance
+
+    def save(self, *args, **kwargs):
+        if self.duracao_minutos is None and self.medico_id is not None:
+            self.duracao_minutos = self.medico.duracao_slot
+        super().save(*args, **kwargs)
+
+    @property
+    def fim(self):
+        return self.data_hora + timedelta(minutes=self.duracao_minutos or DURACAO_SLOT_MINUTOS)
 
     def __str__(self):
         return f"{self.paciente} - {self.medico} em {self.data_hora.strftime('%d/%m/%Y %H:%M')}"
+
+class SerieConsulta(models.Model):
+    """Consultas recorrentes de um paciente com o mesmo médico, no mesmo horário a cada N semanas"""
+    MAX_OCORRENCIAS = 104
+
+    paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE, related_name='series')
+    medico = models.ForeignKey(Medico, on_delete=models.CASCADE, related_name='series')
+    data_inicio = models.DateField()
+    hora = models.TimeField()
+    intervalo_semanas = models.PositiveSmallIntegerField(
+        default=1, validators=[MinValueValidator(1), MaxValueValidator(52)],
+    )
+    ocorrencias = models.PositiveSmallIntegerField(
+        validators=[MinValueValidator(1), MaxValueValidator(MAX_OCORRENCIAS)],
+    )
+    observacoes = models.TextField(blank=True)
+    cancelada = models.BooleanField(default=False)
+    criada_em = models.DateTimeField(auto_now_add=True)
+
+    def datas(self):
+        """Datas das ocorrências, a partir de data_inicio"""
+        return [self.data_inicio + timedelta(weeks=self.intervalo_semanas * indice) for indice in range(self.ocorrencias)]
+
+    def horarios(self):
+        """Data e hora (no fuso local) de cada ocorrência"""
+        return [timezone.make_aware(datetime.combine(data, self.hora)) for data in self.datas()]
+
+    def __str__(self):
+        return f"{self.paciente} - {self.medico} a cada {self.intervalo_semanas} semana(s)"
+
+class BloqueioAgenda(models.Model):
+    """Exceção à grade semanal: férias, feriados ou horários bloqueados de data_inicio a data_fim (inclusive).
+
+    Sem médico, o bloqueio vale para toda a clínica; sem horários, bloqueia os dias inteiros.
+    Com horários, bloqueia a mesma janela em cada dia do período.
+    """
+    medico = models.ForeignKey(
+        Medico, on_delete=models.CASCADE, null=True, blank=True, related_name='bloqueios',
+        help_text="Deixe em branco para bloquear a agenda de toda a clínica (ex.: feriados)",
+    )
+    data_inicio = models.DateField()
+    data_fim = models.DateField()
+    hora_inicio = models.TimeField(null=True, blank=True, help_text="Em branco: dia inteiro")
+    hora_fim = models.TimeField(null=True, blank=True, help_text="Em branco: dia inteiro")
+    motivo = models.CharField(max_length=100)
+
+    class Meta:
+        ordering = ['data_inicio', 'hora_inicio', 'id']
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(data_fim__gte=models.F('data_inicio')), name='bloqueio_periodo_valido',
+            ),
+        ]
+        indexes = [
+            # Busca por intervalo: bloqueios do médico (ou da clínica, medico nulo) que terminam após o início
+            models.Index(fields=['medico', 'data_fim', 'data_inicio'], name='bloqueio_medico_data_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Guardar médico e período carregados para limpar também o cache do período antigo
+        instance._periodo_salvo = (
+            instance.__dict__.get('medico_id'), instance.__dict__.get('data_inicio'), instance.__dict__.get('data_fim'),
+        )
+        return instance
+
+    def clean(self):
+        from django.core.exceptions import ValidationError
+
+        erros = {}
+        if self.data_inicio and self.data_fim and self.data_fim < self.data_inicio:
+            erros['data_fim'] = 'A data final deve ser igual ou posterior à data inicial.'
+        if (self.hora_inicio is None) != (self.hora_fim is None):
+            erros['hora_fim'] = 'Informe os dois horários ou deixe ambos em branco para bloquear o dia inteiro.'
+        elif self.hora_inicio and self.hora_fim and self.hora_fim <= self.hora_inicio:
+            erros['hora_fim'] = 'O horário final deve ser posterior ao inicial.'
+        if erros:
+            raise ValidationError(erros)
+
+    @property
+    def dia_inteiro(self):
+        return self.hora_inicio is None
+
+    def __str__(self):
+        alvo = self.medico.nome if self.medico_id else 'Clínica'
+        return f"{alvo}: {self.motivo} ({self.data_inicio.strftime('%d/%m/%Y')} a {self.data_fim.strftime('%d/%m/%Y')})"
+
+class ListaEspera(models.Model):
+    """Paciente à espera de um horário com um médico ou com qualquer médico de uma especialidade.
+
+    A janela preferida vai de data_inicio a data_fim (inclusive) e, opcionalmente, de
+    hora_inicio a hora_fim em cada dia. Quando um agendamento é cancelado, o horário
+    liberado é oferecido às entradas compatíveis por ordem de chegada (agenda.espera).
+    """
+    STATUS_CHOICES = [('aguardando', 'Aguardando'), ('atendida', 'Atendida'), ('cancelada', 'Cancelada')]
+
+    paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE, related_name='esperas')
+    medico = models.ForeignKey(
+        Medico, on_delete=models.CASCADE, null=True, blank=True, related_name='esperas',
+        help_text="Em branco: qualquer médico da especialidade",
+    )
+    especialidade = models.ForeignKey(
+        Especialidade, on_delete=models.CASCADE, null=True, blank=True, related_name='esperas',
+    )
+    data_inicio = models.DateField()
+    data_fim = models.DateField()
+    hora_inicio = models.TimeField(null=True, blank=True, help_text="Em branco: qualquer horário")
+    hora_fim = models.TimeField(null=True, blank=True, help_text="Em branco: qualquer horário")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='aguardando')
+    consulta = models.OneToOneField(
+        Consulta, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='espera',
+    )
+    observacoes = models.TextField(blank=True)
+    criada_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['criada_em', 'id']
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(medico__isnull=False) | models.Q(especialidade__isnull=False),
+                name='espera_medico_ou_especialidade',
+            ),
+            models.CheckConstraint(
+                condition=models.Q(data_fim__gte=models.F('data_inicio')), name='espera_periodo_valido',
+            ),
+        ]
+        indexes = [
+            # Índices parciais (só as entradas aguardando) para a busca por vaga liberada: entradas do
+            # médico, ou da especialidade sem médico, cuja janela ainda não terminou
+            models.Index(
+                fields=['medico', 'data_fim', 'data_inicio'], condition=models.Q(status='aguardando'),
+                name='espera_medico_idx',
+            ),
+            models.Index(
+                fields=['especialidade', 'data_fim', 'data_inicio'], condition=models.Q(status='aguardando'),
+                name='espera_especialidade_idx',
+            ),
+        ]
+
+    def clean(self):
+        from django.core.exceptions import ValidationError
+
+        erros = {}
+        if self.medico_id is None and self.especialidade_id is None:
+            erros['especialidade'] = 'Informe o médico ou a especialidade.'
+        elif self.medico_id and self.especialidade_id and self.medico.especialidade_id != self.especialidade_id:
+            erros['especialidade'] = 'O médico escolhido não é desta especialidade.'
+        if self.data_inicio and self.data_fim and self.data_fim < self.data_inicio:
+            erros['data_fim'] = 'A data final deve ser igual ou posterior à data inicial.'
+        if (self.hora_inicio is None) != (self.hora_fim is None):
+            erros['hora_fim'] = 'Informe os dois horários ou deixe ambos em branco para aceitar qualquer horário.'
+        elif self.hora_inicio and self.hora_fim and self.hora_fim <= self.hora_inicio:
+            erros['hora_fim'] = 'O horário final deve ser posterior ao inicial.'
+        if erros:
+            raise ValidationError(erros)
+
+    def save(self, *args, **kwargs):
+        # Entradas por médico também guardam a especialidade (para listar e filtrar)
+        if self.medico_id and self.especialidade_id is None:
+            self.especialidade_id = self.medico.especialidade_id
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        alvo = self.medico.nome if self.medico_id else self.especialidade.nome
+        return f"{self.paciente} aguardando {alvo} ({self.data_inicio.strftime('%d/%m/%Y')} a {self.data_fim.strftime('%d/%m/%Y')})"
+
+class ConsultaAgregado(models.Model):
+    """Total de consultas por dia (no fuso local), médico e status, mantido pelos sinais de Consulta.
+
+    Lido pelo painel e pela API de agregados; pode ser recalculado com o comando
+    reconstruir_agregados.
+    """
+    data = models.DateField()
+    medico = models.ForeignKey(Medico, on_delete=models.CASCADE, related_name='agregados')
+    status = models.CharField(max_length=20)
+    total = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['data', 'medico', 'status'], name='consulta_agregado_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['medico', 'data'], name='consulta_agregado_medico_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.medico_id} em {self.data}: {self.total} ({self.status})'
@@ -0,0 +1,78 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def codificar_cursor(data_hora, pk):
+    """Codifica a posição (data_hora, id) de uma linha em um token opaco para a URL"""
+    valor = f'{data_hora.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(valor.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(token):
+    """Decodifica um token gerado por codificar_cursor em (data_hora, id)"""
+    try:
+        valor = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        data_hora, pk = valor.rsplit('|', 1)
+        return datetime.fromisoformat(data_hora), int(pk)
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise CursorInvalido(token) from exc
+
+
+class PaginaKeyset:
+    """Página de resultados obtida por keyset pagination sobre (data_hora, id) em ordem decrescente"""
+
+    def __init__(self, itens, tem_proxima, tem_anterior):
+        self.object_list = itens
+        self.tem_proxima = tem_proxima
+        self.tem_anterior = tem_anterior
+
+    @property
+    def cursor_proximo(self):
+        if self.tem_proxima and self.object_list:
+            ultimo = self.object_list[-1]
+            return codificar_cursor(ultimo.data_hora, ultimo.pk)
+        return None
+
+    @property
+    def cursor_anterior(self):
+        if self.tem_anterior and self.object_list:
+            primeiro = self.object_list[0]
+            return codificar_cursor(primeiro.data_hora, primeiro.pk)
+        return None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def paginar_keyset(queryset, tamanho, apos=None, antes=None):
+    """Retorna a página de `tamanho` itens após (ou antes de) um cursor.
+
+    A ordenação é sempre (-data_hora, -id), de modo que cada página é obtida com um
+    único acesso por índice a partir da posição do cursor, sem OFFSET: o custo da
+    página 500 é o mesmo da página 1.
+    """
+    if antes:
+        data_hora, pk = decodificar_cursor(antes)
+        linhas = list(
+            queryset.filter(Q(data_hora__gt=data_hora) | Q(data_hora=data_hora, id__gt=pk))
+            .order_by('data_hora', 'id')[:tamanho + 1]
+        )
+        tem_anterior = len(linhas) > tamanho
+        itens = linhas[:tamanho][::-1]
+        return PaginaKeyset(itens, tem_proxima=True, tem_anterior=tem_anterior)
+
+    if apos:
+        data_hora, pk = decodificar_cursor(apos)
+        queryset = queryset.filter(Q(data_hora__lt=data_hora) | Q(data_hora=data_hora, id__lt=pk))
+
+    linhas = list(queryset.order_by('-data_hora', '-id')[:tamanho + 1])
+    return PaginaKeyset(linhas[:tamanho], tem_proxima=len(linhas) > tamanho, tem_anterior=bool(apos))
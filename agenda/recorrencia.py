@@ -0,0 +1,176 @@
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from functools import reduce
+from operator import or_
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Consulta, Medico
+from .scheduling import (
+    DURACAO_MAXIMA_MINUTOS, agrupar_bloqueios, bloqueios_do_dia, bloqueios_periodo, intervalo_consulta, janelas_bloqueio,
+    mesclar_intervalos, sobrepoe,
+)
+from .services import registrar_alteracoes
+
+MENSAGEM_DIA = 'O médico não atende neste dia da semana.'
+MENSAGEM_GRADE = 'Horário fora da grade de atendimento do médico.'
+MENSAGEM_PASSADO = 'Data no passado.'
+MENSAGEM_OCUPADO = 'Horário já ocupado.'
+MENSAGEM_BLOQUEADO = 'Horário bloqueado na agenda do médico.'
+
+
+def _estado(consulta):
+    return consulta.medico_id, consulta.data_hora, consulta.status
+
+
+def conflitos_horarios(medico, horarios, ignorar_ids=()):
+    """{data local: motivo} das ocorrências que não podem ser agendadas.
+
+    A grade do médico é verificada em memória. Os bloqueios do período e os agendamentos
+    ativos que podem se sobrepor às ocorrências (cada uma com a duração do médico) são
+    lidos com uma consulta cada, ignorando as consultas em `ignorar_ids`.
+    """
+    agora = timezone.now()
+    duracao = medico.duracao_slot
+    conflitos = {}
+    livres = []
+    for data_hora in horarios:
+        local = timezone.localtime(data_hora)
+        if not medico.trabalha_na_data(local.date()):
+            conflitos[local.date()] = MENSAGEM_DIA
+        elif local.strftime('%H:%M') not in medico.grade_horarios.rotulos_set:
+            conflitos[local.date()] = MENSAGEM_GRADE
+        elif data_hora < agora:
+            conflitos[local.date()] = MENSAGEM_PASSADO
+        else:
+            livres.append(data_hora)
+    if livres:
+        inicio, fim = timezone.localtime(min(livres)).date(), timezone.localtime(max(livres)).date()
+        bloqueios = agrupar_bloqueios(bloqueios_periodo([medico.pk], inicio, fim), inicio, fim)
+        for data_hora in livres:
+            local = timezone.localtime(data_hora)
+            janelas = mesclar_intervalos(janelas_bloqueio(bloqueios_do_dia(bloqueios, medico.pk, local.date())))
+            if sobrepoe(*intervalo_consulta(local, duracao), janelas):
+                conflitos[local.date()] = MENSAGEM_BLOQUEADO
+        # Uma janela por ocorrência: começa até DURACAO_MAXIMA_MINUTOS antes e antes do fim dela
+        proximos = reduce(or_, (
+            Q(data_hora__gt=data_hora - timedelta(minutes=DURACAO_MAXIMA_MINUTOS),
+              data_hora__lt=data_hora + timedelta(minutes=duracao))
+            for data_hora in livres
+        ))
+        ocupados = (
+            Consulta.objects.filter(proximos, medico=medico)
+            .exclude(status='cancelada').exclude(pk__in=ignorar_ids)
+            .values_list('data_hora', 'duracao_minutos')
+        )
+        livres.sort()
+        for data_hora_ocupada, duracao_ocupada in ocupados:
+            # Ocorrências que começam antes do fim do agendamento e terminam depois do início dele
+            fim_ocupado = data_hora_ocupada + timedelta(minutes=duracao_ocupada)
+            indice = bisect_right(livres, data_hora_ocupada - timedelta(minutes=duracao))
+            while indice < len(livres) and livres[indice] < fim_ocupado:
+                conflitos.setdefault(timezone.localtime(livres[indice]).date(), MENSAGEM_OCUPADO)
+                indice += 1
+    return dict(sorted(conflitos.items()))
+
+
+def criar_serie(serie, ignorar_conflitos=False):
+    """Grava a série e as consultas das ocorrências livres com um único bulk_create, de forma atômica.
+
+    Retorna (consultas, conflitos). Havendo conflitos, nada é gravado, a menos que
+    `ignorar_conflitos` peça para agendar apenas as datas livres. A verificação roda
+    com a agenda do médico travada, como em salvar_consulta: a restrição única só
+    impede inícios iguais, não intervalos sobrepostos.
+    """
+    horarios = serie.horarios()
+    try:
+        with transaction.atomic():
+            Medico.objects.select_for_update().filter(pk=serie.medico_id).first()
+            conflitos = conflitos_horarios(serie.medico, horarios)
+            if conflitos and not ignorar_conflitos:
+                return [], conflitos
+            livres = [data_hora for data_hora in horarios if timezone.localtime(data_hora).date() not in conflitos]
+            if not livres:
+                return [], conflitos
+            serie.save()
+            consultas = Consulta.objects.bulk_create([
+                Consulta(
+                    serie=serie, paciente_id=serie.paciente_id, medico_id=serie.medico_id,
+                    data_hora=data_hora, duracao_minutos=serie.medico.duracao_slot, status='agendada',
+                    observacoes=serie.observacoes,
+                )
+                for data_hora in livres
+            ])
+            registrar_alteracoes(
+                (consulta.pk, None, _estado(consulta), consulta.duracao_minutos) for consulta in consultas
+            )
+    except IntegrityError:
+        # Outro agendamento (gravado sem travar a agenda) ocupou uma das datas ao mesmo tempo
+        serie.pk = None
+        conflitos = conflitos_horarios(serie.medico, horarios)
+        if not conflitos:
+            raise
+        return [], conflitos
+    return consultas, conflitos
+
+
+def _futuras(serie):
+    return list(
+        serie.consultas.filter(status='agendada', data_hora__gte=timezone.now()).order_by('data_hora')
+    )
+
+
+def alterar_serie(serie, hora, observacoes):
+    """Move as ocorrências futuras para o novo horário (mesmas datas) com um único bulk_update.
+
+    Retorna (consultas alteradas, conflitos); havendo conflitos, nada é alterado. Como
+    em criar_serie, a verificação roda com a agenda do médico travada.
+    """
+    try:
+        with transaction.atomic():
+            Medico.objects.select_for_update().filter(pk=serie.medico_id).first()
+            consultas = _futuras(serie)
+            anteriores = {consulta.pk: _estado(consulta) for consulta in consultas}
+            for consulta in consultas:
+                consulta.data_hora = timezone.make_aware(
+                    datetime.combine(timezone.localtime(consulta.data_hora).date(), hora)
+                )
+                consulta.observacoes = observacoes
+            conflitos = conflitos_horarios(serie.medico, [consulta.data_hora for consulta in consultas], list(anteriores))
+            if conflitos:
+                return [], conflitos
+
+            serie.hora = hora
+            serie.observacoes = observacoes
+            serie.save(update_fields=['hora', 'observacoes'])
+            Consulta.objects.bulk_update(consultas, ['data_hora', 'observacoes'])
+            registrar_alteracoes(
+                (consulta.pk, anteriores[consulta.pk], _estado(consulta), consulta.duracao_minutos)
+                for consulta in consultas
+            )
+    except IntegrityError:
+        conflitos = conflitos_horarios(serie.medico, [consulta.data_hora for consulta in consultas], list(anteriores))
+        if not conflitos:
+            raise
+        return [], conflitos
+    return consultas, {}
+
+
+def cancelar_serie(serie):
+    """Cancela a série e todas as ocorrências futuras com um único UPDATE; retorna quantas foram canceladas"""
+    with transaction.atomic():
+        consultas = list(
+            serie.consultas.select_for_update()
+            .filter(status='agendada', data_hora__gte=timezone.now())
+            .values_list('id', 'medico_id', 'data_hora', 'duracao_minutos')
+        )
+        Consulta.objects.filter(pk__in=[consulta_id for consulta_id, _, _, _ in consultas]).update(status='cancelada')
+        serie.cancelada = True
+        serie.save(update_fields=['cancelada'])
+        registrar_alteracoes(
+            (consulta_id, (medico_id, data_hora, 'agendada'), (medico_id, data_hora, 'cancelada'), duracao)
+            for consulta_id, medico_id, data_hora, duracao in consultas
+        )
+    return len(consultas)
@@ -0,0 +1,127 @@
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Consulta, Medico
+from .scheduling import (
+    agrupar_bloqueios, bloqueios_do_dia, bloqueios_periodo, consultas_ocupadas, intervalo_consulta, janelas_bloqueio,
+    mesclar_intervalos, minutos_do_dia, sobrepoe, termina_no_expediente,
+)
+from .services import registrar_alteracoes
+
+# Quantos dias após a última consulta afetada procurar horários livres
+HORIZONTE_REMARCACAO_DIAS = 92
+
+
+class Remarcacao(NamedTuple):
+    consulta: Consulta
+    nova_data_hora: datetime | None  # None: sem horário livre no horizonte (a consulta será cancelada)
+
+
+def fora_da_grade(medico, data_hora, duracao):
+    """True se a consulta não cabe mais nos dias, na grade ou no fim do expediente atuais do médico"""
+    local = timezone.localtime(data_hora)
+    return (
+        not medico.trabalha_na_data(local.date())
+        or local.strftime('%H:%M') not in medico.grade_horarios.rotulos_set
+        or not termina_no_expediente(medico, local, duracao)
+    )
+
+
+def consultas_afetadas(medico, a_partir_de=None):
+    """Consultas agendadas a partir de agora que ficaram fora do expediente atual do médico.
+
+    Uma única consulta pelo índice (medico, data_hora, id); o expediente é conferido em memória.
+    """
+    a_partir_de = a_partir_de or timezone.now()
+    consultas = (
+        Consulta.objects.filter(medico=medico, status='agendada', data_hora__gte=a_partir_de)
+        .select_related('paciente').order_by('data_hora', 'id')
+    )
+    return [consulta for consulta in consultas if fora_da_grade(medico, consulta.data_hora, consulta.duracao_minutos)]
+
+
+def propor_remarcacao(medico, a_partir_de=None):
+    """Propõe um novo horário para cada consulta afetada, sem gravar nada (dry-run).
+
+    Os agendamentos e os bloqueios de todo o período são lidos com uma consulta cada e
+    viram intervalos por dia. As consultas afetadas, em ordem cronológica, recebem o
+    primeiro slot da nova grade, a partir do dia original, em que cabem com a própria
+    duração até o fim do expediente; cada proposta passa a ocupar o seu intervalo (alocação gulosa).
+    """
+    a_partir_de = a_partir_de or timezone.now()
+    afetadas = consultas_afetadas(medico, a_partir_de)
+    if not afetadas:
+        return []
+
+    local_tz = timezone.get_current_timezone()
+    inicio = timezone.localtime(afetadas[0].data_hora, local_tz).date()
+    fim = timezone.localtime(afetadas[-1].data_hora, local_tz).date() + timedelta(days=HORIZONTE_REMARCACAO_DIAS)
+    # As afetadas serão movidas: o horário atual delas não ocupa a nova grade
+    movidas = {consulta.pk for consulta in afetadas}
+    intervalos = {}
+    for consulta_id, data_hora, duracao in consultas_ocupadas(medico.id, inicio, fim):
+        if consulta_id not in movidas:
+            local = timezone.localtime(data_hora, local_tz)
+            intervalos.setdefault(local.date(), []).append(intervalo_consulta(local, duracao))
+    bloqueios = agrupar_bloqueios(bloqueios_periodo([medico.id], inicio, fim), inicio, fim)
+    for data in bloqueios.get(None, {}).keys() | bloqueios.get(medico.id, {}).keys():
+        intervalos.setdefault(data, []).extend(janelas_bloqueio(bloqueios_do_dia(bloqueios, medico.id, data)))
+    mesclados = {data: mesclar_intervalos(intervalos_dia) for data, intervalos_dia in intervalos.items()}
+
+    grade = medico.grade_horarios
+    fim_expediente = minutos_do_dia(medico.hora_fim)
+    # Menor duração que já não coube em cada dia: durações iguais ou maiores pulam o dia
+    dias_cheios = {}
+    propostas = []
+    for consulta in afetadas:
+        duracao = consulta.duracao_minutos
+        nova_data_hora = None
+        data = timezone.localtime(consulta.data_hora, local_tz).date()
+        while nova_data_hora is None and data <= fim:
+            if medico.trabalha_na_data(data) and duracao < dias_cheios.get(data, duracao + 1):
+                ocupados = mesclados.get(data, [])
+                for horario in grade.horarios:
+                    data_hora = timezone.make_aware(datetime.combine(data, horario), local_tz)
+                    slot = minutos_do_dia(horario)
+                    fim_slot = slot + duracao
+                    if data_hora >= a_partir_de and fim_slot <= fim_expediente and not sobrepoe(slot, fim_slot, ocupados):
+                        nova_data_hora = data_hora
+                        mesclados[data] = mesclar_intervalos(ocupados + [(slot, fim_slot)])
+                        break
+                else:
+                    dias_cheios[data] = duracao
+            data += timedelta(days=1)
+        propostas.append(Remarcacao(consulta, nova_data_hora))
+    return propostas
+
+
+def aplicar_remarcacao(medico, cancelar_todas=False, a_partir_de=None):
+    """Recalcula as propostas e as aplica em uma transação, com bulk_update e um UPDATE para os cancelamentos.
+
+    Consultas sem horário livre no horizonte (ou todas, com cancelar_todas) são
+    canceladas. Retorna (remarcadas, canceladas).
+    """
+    with transaction.atomic():
+        # Serializa remarcações simultâneas da mesma agenda
+        Medico.objects.select_for_update().filter(pk=medico.pk).first()
+        propostas = propor_remarcacao(medico, a_partir_de)
+        remarcadas, canceladas, alteracoes = [], [], []
+        for consulta, nova_data_hora in propostas:
+            antes = (consulta.medico_id, consulta.data_hora, consulta.status)
+            if nova_data_hora is None or cancelar_todas:
+                consulta.status = 'cancelada'
+                canceladas.append(consulta)
+            else:
+                consulta.data_hora = nova_data_hora
+                remarcadas.append(consulta)
+            alteracoes.append(
+                (consulta.pk, antes, (consulta.medico_id, consulta.data_hora, consulta.status), consulta.duracao_minutos)
+            )
+
+        Consulta.objects.filter(pk__in=[consulta.pk for consulta in canceladas]).update(status='cancelada')
+        Consulta.objects.bulk_update(remarcadas, ['data_hora'], batch_size=500)
+        registrar_alteracoes(alteracoes)
+    return remarcadas, canceladas
@@ -0,0 +1,404 @@
+import heapq
+from bisect import bisect_left
+from datetime import datetime, time, timedelta
+from functools import lru_cache
+from typing import NamedTuple
+
+from django.utils import timezone
+
+# Duração padrão de cada consulta (em minutos) e limites aceitos por especialidade, médico e consulta
+DURACAO_SLOT_MINUTOS = 45
+DURACAO_MINIMA_MINUTOS = 5
+DURACAO_MAXIMA_MINUTOS = 240
+
+# Mapear dias da semana para o índice de datetime.weekday() (0=segunda ... 6=domingo)
+DIAS_SEMANA_INDICE = {
+    'segunda': 0,
+    'terca': 1,
+    'quarta': 2,
+    'quinta': 3,
+    'sexta': 4,
+    'sabado': 5,
+    'domingo': 6,
+}
+
+# Número máximo de dias aceitos em uma consulta de disponibilidade por período
+MAX_DIAS_PERIODO = 92
+
+STATUS_OCUPADOS = ['agendada', 'realizada']
+
+# Parâmetros da busca do próximo horário livre por especialidade
+MAX_LIMITE_PROXIMOS = 50
+LOTE_DIAS_PROXIMOS = 14
+
+
+class GradeHorarios(NamedTuple):
+    """Horários de início dos slots de um expediente, pré-calculados"""
+    horarios: tuple  # objetos time, em ordem
+    rotulos: tuple  # mesmos horários no formato '%H:%M'
+    rotulos_set: frozenset  # para verificação de pertinência em O(1)
+
+
+def dias_para_mascara(dias):
+    """Converte uma lista de nomes de dias ('segunda', 'terca', ...) na máscara de bits semanal"""
+    mascara = 0
+    for dia in dias:
+        indice = DIAS_SEMANA_INDICE.get(dia.strip())
+        if indice is not None:
+            mascara |= 1 << indice
+    return mascara
+
+
+@lru_cache(maxsize=128)
+def mascara_para_indices(mascara):
+    """Retorna a tupla de índices (weekday) presentes na máscara de bits"""
+    return tuple(indice for indice in range(7) if mascara & (1 << indice))
+
+
+@lru_cache(maxsize=1024)
+def grade_horarios(hora_inicio, hora_fim, duracao=DURACAO_SLOT_MINUTOS):
+    """Gera a grade de slots que terminam até hora_fim, a partir de hora_inicio (cacheada por expediente)"""
+    horarios = []
+    if hora_inicio and hora_fim:
+        inicio = datetime.combine(datetime.today(), hora_inicio)
+        fim = datetime.combine(datetime.today(), hora_fim)
+        atual = inicio
+        while atual + timedelta(minutes=duracao) <= fim:
+            horarios.append(atual.time())
+            atual += timedelta(minutes=duracao)
+    rotulos = tuple(horario.strftime('%H:%M') for horario in horarios)
+    return GradeHorarios(tuple(horarios), rotulos, frozenset(rotulos))
+
+
+# Intervalos de um dia em minutos desde a meia-noite local, semiabertos: [inicio, fim)
+MINUTOS_DIA = 24 * 60
+
+
+def minutos_do_dia(horario):
+    return horario.hour * 60 + horario.minute
+
+
+def intervalo_consulta(data_hora_local, duracao):
+    """[inicio, fim) em minutos do dia de uma consulta que começa em data_hora_local"""
+    inicio = minutos_do_dia(data_hora_local)
+    return inicio, inicio + duracao
+
+
+def termina_no_expediente(medico, horario, duracao):
+    """True se a consulta que começa em `horario` (hora local) termina até o fim do expediente do médico"""
+    return minutos_do_dia(horario) + duracao <= minutos_do_dia(medico.hora_fim)
+
+
+def mesclar_intervalos(intervalos):
+    """Ordena e une os intervalos que se sobrepõem ou se encostam; retorna uma lista disjunta e ordenada"""
+    mesclados = []
+    for inicio, fim in sorted(intervalos):
+        if mesclados and inicio <= mesclados[-1][1]:
+            if fim > mesclados[-1][1]:
+                mesclados[-1] = (mesclados[-1][0], fim)
+        else:
+            mesclados.append((inicio, fim))
+    return mesclados
+
+
+def sobrepoe(inicio, fim, mesclados):
+    """True se [inicio, fim) se sobrepõe a algum intervalo de `mesclados` (busca binária)"""
+    # Último intervalo que começa antes de `fim`; por serem disjuntos, é o único que pode alcançar `inicio`
+    indice = bisect_left(mesclados, (fim,)) - 1
+    return indice >= 0 and mesclados[indice][1] > inicio
+
+
+def slots_em_conflito(grade, duracao, intervalos):
+    """Rótulos dos slots [horário, horário + duracao) da grade que se sobrepõem a algum dos intervalos.
+
+    A grade deve ter sido gerada com a mesma duração: os slots são igualmente
+    espaçados a partir do primeiro horário, então os índices
+    atingidos por cada intervalo mesclado saem por aritmética inteira:
+    O(intervalos + slots em conflito).
+    """
+    if not grade.horarios:
+        return set()
+    base = minutos_do_dia(grade.horarios[0])
+    ultimo = len(grade.horarios) - 1
+    conflitos = set()
+    for inicio, fim in mesclar_intervalos(intervalos):
+        # Primeiro slot que termina depois de `inicio` e último que começa antes de `fim`
+        primeiro = max((inicio - base) // duracao, 0)
+        final = min((fim - base - 1) // duracao, ultimo)
+        if final >= primeiro:
+            conflitos.update(grade.rotulos[primeiro:final + 1])
+    return conflitos
+
+
+def inicio_do_dia(data, fuso=None):
+    """Primeiro instante (aware) do dia local.
+
+    Quando o horário de verão começa à meia-noite (ex.: 04/11/2018 em São Paulo), a
+    meia-noite não existe e o resultado é o instante real de início do dia (01h).
+    """
+    return timezone.make_aware(datetime.combine(data, time.min), fuso or timezone.get_current_timezone())
+
+
+def periodo_local(inicio, fim, fuso=None):
+    """Intervalo semiaberto [inicio, fim + 1 dia) em datetimes aware, para filtrar data_hora pelo índice"""
+    return inicio_do_dia(inicio, fuso), inicio_do_dia(fim + timedelta(days=1), fuso)
+
+
+def consultas_ocupadas(medico_id, inicio, fim):
+    """(id, data_hora, duracao_minutos) dos agendamentos ativos do médico entre inicio e fim (inclusive), por intervalo"""
+    from .models import Consulta
+
+    inicio_dt, fim_dt = periodo_local(inicio, fim)
+    return Consulta.objects.filter(
+        medico_id=medico_id,
+        data_hora__gte=inicio_dt,
+        data_hora__lt=fim_dt,
+        status__in=STATUS_OCUPADOS,
+    ).values_list('id', 'data_hora', 'duracao_minutos')
+
+
+def bloqueios_periodo(medico_ids, inicio, fim):
+    """(medico_id, data_inicio, data_fim, hora_inicio, hora_fim) dos bloqueios que tocam o período.
+
+    Inclui os bloqueios da clínica (medico_id None); medico_ids None traz os de todos os médicos.
+    Uma única consulta por intervalo de datas, pelo índice (medico, data_fim, data_inicio).
+    """
+    from django.db.models import Q
+    from .models import BloqueioAgenda
+
+    bloqueios = BloqueioAgenda.objects.filter(data_inicio__lte=fim, data_fim__gte=inicio)
+    if medico_ids is not None:
+        bloqueios = bloqueios.filter(Q(medico_id__in=medico_ids) | Q(medico__isnull=True))
+    return bloqueios.order_by().values_list('medico_id', 'data_inicio', 'data_fim', 'hora_inicio', 'hora_fim')
+
+
+def agrupar_bloqueios(linhas, inicio, fim):
+    """Agrupa as linhas de bloqueios_periodo em {medico_id: {data: [(hora_inicio, hora_fim)]}} de inicio a fim (inclusive).
+
+    Os bloqueios da clínica ficam na chave None; horários None bloqueiam o dia inteiro.
+    """
+    bloqueios = {}
+    for medico_id, data_inicio, data_fim, hora_inicio, hora_fim in linhas:
+        dias = bloqueios.setdefault(medico_id, {})
+        data, ultimo = max(data_inicio, inicio), min(data_fim, fim)
+        while data <= ultimo:
+            dias.setdefault(data, []).append((hora_inicio, hora_fim))
+            data += timedelta(days=1)
+    return bloqueios
+
+
+def bloqueios_do_dia(bloqueios, medico_id, data):
+    """Intervalos bloqueados do médico na data, somando os da clínica"""
+    return bloqueios.get(medico_id, {}).get(data, []) + bloqueios.get(None, {}).get(data, [])
+
+
+def janelas_bloqueio(intervalos):
+    """Converte intervalos (hora_inicio, hora_fim) de bloqueio em minutos do dia; None = início/fim do dia"""
+    return [
+        (0 if hora_inicio is None else minutos_do_dia(hora_inicio), MINUTOS_DIA if hora_fim is None else minutos_do_dia(hora_fim))
+        for hora_inicio, hora_fim in intervalos
+    ]
+
+
+def horarios_bloqueados(grade, intervalos, duracao=DURACAO_SLOT_MINUTOS):
+    """Rótulos dos slots da grade que se sobrepõem a algum intervalo (hora_inicio, hora_fim) bloqueado"""
+    if not intervalos:
+        return set()
+    return slots_em_conflito(grade, duracao, janelas_bloqueio(intervalos))
+
+
+def _agrupar_ocupacao(inicio, fim, consultas, bloqueios):
+    """Agrupa consultas (id, data_hora, duracao) e bloqueios do médico em
+    {data: {'consultas': [(inicio, fim, consulta_id)], 'bloqueios': [(hora_inicio, hora_fim)]}}, no fuso local"""
+    local_tz = timezone.get_current_timezone()
+    ocupacao = {}
+    for consulta_id, data_hora, duracao in consultas:
+        local = timezone.localtime(data_hora, local_tz)
+        ocupacao.setdefault(local.date(), {}).setdefault('consultas', []).append(
+            (*intervalo_consulta(local, duracao), consulta_id),
+        )
+    for dias in agrupar_bloqueios(bloqueios, inicio, fim).values():
+        for data, intervalos in dias.items():
+            ocupacao.setdefault(data, {}).setdefault('bloqueios', []).extend(intervalos)
+    return ocupacao
+
+
+def ocupacao_do_banco(medico_id, inicio, fim):
+    """Retorna a ocupação de cada dia (consultas ativas e bloqueios) entre inicio e fim (inclusive).
+
+    Executa uma consulta por intervalo em Consulta.data_hora e outra nos bloqueios do
+    médico e da clínica, e agrupa os resultados em memória, no fuso horário local.
+    """
+    return _agrupar_ocupacao(
+        inicio, fim, consultas_ocupadas(medico_id, inicio, fim), bloqueios_periodo([medico_id], inicio, fim),
+    )
+
+
+async def aocupacao_do_banco(medico_id, inicio, fim):
+    return _agrupar_ocupacao(
+        inicio, fim,
+        [linha async for linha in consultas_ocupadas(medico_id, inicio, fim)],
+        [linha async for linha in bloqueios_periodo([medico_id], inicio, fim)],
+    )
+
+
+def _normalizar_consulta_id(consulta_id):
+    try:
+        return int(consulta_id) if consulta_id else None
+    except (TypeError, ValueError):
+        return None
+
+
+def horarios_indisponiveis(medico, ocupacao, consulta_id=None):
+    """{data: set('%H:%M')} dos slots da grade do médico que se sobrepõem a consultas (exceto consulta_id) ou bloqueios"""
+    consulta_id = _normalizar_consulta_id(consulta_id)
+    grade = medico.grade_horarios
+    indisponiveis = {}
+    for data, dia in ocupacao.items():
+        intervalos = [(inicio, fim) for inicio, fim, ocupante in dia.get('consultas', ()) if ocupante != consulta_id]
+        intervalos += janelas_bloqueio(dia.get('bloqueios', ()))
+        horarios = slots_em_conflito(grade, medico.duracao_slot, intervalos)
+        if horarios:
+            indisponiveis[data] = horarios
+    return indisponiveis
+
+
+def horarios_ocupados_periodo(medico, inicio, fim, consulta_id=None):
+    """Retorna {data: set('%H:%M')} com os horários ocupados ou bloqueados entre inicio e fim (inclusive).
+
+    A ocupação de cada dia vem do cache (agenda.cache); consulta_id, quando
+    informado, é desconsiderado (edição de uma consulta existente).
+    """
+    from .cache import obter_ocupacao
+
+    return horarios_indisponiveis(medico, obter_ocupacao(medico.pk, inicio, fim, ocupacao_do_banco), consulta_id)
+
+
+def bloqueios_na_data(medico, data):
+    """Janelas bloqueadas (minutos do dia) da agenda do médico na data, a partir da ocupação do dia em cache"""
+    from .cache import obter_ocupacao
+
+    dia = obter_ocupacao(medico.pk, data, data, ocupacao_do_banco).get(data, {})
+    return mesclar_intervalos(janelas_bloqueio(dia.get('bloqueios', ())))
+
+
+async def aocupacao_periodo(medico_id, inicio, fim):
+    """Ocupação de cada dia (via cache), de forma assíncrona e apenas com o id do médico.
+
+    Converta com horarios_indisponiveis depois de carregar o médico.
+    """
+    from .cache import aobter_ocupacao
+
+    return await aobter_ocupacao(medico_id, inicio, fim, aocupacao_do_banco)
+
+
+def montar_disponibilidade(medico, inicio, fim, ocupados):
+    """Monta a lista de dias de trabalho entre inicio e fim com os horários livres de cada um"""
+    slots = medico.grade_horarios.rotulos
+
+    dias = []
+    data = inicio
+    while data <= fim:
+        if medico.trabalha_na_data(data):
+            ocupados_dia = ocupados.get(data, set())
+            dias.append({
+                'data': data.isoformat(),
+                'horarios_disponiveis': [slot for slot in slots if slot not in ocupados_dia],
+            })
+        data += timedelta(days=1)
+    return dias
+
+
+def disponibilidade_periodo(medico, inicio, fim, consulta_id=None):
+    """Retorna a lista de dias de trabalho entre inicio e fim com os horários livres de cada um"""
+    return montar_disponibilidade(medico, inicio, fim, horarios_ocupados_periodo(medico, inicio, fim, consulta_id))
+
+
+def aplicar_bloqueios(ocupados, medicos, bloqueios):
+    """Acrescenta aos ocupados {(medico_id, data): set('%H:%M')} os slots bloqueados de cada médico"""
+    datas_clinica = bloqueios.get(None, {}).keys()
+    for medico in medicos:
+        grade = medico.grade_horarios
+        for data in datas_clinica | bloqueios.get(medico.id, {}).keys():
+            bloqueados = horarios_bloqueados(grade, bloqueios_do_dia(bloqueios, medico.id, data), medico.duracao_slot)
+            if bloqueados:
+                ocupados.setdefault((medico.id, data), set()).update(bloqueados)
+
+
+def _slots_do_medico(medico, inicio, fim, a_partir_de, ocupados):
+    """Gera, em ordem cronológica, os horários livres (datetime aware) do médico entre inicio e fim"""
+    local_tz = timezone.get_current_timezone()
+    grade = medico.grade_horarios
+
+    data = inicio
+    while data <= fim:
+        if medico.trabalha_na_data(data):
+            ocupados_dia = ocupados.get((medico.id, data), set())
+            for slot, rotulo in zip(grade.horarios, grade.rotulos):
+                data_hora = timezone.make_aware(datetime.combine(data, slot), local_tz)
+                if data_hora >= a_partir_de and rotulo not in ocupados_dia:
+                    yield data_hora, medico.id, medico
+        data += timedelta(days=1)
+
+
+def proximos_horarios_especialidade(especialidade, a_partir_de=None, limite=10, horizonte_dias=MAX_DIAS_PERIODO):
+    """Retorna os `limite` próximos horários livres entre todos os médicos da especialidade.
+
+    A agenda é percorrida em lotes de LOTE_DIAS_PROXIMOS dias: para cada lote é feita
+    uma única consulta das consultas ativas de todos os médicos, cujos intervalos são
+    cruzados com a grade de cada um, e os horários livres são intercalados em ordem
+    cronológica (heapq.merge). Os bloqueios de todo o horizonte são lidos uma única vez.
+    """
+    from .models import Consulta
+
+    if a_partir_de is None:
+        a_partir_de = timezone.now()
+    elif timezone.is_naive(a_partir_de):
+        a_partir_de = timezone.make_aware(a_partir_de)
+
+    medicos = list(especialidade.medicos.all())
+    if not medicos or limite <= 0:
+        return []
+    por_id = {medico.id: medico for medico in medicos}
+
+    local_tz = timezone.get_current_timezone()
+    primeiro_dia = timezone.localtime(a_partir_de, local_tz).date()
+    ultimo_dia = primeiro_dia + timedelta(days=horizonte_dias - 1)
+    bloqueados = {}
+    aplicar_bloqueios(bloqueados, medicos, agrupar_bloqueios(
+        bloqueios_periodo([medico.id for medico in medicos], primeiro_dia, ultimo_dia), primeiro_dia, ultimo_dia,
+    ))
+
+    resultado = []
+    inicio = primeiro_dia
+    while inicio <= ultimo_dia and len(resultado) < limite:
+        fim = min(inicio + timedelta(days=LOTE_DIAS_PROXIMOS - 1), ultimo_dia)
+
+        inicio_dt, fim_dt = periodo_local(inicio, fim, local_tz)
+        consultas = Consulta.objects.filter(
+            medico__in=medicos,
+            data_hora__gte=inicio_dt,
+            data_hora__lt=fim_dt,
+            status__in=STATUS_OCUPADOS,
+        ).values_list('medico_id', 'data_hora', 'duracao_minutos')
+
+        intervalos = {}
+        for medico_id, data_hora, duracao in consultas:
+            local = timezone.localtime(data_hora, local_tz)
+            intervalos.setdefault((medico_id, local.date()), []).append(intervalo_consulta(local, duracao))
+        ocupados = {chave: set(horarios) for chave, horarios in bloqueados.items() if inicio <= chave[1] <= fim}
+        for (medico_id, data), intervalos_dia in intervalos.items():
+            medico = por_id[medico_id]
+            ocupados.setdefault((medico_id, data), set()).update(
+                slots_em_conflito(medico.grade_horarios, medico.duracao_slot, intervalos_dia),
+            )
+
+        geradores = [_slots_do_medico(medico, inicio, fim, a_partir_de, ocupados) for medico in medicos]
+        for data_hora, _, medico in heapq.merge(*geradores, key=lambda item: item[:2]):
+            resultado.append({'medico': medico, 'data_hora': data_hora})
+            if len(resultado) >= limite:
+                break
+
+        inicio = fim + timedelta(days=1)
+
+    return resultado
@@ -0,0 +1,100 @@
+import re
+import unicodedata
+
+# Limites da busca incremental (typeahead)
+LIMITE_PADRAO_BUSCA = 10
+MAX_LIMITE_BUSCA = 20
+MIN_CARACTERES_BUSCA = 2
+
+# Maior caractere possível, usado para transformar um prefixo em intervalo [prefixo, prefixo + FIM)
+FIM_PREFIXO = '\U0010ffff'
+
+
+def normalizar_texto(valor):
+    """Remove acentos, converte para minúsculas e normaliza os espaços ('Ângela  Simões' -> 'angela simoes')"""
+    decomposto = unicodedata.normalize('NFKD', valor or '')
+    sem_acentos = ''.join(c for c in decomposto if not unicodedata.combining(c))
+    return ' '.join(sem_acentos.casefold().split())
+
+
+def somente_digitos(valor):
+    """Mantém apenas os dígitos ('123.456.789-00' -> '12345678900')"""
+    return re.sub(r'\D', '', valor or '')
+
+
+def termos_busca(nome):
+    """Retorna os termos indexados de um nome (palavras normalizadas, sem repetição)"""
+    return sorted(set(re.findall(r'\w+', normalizar_texto(nome))))
+
+
+def filtro_prefixo(campo, prefixo):
+    """Filtro de prefixo como intervalo (campo >= prefixo e < prefixo + FIM), que usa índices B-tree"""
+    return {f'{campo}__gte': prefixo, f'{campo}__lt': prefixo + FIM_PREFIXO}
+
+
+def limitar(limite):
+    try:
+        limite = int(limite)
+    except (TypeError, ValueError):
+        return LIMITE_PADRAO_BUSCA
+    return max(1, min(limite, MAX_LIMITE_BUSCA))
+
+
+def filtrar_pacientes(pacientes, texto):
+    """Filtra pacientes por prefixo do CPF (somente dígitos) ou por prefixos das palavras do nome"""
+    from .models import PacienteTermo
+
+    texto = (texto or '').strip()
+    if texto and not re.search(r'[^\d.\-\s/]', texto):
+        digitos = somente_digitos(texto)
+        if len(digitos) < MIN_CARACTERES_BUSCA:
+            return pacientes.none()
+        return pacientes.filter(**filtro_prefixo('cpf_digitos', digitos)).order_by('cpf_digitos', 'id')
+
+    termos = re.findall(r'\w+', normalizar_texto(texto))
+    if not termos or len(''.join(termos)) < MIN_CARACTERES_BUSCA:
+        return pacientes.none()
+    # Cada palavra digitada deve ser prefixo de alguma palavra do nome
+    for termo in termos:
+        pacientes = pacientes.filter(
+            pk__in=PacienteTermo.objects.filter(**filtro_prefixo('termo', termo)).values('paciente_id')
+        )
+    return pacientes.order_by('nome_busca', 'id')
+
+
+def consultar_pacientes(texto, limite=LIMITE_PADRAO_BUSCA):
+    """Queryset com no máximo `limite` pacientes encontrados por filtrar_pacientes"""
+    from .models import Paciente
+
+    return filtrar_pacientes(Paciente.objects.all(), texto)[:limitar(limite)]
+
+
+def buscar_pacientes(texto, limite=LIMITE_PADRAO_BUSCA):
+    return list(consultar_pacientes(texto, limite))
+
+
+def consultar_medicos(texto, limite=LIMITE_PADRAO_BUSCA):
+    """Queryset de médicos por prefixo do CRM ou por prefixos das palavras do nome (sem acentos)"""
+    from .models import Medico, MedicoTermo
+
+    limite = limitar(limite)
+    texto = (texto or '').strip()
+    medicos = Medico.objects.select_related('especialidade')
+    if len(texto) < MIN_CARACTERES_BUSCA:
+        return medicos.none()
+
+    if texto.isdigit():
+        medicos = medicos.filter(**filtro_prefixo('crm', texto)).order_by('crm')
+    else:
+        # Cada palavra digitada deve ser prefixo de alguma palavra do nome, como em filtrar_pacientes
+        for termo in re.findall(r'\w+', normalizar_texto(texto)):
+            medicos = medicos.filter(
+                pk__in=MedicoTermo.objects.filter(**filtro_prefixo('termo', termo)).values('medico_id')
+            )
+        medicos = medicos.order_by('nome_busca', 'id')
+
+    return medicos[:limite]
+
+
+def buscar_medicos(texto, limite=LIMITE_PADRAO_BUSCA):
+    return list(consultar_medicos(texto, limite))
@@ -0,0 +1,91 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+
+from .agregados import ajustar_agregados, chave_agregado, deltas_alteracao
+from .cache import invalidar_ocupacao
+from .espera import agendar_encaixes, vaga_cancelada
+from .eventos import eventos_alteracao, horario_ocupado, publicar_eventos
+from .models import Consulta, Medico
+from .scheduling import DURACAO_MAXIMA_MINUTOS
+
+MENSAGEM_HORARIO_OCUPADO = 'Este horário já está ocupado para o médico selecionado. Escolha outro horário.'
+
+
+class _HorarioSobreposto(Exception):
+    """Desfaz a transação de salvar_consulta quando a consulta gravada se sobrepõe a outra"""
+
+
+def _sobreposta(consulta):
+    """True se outro agendamento ativo do médico se sobrepõe a [inicio, fim) da consulta.
+
+    Só os agendamentos que começam até DURACAO_MAXIMA_MINUTOS antes podem alcançá-la,
+    o que mantém a busca no índice (medico, data_hora).
+    """
+    inicio = consulta.data_hora
+    outras = Consulta.objects.filter(
+        medico_id=consulta.medico_id,
+        data_hora__gt=inicio - timedelta(minutes=DURACAO_MAXIMA_MINUTOS),
+        data_hora__lt=inicio + timedelta(minutes=consulta.duracao_minutos),
+    ).exclude(status='cancelada').exclude(pk=consulta.pk).values_list('data_hora', 'duracao_minutos')
+    return any(data_hora + timedelta(minutes=duracao) > inicio for data_hora, duracao in outras)
+
+
+def salvar_consulta(form):
+    """Salva a consulta do formulário de forma atômica, sem sobrepor outro agendamento ativo do médico.
+
+    Não há verificação prévia (check-then-insert): com a agenda do médico travada, a
+    consulta é gravada e só então confrontada com os intervalos das demais; havendo
+    sobreposição, ou se a restrição única do banco recusar o mesmo horário, a transação
+    é desfeita e o erro vai para o formulário. Retorna a consulta salva ou None.
+    """
+    instance = form.instance
+    nova = instance.pk is None
+    try:
+        with transaction.atomic():
+            if instance.status != 'cancelada':
+                # Serializa os agendamentos do mesmo médico (no SQLite, a própria escrita já serializa)
+                Medico.objects.select_for_update().filter(pk=instance.medico_id).first()
+            consulta = form.save()
+            if consulta.status != 'cancelada' and _sobreposta(consulta):
+                raise _HorarioSobreposto
+            return consulta
+    except _HorarioSobreposto:
+        if nova:
+            # O INSERT foi desfeito: o formulário volta a representar uma consulta nova
+            instance.pk = None
+            instance._state.adding = True
+    except IntegrityError:
+        ocupado = Consulta.objects.filter(
+            medico_id=instance.medico_id,
+            data_hora=instance.data_hora,
+        ).exclude(status='cancelada').exclude(pk=instance.pk).exists()
+        if not ocupado:
+            raise
+    form.add_error('hora', MENSAGEM_HORARIO_OCUPADO)
+    return None
+
+
+def registrar_alteracoes(alteracoes):
+    """Faz o que os sinais de Consulta fariam para inserções e alterações em lote.
+
+    `alteracoes` são tuplas (consulta_id, antes, depois, duracao_minutos), com antes e depois
+    no formato (medico_id, data_hora, status) ou None: avança os marcadores das agendas, invalida o
+    cache de ocupação, ajusta os agregados, publica os eventos de horário e oferece os
+    horários cancelados à lista de espera.
+    """
+    deltas = Counter()
+    eventos = []
+    estados = []
+    vagas = []
+    for consulta_id, antes, depois, duracao in alteracoes:
+        estados += [estado for estado in (antes, depois) if estado]
+        vagas.append(vaga_cancelada(antes, depois, duracao))
+        deltas.update(deltas_alteracao(antes and chave_agregado(*antes), depois and chave_agregado(*depois)))
+        eventos += eventos_alteracao(consulta_id, antes and horario_ocupado(*antes), depois and horario_ocupado(*depois))
+    Medico.marcar_agenda_alterada({medico_id for medico_id, _, _ in estados})
+    invalidar_ocupacao([(medico_id, data_hora) for medico_id, data_hora, _ in estados])
+    ajustar_agregados(deltas)
+    publicar_eventos(eventos)
+    agendar_encaixes(vagas)
@@ -0,0 +1,77 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .agregados import ajustar_agregados, chave_agregado, deltas_alteracao
+from .cache import invalidar_bloqueio, invalidar_ocupacao
+from .espera import agendar_encaixes, vaga_cancelada
+from .eventos import eventos_alteracao, horario_ocupado, publicar_eventos
+from .models import BloqueioAgenda, Consulta, Medico
+
+
+@receiver(post_save, sender=Consulta)
+def consulta_salva(sender, instance, created=False, raw=False, **kwargs):
+    """Atualiza marcador da agenda, cache de ocupação, eventos e agregados (também do médico/horário anterior).
+
+    Cancelamentos de agendamentos futuros também disparam o encaixe da lista de espera.
+    """
+    if raw:
+        return
+    medico_anterior = getattr(instance, '_medico_id_salvo', None)
+    data_hora_anterior = getattr(instance, '_data_hora_salva', None)
+    Medico.marcar_agenda_alterada({instance.medico_id, medico_anterior})
+    invalidar_ocupacao([
+        (instance.medico_id, instance.data_hora),
+        (medico_anterior, data_hora_anterior),
+    ])
+    status_anterior = getattr(instance, '_status_salvo', None)
+    publicar_eventos(eventos_alteracao(
+        instance.pk,
+        horario_ocupado(medico_anterior, data_hora_anterior, status_anterior),
+        horario_ocupado(instance.medico_id, instance.data_hora, instance.status),
+    ))
+    # Sem o estado carregado do banco não dá para saber o que mudou; reconstruir_agregados corrige
+    if created or status_anterior is not None:
+        ajustar_agregados(deltas_alteracao(
+            None if created else chave_agregado(medico_anterior, data_hora_anterior, status_anterior),
+            chave_agregado(instance.medico_id, instance.data_hora, instance.status),
+        ))
+    # Cancelamento de um agendamento futuro: oferecer o horário à lista de espera
+    agendar_encaixes([vaga_cancelada(
+        (medico_anterior, data_hora_anterior, status_anterior),
+        (instance.medico_id, instance.data_hora, instance.status),
+        instance.duracao_minutos,
+    )])
+    instance._medico_id_salvo = instance.medico_id
+    instance._data_hora_salva = instance.data_hora
+    instance._status_salvo = instance.status
+
+
+@receiver(post_delete, sender=Consulta)
+def consulta_excluida(sender, instance, origin=None, **kwargs):
+    Medico.marcar_agenda_alterada({instance.medico_id})
+    invalidar_ocupacao([(instance.medico_id, instance.data_hora)])
+    publicar_eventos(eventos_alteracao(
+        instance.pk, horario_ocupado(instance.medico_id, instance.data_hora, instance.status), None,
+    ))
+    # Na exclusão do médico os agregados dele são removidos em cascata (exclusões iniciadas mais acima,
+    # como a da especialidade, chegam aqui, mas decrementos nunca recriam linhas)
+    if getattr(origin, 'model', type(origin)) is not Medico:
+        ajustar_agregados(deltas_alteracao(chave_agregado(instance.medico_id, instance.data_hora, instance.status), None))
+
+
+@receiver(post_save, sender=BloqueioAgenda)
+def bloqueio_salvo(sender, instance, raw=False, **kwargs):
+    """Limpa o cache de ocupação do período do bloqueio (e do período anterior, se mudou)"""
+    if raw:
+        return
+    anterior = getattr(instance, '_periodo_salvo', None)
+    atual = (instance.medico_id, instance.data_inicio, instance.data_fim)
+    invalidar_bloqueio(*atual)
+    if anterior and anterior != atual:
+        invalidar_bloqueio(*anterior)
+    instance._periodo_salvo = atual
+
+
+@receiver(post_delete, sender=BloqueioAgenda)
+def bloqueio_excluido(sender, instance, **kwargs):
+    invalidar_bloqueio(instance.medico_id, instance.data_inicio, instance.data_fim)
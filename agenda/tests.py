@@ -1,3 +1,1879 @@
-from django.test import TestCase
+import threading
+from datetime import date, datetime, time, timedelta
 
-# Create your tests here.
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Especialidade, Medico, Paciente, Consulta
+
+
+def criar_medico(especialidade=None, **kwargs):
+    if especialidade is None:
+        especialidade = Especialidade.objects.create(nome='Cardiologia')
+    dados = {
+        'nome': 'Dr. Teste',
+        'crm': '123456',
+        'especialidade': especialidade,
+        'dias_trabalho': 'segunda,terca,quarta,quinta,sexta',
+        'hora_inicio': time(9, 0),
+        'hora_fim': time(12, 0),
+    }
+    dados.update(kwargs)
+    return Medico.objects.create(**dados)
+
+
+def criar_paciente(**kwargs):
+    dados = {
+        'nome': 'Paciente Teste',
+        'data_nascimento': date(1990, 1, 1),
+        'cpf': '111.111.111-11',
+    }
+    dados.update(kwargs)
+    return Paciente.objects.create(**dados)
+
+
+def data_hora_local(data, hora):
+    return timezone.make_aware(datetime.combine(data, hora))
+
+
+class DisponibilidadePeriodoTests(TestCase):
+    def setUp(self):
+        self.medico = criar_medico()
+        self.paciente = criar_paciente()
+        self.url = reverse('medico_availability_range', args=[self.medico.id])
+
+    def test_retorna_apenas_dias_de_trabalho_com_horarios_livres(self):
+        # 2025-08-04 é uma segunda-feira
+        Consulta.objects.create(
+            paciente=self.paciente, medico=self.medico,
+            data_hora=data_hora_local(date(2025, 8, 4), time(9, 45)),
+        )
+        Consulta.objects.create(
+            paciente=self.paciente, medico=self.medico,
+            data_hora=data_hora_local(date(2025, 8, 5), time(9, 0)),
+            status='cancelada',
+        )
+
+        response = self.client.get(self.url, {'start': '2025-08-04', 'end': '2025-08-10'})
+
+        self.assertEqual(response.status_code, 200)
+        dias = {dia['data']: dia['horarios_disponiveis'] for dia in response.json()['dias']}
+        self.assertEqual(list(dias), ['2025-08-04', '2025-08-05', '2025-08-06', '2025-08-07', '2025-08-08'])
+        self.assertEqual(dias['2025-08-04'], ['09:00', '10:30', '11:15'])
+        self.assertEqual(dias['2025-08-05'], ['09:00', '09:45', '10:30', '11:15'])
+
+    def test_usa_uma_unica_consulta_para_todo_o_periodo(self):
+        # Uma consulta para o médico, uma para as consultas e uma para os bloqueios do período
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, {'start': '2025-08-01', 'end': '2025-09-29'})
+        self.assertEqual(len(response.json()['dias']), 42)
+
+    def test_exclui_consulta_em_edicao(self):
+        consulta = Consulta.objects.create(
+            paciente=self.paciente, medico=self.medico,
+            data_hora=data_hora_local(date(2025, 8, 4), time(9, 0)),
+        )
+        response = self.client.get(self.url, {
+            'start': '2025-08-04', 'end': '2025-08-04', 'consulta_id': consulta.id,
+        })
+        self.assertIn('09:00', response.json()['dias'][0]['horarios_disponiveis'])
+
+    def test_parametros_invalidos(self):
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'start': '2025-08-10', 'end': '2025-08-01'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'start': '2025-01-01', 'end': '2025-12-31'}).status_code, 400)
+
+
+class ProximosHorariosEspecialidadeTests(TestCase):
+    def setUp(self):
+        self.especialidade = Especialidade.objects.create(nome='Cardiologia')
+        self.medico_a = criar_medico(self.especialidade, nome='Dra. A', crm='1', hora_inicio=time(9, 0), hora_fim=time(10, 30))
+        self.medico_b = criar_medico(self.especialidade, nome='Dr. B', crm='2', hora_inicio=time(9, 30), hora_fim=time(11, 0),
+                                     dias_trabalho='terca')
+        self.paciente = criar_paciente()
+        self.url = reverse('especialidade_proximos_horarios_api', args=[self.especialidade.id])
+
+    def test_intercala_horarios_dos_medicos_em_ordem_cronologica(self):
+        # 2025-08-04 é uma segunda-feira; Dr. B só atende às terças
+        Consulta.objects.create(
+            paciente=self.paciente, medico=self.medico_a,
+            data_hora=data_hora_local(date(2025, 8, 5), time(9, 0)),
+        )
+        response = self.client.get(self.url, {'a_partir_de': '2025-08-04T09:30', 'limite': 5})
+
+        horarios = [(h['data'], h['hora'], h['medico_id']) for h in response.json()['horarios']]
+        self.assertEqual(horarios, [
+            ('2025-08-04', '09:45', self.medico_a.id),
+            ('2025-08-05', '09:30', self.medico_b.id),
+            ('2025-08-05', '09:45', self.medico_a.id),
+            ('2025-08-05', '10:15', self.medico_b.id),
+            ('2025-08-06', '09:00', self.medico_a.id),
+        ])
+
+    def test_numero_de_consultas_independe_do_numero_de_medicos(self):
+        for i in range(10):
+            criar_medico(self.especialidade, nome=f'Dr. {i}', crm=f'x{i}')
+        # Especialidade, médicos, bloqueios do horizonte e um lote de consultas ocupadas
+        with self.assertNumQueries(4):
+            response = self.client.get(self.url, {'a_partir_de': '2025-08-04T09:00', 'limite': 50})
+        self.assertEqual(len(response.json()['horarios']), 50)
+
+    def test_pagina_da_especialidade(self):
+        response = self.client.get(
+            reverse('especialidade_proximos_horarios', args=[self.especialidade.id]),
+            {'a_partir_de': '2025-08-04T09:00', 'limite': 3},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['horarios']), 3)
+        self.assertContains(response, f'?medico={self.medico_a.pk}&amp;data=2025-08-04&amp;hora=09:00')
+
+
+class GradeTrabalhoMedicoTests(TestCase):
+    def test_mascara_calculada_a_partir_dos_dias(self):
+        medico = criar_medico(dias_trabalho='segunda,quarta,domingo')
+        medico.refresh_from_db()
+        self.assertEqual(medico.dias_trabalho_mascara, 0b1000101)
+        self.assertEqual(medico.dias_trabalho_indices, (0, 2, 6))
+        self.assertTrue(medico.trabalha_no_dia('quarta'))
+        self.assertFalse(medico.trabalha_no_dia('terca'))
+        self.assertTrue(medico.trabalha_na_data(date(2025, 8, 10)))  # domingo
+        self.assertEqual(medico.get_dias_trabalho_display(), 'Segunda-feira, Quarta-feira, Domingo')
+
+    def test_grade_de_horarios_pre_calculada(self):
+        medico = criar_medico()
+        self.assertEqual(medico.grade_horarios.rotulos, ('09:00', '09:45', '10:30', '11:15'))
+        self.assertIs(medico.grade_horarios, Medico.objects.get(pk=medico.pk).grade_horarios)
+
+    def test_medico_form_atualiza_mascara(self):
+        from .forms import MedicoForm
+
+        medico = criar_medico()
+        form = MedicoForm(instance=medico)
+        self.assertEqual(form.fields['dias_trabalho'].initial, ['segunda', 'terca', 'quarta', 'quinta', 'sexta'])
+
+        form = MedicoForm({
+            'nome': medico.nome, 'crm': medico.crm, 'especialidade': medico.especialidade_id,
+            'dias_trabalho': ['sabado'], 'hora_inicio': '08:00', 'hora_fim': '10:00',
+        }, instance=medico)
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        medico.refresh_from_db()
+        self.assertEqual(medico.dias_trabalho_indices, (5,))
+
+    def test_consulta_form_valida_dia_e_horario(self):
+        from .forms import ConsultaForm
+
+        medico = criar_medico()
+        paciente = criar_paciente()
+        dados = {'paciente': paciente.pk, 'medico': medico.pk, 'status': 'agendada'}
+
+        self.assertTrue(ConsultaForm({**dados, 'data': '2025-08-04', 'hora': '09:45'}).is_valid())
+        self.assertIn('hora', ConsultaForm({**dados, 'data': '2025-08-04', 'hora': '09:30'}).errors)
+        self.assertIn('hora', ConsultaForm({**dados, 'data': '2025-08-09', 'hora': '09:45'}).errors)
+
+
+class AgendamentoSemConflitoTests(TestCase):
+    def setUp(self):
+        self.medico = criar_medico()
+        self.paciente = criar_paciente()
+        self.dados = {
+            'paciente': self.paciente.pk, 'medico': self.medico.pk, 'status': 'agendada',
+            'data': '2025-08-04', 'hora': '09:45',
+        }
+
+    def test_horario_ocupado_vira_erro_do_formulario(self):
+        Consulta.objects.create(
+            paciente=self.paciente, medico=self.medico,
+            data_hora=data_hora_local(date(2025, 8, 4), time(9, 45)),
+        )
+        response = self.client.post(reverse('consulta_create'), self.dados)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('hora', response.context['form'].errors)
+        self.assertEqual(Consulta.objects.count(), 1)
+
+    def test_horario_de_consulta_cancelada_pode_ser_reutilizado(self):
+        Consulta.objects.create(
+            paciente=self.paciente, medico=self.medico,
+            data_hora=data_hora_local(date(2025, 8, 4), time(9, 45)),
+            status='cancelada',
+        )
+        response = self.client.post(reverse('consulta_create'), self.dados)
+
+        self.assertRedirects(response, reverse('consulta_list'))
+        self.assertEqual(Consulta.objects.count(), 2)
+
+    def test_salvar_nao_verifica_o_horario_antes_de_inserir(self):
+        from .forms import ConsultaForm
+        from .services import salvar_consulta
+
+        form = ConsultaForm(self.dados)
+        self.assertTrue(form.is_valid())
+        # A trava da agenda do médico, o INSERT, a atualização do marcador da agenda, o upsert do
+        # agregado e só então a conferência de sobreposição, dentro de um savepoint
+        with self.assertNumQueries(7):
+            self.assertIsNotNone(salvar_consulta(form))
+
+
+class AgendamentoConcorrenteTests(TransactionTestCase):
+    NUM_RECEPCIONISTAS = 8
+
+    def test_agendamentos_paralelos_no_mesmo_horario(self):
+        from .forms import ConsultaForm
+        from .services import salvar_consulta
+
+        medico = criar_medico()
+        pacientes = [criar_paciente(cpf=f'000.000.000-{i:02d}') for i in range(self.NUM_RECEPCIONISTAS)]
+        barreira = threading.Barrier(self.NUM_RECEPCIONISTAS)
+        resultados = []
+
+        def agendar(paciente):
+            try:
+                form = ConsultaForm({
+                    'paciente': paciente.pk, 'medico': medico.pk, 'status': 'agendada',
+                    'data': '2025-08-04', 'hora': '10:30',
+                })
+                self.assertTrue(form.is_valid())
+                barreira.wait()
+                resultados.append(salvar_consulta(form) is not None)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=agendar, args=(paciente,)) for paciente in pacientes]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(resultados), self.NUM_RECEPCIONISTAS)
+        self.assertEqual(resultados.count(True), 1)
+        self.assertEqual(Consulta.objects.filter(medico=medico).count(), 1)
+
+
+class OrcamentoDeConsultasSQLTests(TestCase):
+    """Cada página deve executar um número fixo de consultas SQL, independente do número de linhas"""
+
+    def popular(self, quantidade):
+        especialidade = Especialidade.objects.create(nome=f'Especialidade {quantidade}')
+        for i in range(quantidade):
+            medico = criar_medico(especialidade, nome=f'Médico {i}', crm=f'{quantidade}-{i}')
+            paciente = criar_paciente(nome=f'Paciente {i}', cpf=f'{quantidade}-{i}')
+            for dia in (4, 5):
+                Consulta.objects.create(
+                    paciente=paciente, medico=medico,
+                    data_hora=data_hora_local(date(2025, 8, dia), time(9, 0)),
+                )
+        return especialidade, medico, paciente, Consulta.objects.filter(medico=medico).first()
+
+    def assertOrcamento(self, orcamento, nome_url, *objetos):
+        for quantidade in (1, 12):
+            Consulta.objects.all().delete()
+            Medico.objects.all().delete()
+            Paciente.objects.all().delete()
+            Especialidade.objects.all().delete()
+            criados = self.popular(quantidade)
+            args = [criados[indice].pk for indice in objetos]
+            with self.subTest(url=nome_url, linhas=quantidade), self.assertNumQueries(orcamento):
+                response = self.client.get(reverse(nome_url, args=args))
+                self.assertEqual(response.status_code, 200)
+
+    def test_listas(self):
+        self.assertOrcamento(1, 'especialidade_list')
+        self.assertOrcamento(1, 'medico_list')
+        # Contagem para a paginação e a página de pacientes
+        self.assertOrcamento(2, 'paciente_list')
+        # Página de consultas e opções do filtro de especialidade
+        self.assertOrcamento(2, 'consulta_list')
+
+    def test_detalhes(self):
+        self.assertOrcamento(2, 'especialidade_detail', 0)
+        self.assertOrcamento(2, 'medico_detail', 1)
+        self.assertOrcamento(2, 'paciente_detail', 2)
+        self.assertOrcamento(1, 'consulta_detail', 3)
+
+    def test_confirmacoes_de_exclusao(self):
+        self.assertOrcamento(2, 'especialidade_delete', 0)
+        self.assertOrcamento(2, 'medico_delete', 1)
+        self.assertOrcamento(2, 'paciente_delete', 2)
+        self.assertOrcamento(1, 'consulta_delete', 3)
+
+    def test_formulario_de_consulta(self):
+        # Paciente e médico são buscados sob demanda (autocomplete), sem carregar as tabelas
+        self.assertOrcamento(0, 'consulta_create')
+
+
+class ConsultaListFiltroPaginacaoTests(TestCase):
+    def setUp(self):
+        self.medico = criar_medico()
+        self.outro_medico = criar_medico(self.medico.especialidade, nome='Dr. Outro', crm='999')
+        self.paciente = criar_paciente()
+        self.consultas = []
+        for dia in range(1, 29):
+            self.consultas.append(Consulta.objects.create(
+                paciente=self.paciente, medico=self.medico,
+                data_hora=data_hora_local(date(2025, 8, dia), time(9, 0)),
+                status='cancelada' if dia % 7 == 0 else 'agendada',
+            ))
+        Consulta.objects.create(
+            paciente=criar_paciente(cpf='222'), medico=self.outro_medico,
+            data_hora=data_hora_local(date(2025, 9, 1), time(9, 0)),
+        )
+        self.url = reverse('consulta_list')
+
+    def test_filtros(self):
+        def total(**params):
+            return len(self.client.get(self.url, params).context['consulta_list'])
+
+        self.assertEqual(total(status='cancelada'), 4)
+        self.assertEqual(total(medico=self.outro_medico.pk), 1)
+        self.assertEqual(total(paciente=self.paciente.pk, data_inicio='2025-08-10', data_fim='2025-08-12'), 3)
+
+    def test_paginacao_por_cursor(self):
+        primeira = self.client.get(self.url, {'medico': self.medico.pk}).context
+        self.assertTrue(primeira['is_paginated'])
+        self.assertEqual(len(primeira['consulta_list']), 25)
+        self.assertEqual(primeira['consulta_list'][0], self.consultas[-1])
+        self.assertIsNone(primeira['page_obj'].cursor_anterior)
+
+        segunda = self.client.get(self.url, {
+            'medico': self.medico.pk, 'apos': primeira['page_obj'].cursor_proximo,
+        }).context
+        self.assertEqual(segunda['consulta_list'], self.consultas[2::-1])
+        self.assertIsNone(segunda['page_obj'].cursor_proximo)
+
+        volta = self.client.get(self.url, {
+            'medico': self.medico.pk, 'antes': segunda['page_obj'].cursor_anterior,
+        }).context
+        self.assertEqual(volta['consulta_list'], primeira['consulta_list'])
+
+    def test_custo_da_pagina_independe_da_posicao(self):
+        from django.test.utils import CaptureQueriesContext
+
+        cursor = self.client.get(self.url).context['page_obj'].cursor_proximo
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(self.url, {'apos': cursor})
+        sql = consultas.captured_queries[0]['sql']
+        self.assertNotIn('OFFSET', sql.upper())
+
+    def test_cursor_invalido_volta_para_a_primeira_pagina(self):
+        response = self.client.get(self.url, {'apos': 'invalido'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['consulta_list']), 25)
+
+
+class BuscaPacientesMedicosTests(TestCase):
+    def setUp(self):
+        self.angela = criar_paciente(nome='Ângela Simões da Silva', cpf='123.456.789-00')
+        self.joao = criar_paciente(nome='João Silva', cpf='987.654.321-00')
+        self.medico = criar_medico(nome='Dra. Lúcia Araújo', crm='445566')
+
+    def buscar(self, nome_url, q, **params):
+        response = self.client.get(reverse(nome_url), {'q': q, **params})
+        return [item['id'] for item in response.json()['resultados']]
+
+    def test_busca_por_prefixos_do_nome_sem_acentos(self):
+        self.assertEqual(self.buscar('paciente_busca_api', 'angela'), [self.angela.id])
+        self.assertEqual(self.buscar('paciente_busca_api', 'SIM ang'), [self.angela.id])
+        self.assertEqual(self.buscar('paciente_busca_api', 'silv'), [self.angela.id, self.joao.id])
+        self.assertEqual(self.buscar('paciente_busca_api', 'x'), [])
+
+    def test_busca_por_cpf(self):
+        self.assertEqual(self.buscar('paciente_busca_api', '123.45'), [self.angela.id])
+        self.assertEqual(self.buscar('paciente_busca_api', '98765432100'), [self.joao.id])
+
+    def test_termos_reindexados_quando_o_nome_muda(self):
+        self.joao.nome = 'João Pereira'
+        self.joao.save()
+        self.assertEqual(self.buscar('paciente_busca_api', 'pereira'), [self.joao.id])
+        self.assertEqual(self.buscar('paciente_busca_api', 'silva'), [self.angela.id])
+
+    def test_limite_de_resultados(self):
+        for i in range(30):
+            criar_paciente(nome=f'Silva {i}', cpf=f'000{i}')
+        self.assertEqual(len(self.buscar('paciente_busca_api', 'silva', limite=1000)), 20)
+        self.assertEqual(len(self.buscar('paciente_busca_api', 'silva', limite=3)), 3)
+
+    def test_busca_de_medicos(self):
+        self.assertEqual(self.buscar('medico_busca_api', 'lucia'), [self.medico.id])
+        self.assertEqual(self.buscar('medico_busca_api', 'araujo'), [self.medico.id])
+        self.assertEqual(self.buscar('medico_busca_api', '4455'), [self.medico.id])
+        # Prefixos das palavras do nome, em qualquer ordem (pelo índice de termos, não por substring)
+        self.assertEqual(self.buscar('medico_busca_api', 'ara luc'), [self.medico.id])
+        self.assertEqual(self.buscar('medico_busca_api', 'raujo'), [])
+
+        self.medico.nome = 'Dra. Lúcia Mendes'
+        self.medico.save()
+        self.assertEqual(self.buscar('medico_busca_api', 'mend'), [self.medico.id])
+        self.assertEqual(self.buscar('medico_busca_api', 'araujo'), [])
+
+    def test_formulario_renderiza_apenas_a_opcao_selecionada(self):
+        from .forms import ConsultaForm
+
+        html = str(ConsultaForm(initial={'paciente': self.joao.pk})['paciente'])
+        self.assertIn('João Silva', html)
+        self.assertNotIn('Ângela', html)
+
+    def test_valores_nao_numericos_na_url(self):
+        for nome_url, campo in [
+            ('consulta_list', 'paciente'), ('consulta_create', 'medico'),
+            ('bloqueio_create', 'medico'), ('lista_espera_create', 'paciente'),
+        ]:
+            with self.subTest(nome_url=nome_url):
+                response = self.client.get(reverse(nome_url), {campo: 'abc'})
+                self.assertEqual(response.status_code, 200)
+                self.assertNotContains(response, self.joao.nome)
+
+    def test_lista_de_pacientes_com_busca(self):
+        response = self.client.get(reverse('paciente_list'), {'q': '987'})
+        self.assertEqual(list(response.context['paciente_list']), [self.joao])
+
+
+class ImportarDadosCommandTests(TestCase):
+    def setUp(self):
+        import tempfile
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.diretorio.cleanup)
+
+    def arquivo(self, nome, conteudo):
+        import os
+        caminho = os.path.join(self.diretorio.name, nome)
+        with open(caminho, 'w', encoding='utf-8') as arquivo:
+            arquivo.write(conteudo)
+        return caminho
+
+    def importar(self, modelo, caminho, lote=2):
+        import io
+        import json
+        from django.core.management import call_command
+
+        saida = io.StringIO()
+        call_command('importar_dados', modelo, caminho, lote=lote, stdout=saida)
+        rejeitados = {}
+        with open(f'{caminho}.rejeitados.jsonl', encoding='utf-8') as arquivo:
+            for linha in arquivo:
+                registro = json.loads(linha)
+                rejeitados[registro['linha']] = registro['erros']
+        return saida.getvalue(), rejeitados
+
+    def test_importacao_completa_com_rejeitados(self):
+        self.importar('especialidade', self.arquivo('especialidades.csv', 'nome,descricao\nCardiologia,Coração\n'))
+        saida, rejeitados = self.importar('medico', self.arquivo('medicos.jsonl', '\n'.join([
+            '{"nome": "Dra. Ana", "crm": "100", "especialidade": "Cardiologia", "dias_trabalho": "segunda,terca", "hora_inicio": "09:00", "hora_fim": "12:00"}',
+            '{"nome": "Dr. Repetido", "crm": "100", "especialidade": "Cardiologia"}',
+            '{"nome": "Dr. Sem Especialidade", "crm": "101", "especialidade": "Inexistente"}',
+            'não é json',
+        ])))
+        self.assertIn('1 de 4 linhas importadas', saida)
+        self.assertEqual(sorted(rejeitados), [2, 3, 4])
+
+        _, rejeitados = self.importar('paciente', self.arquivo('pacientes.csv', '\n'.join([
+            'nome,cpf,data_nascimento',
+            'Maria José,111.222.333-44,01/02/1980',
+            'Outra Maria,11122233344,1985-01-01',
+            'João,555.666.777-88,1990-13-01',
+            'José,999.888.777-66,1970-05-05',
+        ])))
+        self.assertEqual(sorted(rejeitados), [3, 4])
+        self.assertEqual(Paciente.objects.count(), 2)
+        self.assertEqual(Paciente.objects.get(cpf='111.222.333-44').termos_busca.count(), 2)
+
+        _, rejeitados = self.importar('consulta', self.arquivo('consultas.csv', '\n'.join([
+            'paciente_cpf,medico_crm,data_hora,status',
+            '111.222.333-44,100,2025-08-04 09:00,agendada',
+            '999.888.777-66,100,2025-08-04 09:00,agendada',
+            '999.888.777-66,100,2025-08-04 09:30,agendada',
+            '999.888.777-66,100,2025-08-06 09:00,agendada',
+            '999.888.777-66,100,2025-08-04 09:00,cancelada',
+            '000.000.000-00,100,2025-08-05 09:00,agendada',
+        ])))
+        self.assertEqual(sorted(rejeitados), [3, 4, 5, 7])
+        self.assertEqual(Consulta.objects.count(), 2)
+        self.assertEqual(Consulta.objects.get(status='agendada').data_hora, data_hora_local(date(2025, 8, 4), time(9, 0)))
+
+    def test_conflitos_em_lote_fora_de_ordem(self):
+        from .importacao import importar
+
+        medico = criar_medico()
+        paciente = criar_paciente()
+        Consulta.objects.create(paciente=paciente, medico=medico, data_hora=data_hora_local(date(2030, 1, 7), time(10, 30)))
+        linhas = [
+            {'paciente_cpf': paciente.cpf, 'medico_crm': medico.crm, 'data_hora': data_hora, 'duracao_minutos': duracao}
+            for data_hora, duracao in [
+                ('2032-01-05 09:00', ''),
+                ('2030-01-07 09:45', '60'),  # alcança a consulta existente das 10h30
+                ('2030-01-07 11:15', ''),
+                ('2032-01-05 09:00', ''),  # repetida dentro do lote
+            ]
+        ]
+        rejeitados = []
+        resultado = importar(
+            'consulta', enumerate(linhas, start=2), rejeitar=lambda numero, dados, erros: rejeitados.append(numero),
+        )
+        self.assertEqual((resultado.importadas, rejeitados), (2, [3, 5]))
+
+    def test_consultas_por_lote_nao_crescem_com_o_lote(self):
+        from django.test.utils import CaptureQueriesContext
+
+        linhas = ['nome,cpf,data_nascimento'] + [f'Paciente {i},{i:011d},1990-01-01' for i in range(50)]
+        caminho = self.arquivo('pacientes.csv', '\n'.join(linhas))
+        with CaptureQueriesContext(connection) as consultas:
+            self.importar('paciente', caminho, lote=50)
+        self.assertEqual(Paciente.objects.count(), 50)
+        self.assertLess(len(consultas), 10)
+
+
+class ExportacaoConsultasTests(TestCase):
+    def setUp(self):
+        self.cardiologia = Especialidade.objects.create(nome='Cardiologia')
+        self.pediatria = Especialidade.objects.create(nome='Pediatria')
+        self.medico = criar_medico(self.cardiologia, nome='Dra. Ana')
+        self.pediatra = criar_medico(self.pediatria, nome='Dr. Beto', crm='654321')
+        self.paciente = criar_paciente(nome='Maria, da Silva')
+        Consulta.objects.create(
+            paciente=self.paciente, medico=self.medico,
+            data_hora=data_hora_local(date(2025, 8, 4), time(9, 0)), observacoes='Retorno; trazer exames',
+        )
+        Consulta.objects.create(
+            paciente=self.paciente, medico=self.pediatra,
+            data_hora=data_hora_local(date(2025, 8, 5), time(9, 45)), status='cancelada',
+        )
+
+    def exportar(self, formato, **filtros):
+        response = self.client.get(reverse('consulta_exportar', args=[formato]), filtros)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_csv_com_filtro_por_especialidade(self):
+        import csv
+        import io
+
+        linhas = list(csv.reader(io.StringIO(self.exportar('csv'))))
+        self.assertEqual(len(linhas), 3)
+        self.assertEqual(linhas[1][1:4], ['2025-08-04', '09:00', 'agendada'])
+
+        linhas = list(csv.reader(io.StringIO(self.exportar('csv', especialidade=self.pediatria.pk))))
+        self.assertEqual(len(linhas), 2)
+        self.assertEqual(linhas[1][6], 'Dr. Beto')
+
+    def test_ics(self):
+        conteudo = self.exportar('ics', status='agendada')
+        self.assertTrue(conteudo.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertEqual(conteudo.count('BEGIN:VEVENT'), 1)
+        # 09:00 em São Paulo (UTC-3) = 12:00 UTC; consulta de 45 minutos
+        self.assertIn('DTSTART:20250804T120000Z', conteudo)
+        self.assertIn('DTEND:20250804T124500Z', conteudo)
+        self.assertIn('Retorno\\; trazer exames', conteudo)
+        self.assertTrue(all(len(linha.encode()) <= 75 for linha in conteudo.split('\r\n')))
+
+    def test_filtros_invalidos_e_formato_desconhecido(self):
+        url = reverse('consulta_exportar', args=['csv'])
+        self.assertEqual(self.client.get(url, {'data_inicio': 'ontem'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('consulta_exportar', args=['xls'])).status_code, 404)
+
+    def test_consultas_constantes_no_streaming(self):
+        for i in range(30):
+            Consulta.objects.create(
+                paciente=criar_paciente(nome=f'Paciente {i}', cpf=f'cpf-{i}'), medico=self.medico,
+                data_hora=data_hora_local(date(2025, 9, 1 + i % 5), time(9, 0)) + timezone.timedelta(days=7 * (i // 5)),
+            )
+        with self.assertNumQueries(1):
+            conteudo = self.exportar('csv')
+        self.assertEqual(conteudo.count('\r\n'), 33)
+
+    def test_comando(self):
+        import io
+        from django.core.management import call_command
+
+        saida = io.StringIO()
+        call_command('exportar_consultas', formato='ics', medico=self.medico.pk, stdout=saida)
+        self.assertEqual(saida.getvalue().count('BEGIN:VEVENT'), 1)
+
+
+class FeedAgendaMedicoTests(TestCase):
+    def setUp(self):
+        self.medico = criar_medico()
+        self.outro = criar_medico(self.medico.especialidade, nome='Dr. Outro', crm='999')
+        self.paciente = criar_paciente()
+        self.consulta = Consulta.objects.create(
+            paciente=self.paciente, medico=self.medico,
+            data_hora=timezone.now().replace(microsecond=0) + timezone.timedelta(days=1),
+        )
+        self.url = reverse('medico_agenda_ics', args=[self.medico.pk])
+
+    def versao(self, medico):
+        medico.refresh_from_db()
+        return medico.agenda_versao
+
+    def test_marcador_acompanha_alteracoes(self):
+        self.assertEqual(self.versao(self.medico), 1)
+        consulta = Consulta.objects.get(pk=self.consulta.pk)
+        consulta.medico = self.outro
+        consulta.save()
+        self.assertEqual((self.versao(self.medico), self.versao(self.outro)), (2, 1))
+        consulta.delete()
+        self.assertEqual(self.versao(self.outro), 2)
+
+    def test_get_condicional(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content).decode().count('BEGIN:VEVENT'), 1)
+        etag, ultima_alteracao = response['ETag'], response['Last-Modified']
+
+        # Sem alterações: 304 com apenas a leitura do marcador
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=ultima_alteracao)
+        self.assertEqual(response.status_code, 304)
+
+        self.consulta.status = 'cancelada'
+        self.consulta.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('STATUS:CANCELLED', b''.join(response.streaming_content).decode())
+
+    def test_medico_inexistente(self):
+        self.assertEqual(self.client.get(reverse('medico_agenda_ics', args=[0])).status_code, 404)
+
+
+class CacheDisponibilidadeTests(TransactionTestCase):
+    """A ocupação diária fica em cache e é invalidada pelas alterações de consultas"""
+
+    def setUp(self):
+        from .cache import cache_agenda, estatisticas
+
+        cache_agenda().clear()
+        estatisticas.zerar()
+        self.addCleanup(cache_agenda().clear)
+        self.medico = criar_medico()
+        self.paciente = criar_paciente()
+        self.data = date(2025, 8, 4)
+        self.url = reverse('medico_availability', args=[self.medico.pk])
+
+    def disponiveis(self, **params):
+        response = self.client.get(self.url, {'data': self.data.isoformat(), **params})
+        return [horario['value'] for horario in response.json()['horarios_disponiveis']]
+
+    def test_acertos_e_invalidacao(self):
+        from .cache import estatisticas
+
+        self.assertEqual(self.disponiveis(), ['09:00', '09:45', '10:30', '11:15'])
+        # Segunda chamada: apenas a leitura do médico, a ocupação vem do cache
+        with self.assertNumQueries(1):
+            self.assertEqual(self.disponiveis(), ['09:00', '09:45', '10:30', '11:15'])
+        self.assertEqual((estatisticas.acertos, estatisticas.falhas), (1, 1))
+
+        consulta = Consulta.objects.create(
+            paciente=self.paciente, medico=self.medico, data_hora=data_hora_local(self.data, time(9, 45)),
+        )
+        self.assertEqual(self.disponiveis(), ['09:00', '10:30', '11:15'])
+        self.assertEqual(self.disponiveis(consulta_id=consulta.pk), ['09:00', '09:45', '10:30', '11:15'])
+
+        # Mudança de dia invalida também o dia anterior
+        consulta = Consulta.objects.get(pk=consulta.pk)
+        consulta.data_hora = data_hora_local(date(2025, 8, 5), time(9, 0))
+        consulta.save()
+        self.assertEqual(self.disponiveis(), ['09:00', '09:45', '10:30', '11:15'])
+
+        self.data = date(2025, 8, 5)
+        self.assertEqual(self.disponiveis(), ['09:45', '10:30', '11:15'])
+        consulta.delete()
+        self.assertEqual(self.disponiveis(), ['09:00', '09:45', '10:30', '11:15'])
+
+        response = self.client.get(reverse('disponibilidade_cache_api'))
+        self.assertEqual(response.json()['falhas'], estatisticas.falhas)
+
+    def test_expediente_alterado_usa_a_grade_atual(self):
+        self.disponiveis()
+        self.medico.hora_fim = time(10, 30)
+        self.medico.save()
+        self.assertEqual(self.disponiveis(), ['09:00', '09:45'])
+
+    def test_nada_e_gravado_dentro_de_transacao(self):
+        from django.db import transaction
+        from .cache import cache_agenda, chave_ocupacao, chave_versao
+
+        with transaction.atomic():
+            Consulta.objects.create(
+                paciente=self.paciente, medico=self.medico, data_hora=data_hora_local(self.data, time(9, 0)),
+            )
+            self.assertEqual(self.disponiveis(), ['09:45', '10:30', '11:15'])
+            versao = cache_agenda().get(chave_versao(self.medico.pk, self.data))
+            self.assertIsNone(cache_agenda().get(chave_ocupacao(self.medico.pk, self.data, versao)))
+
+    def test_invalidacao_durante_a_carga_nao_grava_dados_antigos(self):
+        from .cache import invalidar_ocupacao, obter_ocupacao
+
+        cargas = []
+
+        def carregar(medico_id, inicio, fim):
+            # Outra requisição confirma uma consulta entre a leitura do banco e a gravação no cache
+            cargas.append((inicio, fim))
+            if len(cargas) == 1:
+                invalidar_ocupacao([(medico_id, data_hora_local(self.data, time(9, 0)))])
+                return {}
+            return {self.data: {'09:00': 1}}
+
+        self.assertEqual(obter_ocupacao(self.medico.pk, self.data, self.data, carregar), {self.data: {}})
+        self.assertEqual(obter_ocupacao(self.medico.pk, self.data, self.data, carregar), {self.data: {'09:00': 1}})
+        self.assertEqual(obter_ocupacao(self.medico.pk, self.data, self.data, carregar), {self.data: {'09:00': 1}})
+        self.assertEqual(len(cargas), 2)
+
+
+class LogsAgendaTests(TestCase):
+    def test_disponibilidade_registra_debug_estruturado(self):
+        medico = criar_medico()
+        url = reverse('medico_availability', args=[medico.pk])
+        with self.assertLogs('agenda.views', level='DEBUG') as capturados:
+            self.client.get(url, {'data': '2025-08-04'})
+        registro = capturados.records[0]
+        self.assertEqual(registro.getMessage(), f'Disponibilidade do médico {medico.pk} em 2025-08-04: 0 ocupados, 4 livres')
+        self.assertEqual(registro.horarios_disponiveis, ['09:00', '09:45', '10:30', '11:15'])
+
+    def test_handler_fila_grava_json_em_outra_thread(self):
+        import io
+        import json
+        import logging
+        from .logs import HandlerFila
+
+        saida = io.StringIO()
+        handler = HandlerFila(stream=saida)
+        logger = logging.getLogger('agenda.teste_logs')
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        ocupados = ['09:00']
+        logger.warning('Ocupados: %s', ocupados, extra={'medico_id': 7})
+        ocupados.append('09:45')  # a mensagem é resolvida no momento do log
+        handler.close()
+
+        registro = json.loads(saida.getvalue())
+        self.assertEqual(registro['mensagem'], "Ocupados: ['09:00']")
+        self.assertEqual((registro['nivel'], registro['medico_id']), ('WARNING', 7))
+
+
+class GerarDadosCommandTests(TestCase):
+    def test_gera_dados_consistentes(self):
+        import io
+        from django.core.management import call_command
+        from django.db.models import Count
+        from .models import PacienteTermo
+
+        saida = io.StringIO()
+        call_command(
+            'gerar_dados', especialidades=3, medicos=4, pacientes=30, consultas=203, semente=7, lote=50, stdout=saida,
+        )
+        self.assertIn('consultas: 203 registros gerados', saida.getvalue())
+        self.assertEqual(
+            (Especialidade.objects.count(), Medico.objects.count(), Paciente.objects.count(), Consulta.objects.count()),
+            (3, 4, 30, 203),
+        )
+        self.assertEqual(PacienteTermo.objects.values('paciente').distinct().count(), 30)
+        self.assertFalse(
+            Consulta.objects.exclude(status='cancelada').values('medico', 'data_hora')
+            .annotate(total=Count('id')).filter(total__gt=1).exists()
+        )
+        for consulta in Consulta.objects.select_related('medico'):
+            local = timezone.localtime(consulta.data_hora)
+            self.assertTrue(consulta.medico.trabalha_na_data(local.date()))
+            self.assertIn(local.strftime('%H:%M'), consulta.medico.grade_horarios.rotulos_set)
+        self.assertFalse(Medico.objects.filter(agenda_versao=0).exists())
+
+    def test_consultas_sem_medicos_livres(self):
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+
+        with self.assertRaises(CommandError):
+            call_command('gerar_dados', consultas=10)
+
+
+class APIsAssincronasTests(TestCase):
+    """As versões assíncronas das APIs respondem exatamente como as síncronas"""
+
+    def setUp(self):
+        from .cache import cache_agenda
+
+        cache_agenda().clear()
+        self.addCleanup(cache_agenda().clear)
+        self.medico = criar_medico(nome='Dra. Lúcia Araújo', crm='445566')
+        self.paciente = criar_paciente(nome='Ângela Simões', cpf='123.456.789-00')
+        self.data = date(2025, 8, 4)
+        self.consulta = Consulta.objects.create(
+            paciente=self.paciente, medico=self.medico, data_hora=data_hora_local(self.data, time(9, 45)),
+        )
+
+    def comparar(self, url_sincrona, url_assincrona, args=(), **params):
+        sincrona = self.client.get(reverse(url_sincrona, args=args), params)
+        assincrona = self.client.get(reverse(url_assincrona, args=args), params)
+        self.assertEqual(assincrona.status_code, sincrona.status_code)
+        self.assertEqual(assincrona.content, sincrona.content)
+        return assincrona
+
+    def test_disponibilidade(self):
+        def comparar(**params):
+            return self.comparar('medico_availability', 'medico_availability_async', [self.medico.pk], **params)
+
+        response = comparar(data=self.data.isoformat())
+        self.assertEqual([h['value'] for h in response.json()['horarios_disponiveis']], ['09:00', '10:30', '11:15'])
+        comparar(data=self.data.isoformat(), consulta_id=self.consulta.pk)
+        response = comparar(data='invalida')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.json()['success'])
+        response = comparar()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['horarios_disponiveis']), 4)
+
+    def test_disponibilidade_por_periodo(self):
+        def comparar(medico_id, **params):
+            return self.comparar('medico_availability_range', 'medico_availability_range_async', [medico_id], **params)
+
+        response = comparar(self.medico.pk, start='2025-08-01', end='2025-08-10')
+        self.assertEqual(len(response.json()['dias']), 6)
+        self.assertEqual(comparar(self.medico.pk, start='2025-08-10').status_code, 400)
+        self.assertEqual(comparar(self.medico.pk + 1, start='2025-08-01', end='2025-08-10').status_code, 404)
+
+    def test_buscas(self):
+        response = self.comparar('paciente_busca_api', 'paciente_busca_async_api', q='angela')
+        self.assertEqual([item['id'] for item in response.json()['resultados']], [self.paciente.pk])
+        self.comparar('paciente_busca_api', 'paciente_busca_async_api', q='123.45')
+        self.comparar('medico_busca_api', 'medico_busca_async_api', q='lucia')
+        self.comparar('medico_busca_api', 'medico_busca_async_api', q='4455')
+        self.comparar('medico_busca_api', 'medico_busca_async_api', q='x')
+
+    async def test_agendamento_assincrono(self):
+        url = reverse('consulta_agendar_async_api')
+        dados = {'paciente': self.paciente.pk, 'medico': self.medico.pk, 'status': 'agendada',
+                 'data': self.data.isoformat(), 'hora': '10:30'}
+
+        response = await self.async_client.post(url, dados)
+        self.assertEqual(response.status_code, 201)
+        consulta = await Consulta.objects.aget(pk=response.json()['consulta']['id'])
+        self.assertEqual(timezone.localtime(consulta.data_hora).strftime('%H:%M'), '10:30')
+        self.assertEqual(response.json()['consulta']['data_hora'], timezone.localtime(consulta.data_hora).isoformat())
+
+        # O mesmo horário já está ocupado: conflito detectado pela restrição única
+        response = await self.async_client.post(url, dados)
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('hora', response.json()['errors'])
+
+        response = await self.async_client.post(url, {**dados, 'hora': '13:00'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_agendamento_sincrono_e_metodo(self):
+        url = reverse('consulta_agendar_api')
+        dados = {'paciente': self.paciente.pk, 'medico': self.medico.pk, 'status': 'agendada',
+                 'data': self.data.isoformat(), 'hora': '09:45'}
+        self.assertEqual(self.client.post(url, dados).status_code, 409)
+        self.assertEqual(self.client.post(url, {**dados, 'hora': '09:00'}).status_code, 201)
+        self.assertEqual(self.client.get(url).status_code, 405)
+        self.assertEqual(self.client.get(reverse('consulta_agendar_async_api')).status_code, 405)
+
+
+class EventosAgendaTests(TestCase):
+    """Alterações de consultas publicam eventos de horário ocupado/liberado no canal (médico, data)"""
+
+    def setUp(self):
+        from .eventos import broker, canal_agenda
+
+        self.medico = criar_medico()
+        self.paciente = criar_paciente()
+        self.data = date(2025, 8, 4)
+        self.eventos = []
+        for data in (self.data, date(2025, 8, 5)):
+            self.addCleanup(broker().assinar(canal_agenda(self.medico.pk, data), self.eventos.append))
+
+    def recebidos(self):
+        eventos = [(evento['tipo'], evento['data'], evento['hora']) for evento in self.eventos]
+        self.eventos.clear()
+        return eventos
+
+    def test_criacao_remarcacao_cancelamento_e_exclusao(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            consulta = Consulta.objects.create(
+                paciente=self.paciente, medico=self.medico, data_hora=data_hora_local(self.data, time(9, 45)),
+            )
+        self.assertEqual(self.recebidos(), [('ocupado', '2025-08-04', '09:45')])
+
+        # Salvar sem mudar médico, horário ou status não publica nada
+        consulta = Consulta.objects.get(pk=consulta.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            consulta.observacoes = 'Retorno'
+            consulta.save()
+        self.assertEqual(self.recebidos(), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            consulta.data_hora = data_hora_local(date(2025, 8, 5), time(9, 0))
+            consulta.save()
+        self.assertEqual(self.recebidos(), [('liberado', '2025-08-04', '09:45'), ('ocupado', '2025-08-05', '09:00')])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            consulta.status = 'cancelada'
+            consulta.save()
+        self.assertEqual(self.recebidos(), [('liberado', '2025-08-05', '09:00')])
+
+        # Excluir uma consulta cancelada não libera nenhum horário
+        with self.captureOnCommitCallbacks(execute=True):
+            consulta.delete()
+        self.assertEqual(self.recebidos(), [])
+
+    def test_nada_e_publicado_sem_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            Consulta.objects.create(
+                paciente=self.paciente, medico=self.medico, data_hora=data_hora_local(self.data, time(9, 0)),
+            )
+        self.assertEqual(self.eventos, [])
+        self.assertTrue(callbacks)
+
+    def test_stream_sse(self):
+        import json
+        from .eventos import broker, canal_agenda
+
+        url = reverse('medico_eventos', args=[self.medico.pk])
+        self.assertEqual(self.client.get(url).status_code, 400)
+        self.assertEqual(self.client.get(reverse('medico_eventos', args=[self.medico.pk + 1])).status_code, 404)
+
+        response = self.client.get(url, {'data': self.data.isoformat()})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        fluxo = iter(response.streaming_content)
+        self.assertTrue(next(fluxo).startswith(b'retry:'))
+
+        canal = canal_agenda(self.medico.pk, self.data)
+        evento = {'tipo': 'ocupado', 'medico_id': self.medico.pk, 'data': '2025-08-04', 'hora': '10:30', 'consulta_id': 7}
+        broker().publicar(canal, evento)
+        self.assertEqual(next(fluxo).decode(), f'event: ocupado\ndata: {json.dumps(evento)}\n\n')
+
+    def test_fim_do_stream_cancela_a_assinatura(self):
+        from .eventos import broker, canal_agenda, fluxo_eventos
+
+        canal = canal_agenda(self.medico.pk, self.data)
+        fluxo = fluxo_eventos(canal, keepalive=0.01, duracao=60)
+        next(fluxo)
+        self.assertEqual(broker().assinantes(canal), 2)
+        self.assertEqual(next(fluxo), ': keep-alive\n\n')
+        fluxo.close()
+        self.assertEqual(broker().assinantes(canal), 1)
+
+        # A conexão também termina sozinha após a duração máxima
+        self.assertEqual(list(fluxo_eventos(canal, keepalive=1, duracao=0)), ['retry: 3000\n\n'])
+        self.assertEqual(broker().assinantes(canal), 1)
+
+    async def test_stream_sse_assincrono(self):
+        from .eventos import broker, canal_agenda
+
+        response = await self.async_client.get(
+            reverse('medico_eventos', args=[self.medico.pk]), {'data': self.data.isoformat()},
+        )
+        fluxo = aiter(response.streaming_content)
+        self.assertTrue((await anext(fluxo)).startswith(b'retry:'))
+        evento = {'tipo': 'liberado', 'medico_id': self.medico.pk, 'data': '2025-08-04', 'hora': '09:00', 'consulta_id': 3}
+        broker().publicar(canal_agenda(self.medico.pk, self.data), evento)
+        self.assertIn(b'event: liberado', await anext(fluxo))
+
+
+class AgregadosConsultasTests(TestCase):
+    """A tabela de agregados acompanha as consultas e alimenta o painel e a API"""
+
+    def setUp(self):
+        self.medico = criar_medico()
+        self.paciente = criar_paciente()
+        self.segunda = date(2025, 8, 4)
+
+    def consulta(self, dia, hora, **kwargs):
+        return Consulta.objects.create(
+            paciente=self.paciente, medico=self.medico, data_hora=data_hora_local(dia, hora), **kwargs,
+        )
+
+    def agregados(self):
+        from .models import ConsultaAgregado
+
+        return sorted(
+            (agregado.data.isoformat(), agregado.medico_id, agregado.status, agregado.total)
+            for agregado in ConsultaAgregado.objects.exclude(total=0)
+        )
+
+    def test_agregados_acompanham_as_alteracoes(self):
+        from .agregados import reconstruir_agregados
+
+        consulta = self.consulta(self.segunda, time(9, 0))
+        self.consulta(self.segunda, time(9, 45))
+        # 23h15 de 31/07 em São Paulo já é 01/08 em UTC: a data do agregado é a local
+        self.consulta(date(2025, 7, 31), time(23, 15), status='realizada')
+        self.assertEqual(self.agregados(), [
+            ('2025-07-31', self.medico.pk, 'realizada', 1),
+            ('2025-08-04', self.medico.pk, 'agendada', 2),
+        ])
+
+        consulta = Consulta.objects.get(pk=consulta.pk)
+        consulta.status = 'cancelada'
+        consulta.data_hora = data_hora_local(date(2025, 8, 5), time(9, 0))
+        consulta.save()
+        Consulta.objects.get(status='realizada').delete()
+        incrementais = self.agregados()
+        self.assertEqual(incrementais, [
+            ('2025-08-04', self.medico.pk, 'agendada', 1),
+            ('2025-08-05', self.medico.pk, 'cancelada', 1),
+        ])
+
+        reconstruir_agregados()
+        self.assertEqual(self.agregados(), incrementais)
+
+        # Excluir o paciente remove as consultas e os totais; excluir o médico, os agregados dele
+        self.paciente.delete()
+        self.assertEqual(self.agregados(), [])
+        self.paciente = criar_paciente(cpf='222')
+        self.consulta(self.segunda, time(9, 0))
+        self.medico.delete()
+        self.assertEqual(self.agregados(), [])
+
+    def test_exclusao_da_especialidade_com_consultas(self):
+        from .models import ConsultaAgregado
+
+        self.consulta(self.segunda, time(9, 0))
+        especialidade = self.medico.especialidade
+        response = self.client.post(reverse('especialidade_delete', args=[especialidade.pk]))
+        self.assertRedirects(response, reverse('especialidade_list'))
+        # A cascada não pode recriar agregados do médico excluído (a chave estrangeira é verificada aqui)
+        connection.check_constraints()
+        self.assertFalse(Medico.objects.filter(pk=self.medico.pk).exists())
+        self.assertFalse(ConsultaAgregado.objects.exists())
+
+    def test_importacao_e_comando_de_reconstrucao(self):
+        import io
+        from django.core.management import call_command
+        from .models import ConsultaAgregado
+
+        self.consulta(self.segunda, time(9, 0))
+        ConsultaAgregado.objects.update(total=99)
+        saida = io.StringIO()
+        call_command('reconstruir_agregados', medico=[self.medico.pk], stdout=saida)
+        self.assertIn('1 agregados gerados', saida.getvalue())
+        self.assertEqual(self.agregados(), [('2025-08-04', self.medico.pk, 'agendada', 1)])
+
+    def test_painel_e_api(self):
+        outro = criar_medico(crm='999', nome='Dra. Outra', especialidade=self.medico.especialidade)
+        self.consulta(self.segunda, time(9, 0))
+        self.consulta(self.segunda, time(9, 45), status='cancelada')
+        self.consulta(date(2025, 9, 1), time(9, 0), status='realizada')
+        Consulta.objects.create(paciente=self.paciente, medico=outro, data_hora=data_hora_local(self.segunda, time(10, 30)))
+
+        url = reverse('consulta_agregados_api')
+        dados = self.client.get(url, {'inicio': '2025-08-01', 'fim': '2025-09-30'}).json()
+        self.assertEqual(dados['totais'], {'agendada': 2, 'realizada': 1, 'cancelada': 1, 'total': 4})
+        self.assertEqual(
+            [(linha['periodo'], linha['total']) for linha in dados['por_periodo']],
+            [('2025-08-01', 3), ('2025-09-01', 1)],
+        )
+        self.assertEqual([(linha['id'], linha['total']) for linha in dados['por_dimensao']], [(self.medico.pk, 3), (outro.pk, 1)])
+
+        dados = self.client.get(url, {
+            'inicio': '2025-08-01', 'fim': '2025-08-31', 'agrupamento': 'dia', 'dimensao': 'especialidade', 'medico': outro.pk,
+        }).json()
+        self.assertEqual(dados['por_periodo'], [{'periodo': '2025-08-04', 'agendada': 1, 'realizada': 0, 'cancelada': 0, 'total': 1}])
+        self.assertEqual(dados['por_dimensao'][0]['nome'], 'Cardiologia')
+
+        self.assertEqual(self.client.get(url, {'inicio': '2025-09-01', 'fim': '2025-08-01'}).status_code, 400)
+
+        # Os totais vêm apenas dos agregados, sem varrer Consulta (a terceira consulta são as especialidades do filtro)
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('painel_consultas'), {'inicio': '2025-08-01', 'fim': '2025-09-30'})
+        self.assertContains(response, 'Dra. Outra')
+        self.assertEqual(response.context['totais']['total'], 4)
+
+    def test_inicio_e_listas_usam_os_agregados(self):
+        from django.utils import timezone
+
+        self.consulta(timezone.localdate(), time(9, 0))
+        self.consulta(timezone.localdate(), time(9, 45), status='cancelada')
+        response = self.client.get('/')
+        self.assertEqual(response.context['consultas_hoje'], 1)
+        self.assertEqual(response.context['total_medicos'], 1)
+
+        response = self.client.get(reverse('medico_list'))
+        self.assertEqual(response.context['medico_list'][0].num_consultas, 2)
+
+
+class UtilizacaoMedicosTests(TestCase):
+    """Utilização = slots ocupados / slots disponíveis na grade, por dia da semana e hora"""
+
+    def setUp(self):
+        # Segunda a sexta, 9h às 12h: slots às 9h00, 9h45, 10h30 e 11h15
+        self.medico = criar_medico()
+        self.sabado = criar_medico(
+            crm='999', nome='Dra. Sábado', especialidade=self.medico.especialidade,
+            dias_trabalho='sabado', hora_inicio=time(8, 0), hora_fim=time(9, 30),
+        )
+        self.paciente = criar_paciente()
+
+    def consulta(self, medico, dia, hora, **kwargs):
+        return Consulta.objects.create(
+            paciente=self.paciente, medico=medico, data_hora=data_hora_local(dia, hora), **kwargs,
+        )
+
+    def celulas_dia_a_dia(self, medico, inicio, fim):
+        """Referência: percorre o período dia a dia"""
+        from collections import Counter
+        from datetime import timedelta
+
+        disponiveis, ocupados = Counter(), Counter()
+        dia = inicio
+        while dia <= fim:
+            if medico.trabalha_na_data(dia):
+                for horario in medico.grade_horarios.horarios:
+                    disponiveis[dia.weekday(), horario.hour] += 1
+            dia += timedelta(days=1)
+        for consulta in Consulta.objects.filter(medico=medico, status__in=['agendada', 'realizada']):
+            local = timezone.localtime(consulta.data_hora)
+            if inicio <= local.date() <= fim:
+                # Cada slot da grade coberto pela consulta, na hora em que começa
+                for minutos in range(0, consulta.duracao_minutos, medico.duracao_slot):
+                    slot = local + timedelta(minutes=minutos)
+                    ocupados[slot.weekday(), slot.hour] += 1
+        return {
+            celula: (disponiveis[celula], ocupados[celula])
+            for celula in sorted(disponiveis.keys() | ocupados.keys())
+        }
+
+    def test_relatorio_igual_a_contagem_dia_a_dia(self):
+        from .utilizacao import relatorio_utilizacao
+
+        inicio, fim = date(2025, 8, 6), date(2025, 8, 23)
+        self.consulta(self.medico, date(2025, 8, 11), time(9, 0))
+        self.consulta(self.medico, date(2025, 8, 11), time(9, 45), status='realizada')
+        self.consulta(self.medico, date(2025, 8, 12), time(10, 30), status='cancelada')
+        self.consulta(self.medico, date(2025, 8, 5), time(9, 0))
+        self.consulta(self.sabado, date(2025, 8, 23), time(8, 45))
+        # 90 min ocupam dois slots de 45 min: 10h30 e 11h15
+        self.consulta(self.medico, date(2025, 8, 13), time(10, 30), duracao_minutos=90)
+
+        # Ocupados agrupados, bloqueios do período e médicos
+        with self.assertNumQueries(3):
+            relatorio = relatorio_utilizacao(inicio, fim)
+        por_id = {linha['id']: linha for linha in relatorio['medicos']}
+        for medico in (self.medico, self.sabado):
+            self.assertEqual(por_id[medico.pk]['celulas'], self.celulas_dia_a_dia(medico, inicio, fim))
+
+        # 13 dias úteis x 4 slots; 3 sábados x 2 slots
+        self.assertEqual((por_id[self.medico.pk]['disponiveis'], por_id[self.medico.pk]['ocupados']), (52, 4))
+        self.assertEqual((por_id[self.medico.pk]['celulas'][2, 10], por_id[self.medico.pk]['celulas'][2, 11]), ((3, 1), (3, 1)))
+        self.assertEqual(por_id[self.sabado.pk]['utilizacao'], 1 / 6)
+        self.assertEqual(relatorio['por_dia_hora'][0, 9], (4, 2))
+        self.assertEqual(relatorio['totais'], {'disponiveis': 58, 'ocupados': 5, 'utilizacao': 5 / 58})
+
+    def test_horario_de_verao(self):
+        from .utilizacao import _segmentos_fuso, relatorio_utilizacao
+
+        # Horário de verão de São Paulo: de 04/11/2018 a 16/02/2019 (UTC-2)
+        inicio, fim = date(2018, 10, 1), date(2019, 3, 31)
+        self.consulta(self.medico, date(2018, 10, 29), time(9, 0))
+        self.consulta(self.medico, date(2018, 11, 5), time(9, 0))
+        self.consulta(self.medico, date(2019, 2, 15), time(11, 15))
+        self.consulta(self.sabado, date(2019, 2, 16), time(8, 45))
+
+        fuso = timezone.get_current_timezone()
+        segmentos = _segmentos_fuso(
+            data_hora_local(inicio, time.min), data_hora_local(date(2019, 4, 1), time.min), fuso,
+        )
+        self.assertEqual([minutos for _, _, minutos in segmentos], [-180, -120, -180])
+        self.assertEqual(timezone.localtime(segmentos[1][0]), data_hora_local(date(2018, 11, 4), time(1, 0)))
+        self.assertEqual(timezone.localtime(segmentos[2][0]), data_hora_local(date(2019, 2, 16), time(23, 0)))
+
+        relatorio = relatorio_utilizacao(inicio, fim)
+        por_id = {linha['id']: linha for linha in relatorio['medicos']}
+        for medico in (self.medico, self.sabado):
+            self.assertEqual(por_id[medico.pk]['celulas'], self.celulas_dia_a_dia(medico, inicio, fim))
+        self.assertEqual(por_id[self.medico.pk]['celulas'][0, 9][1], 2)
+
+    def test_pagina_e_csv(self):
+        import csv
+        import io
+
+        self.consulta(self.medico, date(2025, 8, 11), time(9, 0))
+        filtros = {'inicio': '2025-08-04', 'fim': '2025-08-10', 'especialidade': self.medico.especialidade_id}
+
+        response = self.client.get(reverse('utilizacao_medicos'), filtros)
+        self.assertEqual(response.context['totais'], {'disponiveis': 22, 'ocupados': 0, 'utilizacao': 0.0})
+        self.assertContains(response, 'Dra. Sábado')
+
+        filtros['fim'] = '2025-08-16'
+        response = self.client.get(reverse('utilizacao_medicos_csv'), filtros)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        linhas = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(linhas), 5 * 3 + 1)
+        segunda_9h = next(
+            linha for linha in linhas
+            if linha['medico_id'] == str(self.medico.pk) and linha['dia_semana'] == 'Segunda' and linha['hora'] == '09:00'
+        )
+        self.assertEqual((segunda_9h['slots_disponiveis'], segunda_9h['slots_ocupados'], segunda_9h['utilizacao']), ('4', '1', '0.2500'))
+
+        filtros['fim'] = '2025-08-01'
+        self.assertEqual(self.client.get(reverse('utilizacao_medicos_csv'), filtros).status_code, 400)
+
+
+class SerieConsultaTests(TestCase):
+    """Séries recorrentes: verificação em lote, inserção atômica e alteração/cancelamento em lote"""
+
+    def setUp(self):
+        self.medico = criar_medico()
+        self.paciente = criar_paciente()
+        self.outro_paciente = criar_paciente(cpf='222.222.222-22')
+        self.segunda = date(2030, 1, 7)
+
+    def serie(self, **kwargs):
+        from .models import SerieConsulta
+
+        dados = {
+            'paciente': self.paciente, 'medico': self.medico, 'data_inicio': self.segunda,
+            'hora': time(9, 0), 'intervalo_semanas': 2, 'ocorrencias': 4,
+        }
+        dados.update(kwargs)
+        return SerieConsulta(**dados)
+
+    def ocupar(self, dia, hora):
+        return Consulta.objects.create(paciente=self.outro_paciente, medico=self.medico, data_hora=data_hora_local(dia, hora))
+
+    def agregados(self):
+        from django.db.models import Sum
+        from .models import ConsultaAgregado
+
+        return dict(
+            ConsultaAgregado.objects.filter(medico=self.medico).exclude(total=0)
+            .values_list('status').annotate(soma=Sum('total'))
+        )
+
+    def test_criacao_em_lote_com_conflitos(self):
+        from .eventos import broker, canal_agenda
+        from .models import SerieConsulta
+        from .recorrencia import MENSAGEM_OCUPADO, conflitos_horarios, criar_serie
+
+        self.ocupar(date(2030, 2, 4), time(9, 0))
+        serie = self.serie()
+        self.assertEqual(serie.datas(), [date(2030, 1, 7), date(2030, 1, 21), date(2030, 2, 4), date(2030, 2, 18)])
+        # Bloqueios do período e agendamentos das ocorrências
+        with self.assertNumQueries(2):
+            self.assertEqual(conflitos_horarios(self.medico, serie.horarios()), {date(2030, 2, 4): MENSAGEM_OCUPADO})
+
+        # Sem ignorar conflitos nada é gravado
+        self.assertEqual(criar_serie(serie), ([], {date(2030, 2, 4): MENSAGEM_OCUPADO}))
+        self.assertFalse(SerieConsulta.objects.exists())
+
+        eventos = []
+        self.addCleanup(broker().assinar(canal_agenda(self.medico.pk, '2030-01-21'), eventos.append))
+        versao = Medico.objects.get(pk=self.medico.pk).agenda_versao
+        # Trava da agenda, verificação (bloqueios e agendamentos), série, INSERT em lote, marcador das agendas e
+        # upsert dos agregados, mais o savepoint
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(9):
+            consultas, conflitos = criar_serie(serie, ignorar_conflitos=True)
+        self.assertEqual(len(consultas), 3)
+        self.assertEqual(list(conflitos), [date(2030, 2, 4)])
+        self.assertEqual(serie.consultas.filter(status='agendada').count(), 3)
+        self.assertEqual(self.agregados(), {'agendada': 4})
+        self.assertEqual(Medico.objects.get(pk=self.medico.pk).agenda_versao, versao + 1)
+        self.assertEqual([(evento['tipo'], evento['hora']) for evento in eventos], [('ocupado', '09:00')])
+
+    def test_alteracao_e_cancelamento_em_lote(self):
+        from .recorrencia import MENSAGEM_OCUPADO, alterar_serie, cancelar_serie, criar_serie
+
+        serie = self.serie()
+        criar_serie(serie)
+        ocupada = self.ocupar(date(2030, 1, 21), time(10, 30))
+
+        consultas, conflitos = alterar_serie(serie, time(10, 30), 'Retorno')
+        self.assertEqual((consultas, conflitos), ([], {date(2030, 1, 21): MENSAGEM_OCUPADO}))
+        self.assertEqual(set(serie.consultas.values_list('observacoes', flat=True)), {''})
+
+        ocupada.delete()
+        consultas, conflitos = alterar_serie(serie, time(10, 30), 'Retorno')
+        self.assertEqual((len(consultas), conflitos), (4, {}))
+        self.assertEqual(
+            {(timezone.localtime(consulta.data_hora).time(), consulta.observacoes) for consulta in serie.consultas.all()},
+            {(time(10, 30), 'Retorno')},
+        )
+        # Os horários antigos ficam livres para outros pacientes
+        self.ocupar(date(2030, 1, 21), time(9, 0))
+
+        self.assertEqual(cancelar_serie(serie), 4)
+        serie.refresh_from_db()
+        self.assertTrue(serie.cancelada)
+        self.assertEqual(set(serie.consultas.values_list('status', flat=True)), {'cancelada'})
+        self.assertEqual(self.agregados(), {'agendada': 1, 'cancelada': 4})
+
+    def test_formulario_e_detalhe(self):
+        self.ocupar(date(2030, 1, 21), time(9, 0))
+        dados = {
+            'paciente': self.paciente.pk, 'medico': self.medico.pk, 'data_inicio': '2030-01-07',
+            'hora': '09:00', 'intervalo_semanas': 2, 'ocorrencias': 3,
+        }
+        response = self.client.post(reverse('serie_consulta_create'), dados)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '21/01/2030: Horário já ocupado.')
+
+        response = self.client.post(reverse('serie_consulta_create'), {**dados, 'hora': '09:10'})
+        self.assertIn('hora', response.context['form'].errors)
+
+        response = self.client.post(reverse('serie_consulta_create'), {**dados, 'ignorar_conflitos': 'on'})
+        serie = self.paciente.series.get()
+        self.assertRedirects(response, reverse('serie_consulta_detail', args=[serie.pk]))
+        response = self.client.get(response.url)
+        self.assertContains(response, 'Não agendada')
+        self.assertEqual(len(response.context['ocorrencias']), 3)
+
+        response = self.client.post(reverse('serie_consulta_cancelar', args=[serie.pk]))
+        self.assertRedirects(response, reverse('serie_consulta_detail', args=[serie.pk]))
+        self.assertEqual(self.client.post(reverse('serie_consulta_cancelar', args=[serie.pk])).status_code, 404)
+
+
+class RemarcacaoAgendaTests(TestCase):
+    """Mudança de expediente: consultas futuras fora da nova grade são remarcadas ou canceladas em lote"""
+
+    def setUp(self):
+        self.medico = criar_medico()
+        self.segunda = date(2030, 1, 7)
+        self.consultas = {}
+        for indice, (dia, hora) in enumerate([
+            (self.segunda, time(9, 0)),
+            (self.segunda, time(11, 15)),
+            (date(2030, 1, 8), time(10, 30)),
+            (date(2030, 1, 11), time(9, 0)),
+        ]):
+            paciente = criar_paciente(cpf=f'{indice}', nome=f'Paciente {indice}')
+            self.consultas[indice] = Consulta.objects.create(
+                paciente=paciente, medico=self.medico, data_hora=data_hora_local(dia, hora),
+            )
+        # Novo expediente: segunda a quinta, 9h às 10h30 (slots às 9h00 e 9h45)
+        self.medico.dias_trabalho = 'segunda,terca,quarta,quinta'
+        self.medico.hora_fim = time(10, 30)
+        self.medico.save()
+
+    def horarios(self):
+        return {
+            indice: (timezone.localtime(consulta.data_hora).strftime('%d/%m %H:%M'), consulta.status)
+            for indice, consulta in ((indice, Consulta.objects.get(pk=consulta.pk)) for indice, consulta in self.consultas.items())
+        }
+
+    def test_proposta_e_aplicacao_em_lote(self):
+        from .agregados import reconstruir_agregados
+        from .models import ConsultaAgregado
+        from .remarcacao import aplicar_remarcacao, propor_remarcacao
+
+        # Consultas afetadas, ocupação e bloqueios do período
+        with self.assertNumQueries(3):
+            propostas = propor_remarcacao(self.medico)
+        self.assertEqual(
+            [(proposta.consulta.pk, timezone.localtime(proposta.nova_data_hora).strftime('%d/%m %H:%M')) for proposta in propostas],
+            [(self.consultas[1].pk, '07/01 09:45'), (self.consultas[2].pk, '08/01 09:00'), (self.consultas[3].pk, '14/01 09:00')],
+        )
+        antes = self.horarios()
+
+        remarcadas, canceladas = aplicar_remarcacao(self.medico)
+        self.assertEqual((len(remarcadas), canceladas), (3, []))
+        self.assertEqual(self.horarios(), {
+            0: antes[0],
+            1: ('07/01 09:45', 'agendada'),
+            2: ('08/01 09:00', 'agendada'),
+            3: ('14/01 09:00', 'agendada'),
+        })
+        self.assertEqual(propor_remarcacao(self.medico), [])
+
+        incrementais = sorted(ConsultaAgregado.objects.exclude(total=0).values_list('data', 'status', 'total'))
+        reconstruir_agregados()
+        self.assertEqual(sorted(ConsultaAgregado.objects.exclude(total=0).values_list('data', 'status', 'total')), incrementais)
+
+    def test_cancelar_todas(self):
+        from .remarcacao import aplicar_remarcacao
+
+        remarcadas, canceladas = aplicar_remarcacao(self.medico, cancelar_todas=True)
+        self.assertEqual((remarcadas, len(canceladas)), ([], 3))
+        self.assertEqual([status for _, status in self.horarios().values()], ['agendada', 'cancelada', 'cancelada', 'cancelada'])
+
+    def test_edicao_do_medico_leva_a_revisao(self):
+        dados = {
+            'nome': self.medico.nome, 'crm': self.medico.crm, 'especialidade': self.medico.especialidade_id,
+            'dias_trabalho': ['segunda', 'terca', 'quarta', 'quinta'], 'hora_inicio': '09:00', 'hora_fim': '10:30',
+        }
+        url = reverse('medico_remarcacao', args=[self.medico.pk])
+        # Sem mudança de expediente, segue para a lista mesmo com consultas fora da grade
+        self.assertRedirects(self.client.post(reverse('medico_update', args=[self.medico.pk]), dados), reverse('medico_list'))
+        response = self.client.post(reverse('medico_update', args=[self.medico.pk]), {**dados, 'hora_fim': '10:00'})
+        self.assertRedirects(response, url)
+
+        response = self.client.get(url)
+        self.assertEqual(len(response.context['propostas']), 3)
+        self.assertContains(response, 'Paciente 3')
+
+        response = self.client.post(url, {'acao': 'remarcar'})
+        self.assertEqual(response.context['resultado'], {'remarcadas': 3, 'canceladas': 0})
+        self.assertEqual(response.context['propostas'], [])
+
+
+    def test_mudanca_da_duracao_herdada_leva_a_revisao(self):
+        from .remarcacao import aplicar_remarcacao
+
+        aplicar_remarcacao(self.medico)
+        especialidade = self.medico.especialidade
+        outro = criar_medico(especialidade, nome='Dra. Outra', crm='654321', hora_fim=time(10, 30))
+        Consulta.objects.create(
+            paciente=criar_paciente(cpf='99'), medico=outro, data_hora=data_hora_local(self.segunda, time(9, 45)),
+        )
+
+        # Consultas de 60 min: só o slot das 9h cabe até 10h30 e as consultas das 9h45 saem da grade dos dois médicos
+        response = self.client.post(reverse('especialidade_update', args=[especialidade.pk]), {
+            'nome': especialidade.nome, 'duracao_consulta': 60,
+        })
+        url = f"{reverse('especialidade_detail', args=[especialidade.pk])}?revisar=1"
+        self.assertRedirects(response, url)
+        self.assertEqual({medico.pk for medico in self.client.get(url).context['medicos_revisao']}, {self.medico.pk, outro.pk})
+
+        # Trocar de especialidade também muda a duração dos slots
+        clinica = Especialidade.objects.create(nome='Clínica', duracao_consulta=40)
+        response = self.client.post(reverse('medico_update', args=[outro.pk]), {
+            'nome': outro.nome, 'crm': outro.crm, 'especialidade': clinica.pk,
+            'dias_trabalho': ['segunda', 'terca', 'quarta', 'quinta', 'sexta'], 'hora_inicio': '09:00', 'hora_fim': '10:30',
+        })
+        self.assertRedirects(response, reverse('medico_remarcacao', args=[outro.pk]))
+
+class BloqueioAgendaTests(TestCase):
+    """Férias, feriados e horários bloqueados saem da disponibilidade e não aceitam agendamentos"""
+
+    def setUp(self):
+        from .cache import cache_agenda
+
+        cache_agenda().clear()
+        self.addCleanup(cache_agenda().clear)
+        self.medico = criar_medico()
+        self.outro = criar_medico(self.medico.especialidade, nome='Dra. Outra', crm='654321')
+        self.paciente = criar_paciente()
+        self.segunda = date(2030, 1, 7)
+
+    def bloquear(self, inicio, fim=None, hora_inicio=None, hora_fim=None, medico=None):
+        from .models import BloqueioAgenda
+
+        with self.captureOnCommitCallbacks(execute=True):
+            return BloqueioAgenda.objects.create(
+                medico=medico, data_inicio=inicio, data_fim=fim or inicio,
+                hora_inicio=hora_inicio, hora_fim=hora_fim, motivo='Férias',
+            )
+
+    def livres(self, medico, data):
+        response = self.client.get(reverse('medico_availability', args=[medico.pk]), {'data': data.isoformat()})
+        return [horario['value'] for horario in response.json()['horarios_disponiveis']]
+
+    def test_disponibilidade_do_dia_e_do_periodo(self):
+        from datetime import timedelta
+
+        self.assertEqual(self.livres(self.medico, self.segunda), ['09:00', '09:45', '10:30', '11:15'])
+        # 10h às 11h atinge os slots que terminam depois das 10h (9h45) ou começam antes das 11h (10h30)
+        self.bloquear(self.segunda, hora_inicio=time(10, 0), hora_fim=time(11, 0), medico=self.medico)
+        self.assertEqual(self.livres(self.medico, self.segunda), ['09:00', '11:15'])
+        # Feriado da clínica na terça e férias do médico de quarta a sexta
+        self.bloquear(self.segunda + timedelta(days=1))
+        bloqueio = self.bloquear(self.segunda + timedelta(days=2), self.segunda + timedelta(days=4), medico=self.medico)
+
+        params = {'start': '2030-01-07', 'end': '2030-01-11'}
+        sincrona = self.client.get(reverse('medico_availability_range', args=[self.medico.pk]), params)
+        assincrona = self.client.get(reverse('medico_availability_range_async', args=[self.medico.pk]), params)
+        self.assertEqual(assincrona.content, sincrona.content)
+        self.assertEqual(
+            [len(dia['horarios_disponiveis']) for dia in sincrona.json()['dias']], [2, 0, 0, 0, 0],
+        )
+        response = self.client.get(reverse('medico_availability_range', args=[self.outro.pk]), params)
+        self.assertEqual([len(dia['horarios_disponiveis']) for dia in response.json()['dias']], [4, 0, 4, 4, 4])
+
+        # Alterar o período do bloqueio libera os dias antigos no cache
+        bloqueio.data_inicio = bloqueio.data_fim
+        with self.captureOnCommitCallbacks(execute=True):
+            bloqueio.save()
+        self.assertEqual(len(self.livres(self.medico, self.segunda + timedelta(days=2))), 4)
+
+    def test_formulario_rejeita_horario_bloqueado(self):
+        consulta = Consulta.objects.create(
+            paciente=self.paciente, medico=self.medico, data_hora=data_hora_local(self.segunda, time(10, 30)),
+        )
+        self.bloquear(self.segunda, hora_inicio=time(10, 0), hora_fim=time(11, 0), medico=self.medico)
+        dados = {
+            'paciente': self.paciente.pk, 'medico': self.medico.pk, 'status': 'agendada',
+            'data': '2030-01-07', 'hora': '09:45',
+        }
+        response = self.client.post(reverse('consulta_create'), dados)
+        self.assertIn('bloqueado', response.context['form'].errors['hora'][0])
+
+        # A consulta marcada antes do bloqueio continua editável no mesmo horário
+        response = self.client.post(
+            reverse('consulta_update', args=[consulta.pk]), {**dados, 'hora': '10:30', 'observacoes': 'Retorno'},
+        )
+        self.assertRedirects(response, reverse('consulta_list'))
+
+    def test_busca_de_proximos_series_e_utilizacao(self):
+        from datetime import timedelta
+        from .recorrencia import MENSAGEM_BLOQUEADO, conflitos_horarios
+        from .scheduling import proximos_horarios_especialidade
+        from .utilizacao import relatorio_utilizacao
+
+        self.bloquear(self.segunda)
+        self.bloquear(self.segunda + timedelta(days=1), hora_inicio=time(9, 0), hora_fim=time(9, 45), medico=self.medico)
+
+        proximos = proximos_horarios_especialidade(
+            self.medico.especialidade, data_hora_local(self.segunda, time(0, 0)), limite=3,
+        )
+        self.assertEqual(
+            [(item['medico'], timezone.localtime(item['data_hora']).strftime('%d %H:%M')) for item in proximos],
+            [(self.outro, '08 09:00'), (self.medico, '08 09:45'), (self.outro, '08 09:45')],
+        )
+
+        horarios = [data_hora_local(self.segunda + timedelta(weeks=semana), time(9, 0)) for semana in range(2)]
+        self.assertEqual(conflitos_horarios(self.medico, horarios), {self.segunda: MENSAGEM_BLOQUEADO})
+
+        relatorio = relatorio_utilizacao(self.segunda, self.segunda + timedelta(days=6))
+        self.assertEqual({linha['nome']: linha['disponiveis'] for linha in relatorio['medicos']}, {
+            self.medico.nome: 15, self.outro.nome: 16,
+        })
+
+    def test_cadastro_valida_periodo_e_horarios(self):
+        from .models import BloqueioAgenda
+
+        url = reverse('bloqueio_create')
+        dados = {'data_inicio': '2030-01-07', 'data_fim': '2030-01-06', 'motivo': 'Feriado'}
+        self.assertIn('data_fim', self.client.post(url, dados).context['form'].errors)
+        dados.update(data_fim='2030-01-07', hora_inicio='10:00')
+        self.assertIn('hora_fim', self.client.post(url, dados).context['form'].errors)
+
+        del dados['hora_inicio']
+        self.assertRedirects(self.client.post(url, dados), reverse('bloqueio_list'))
+        bloqueio = BloqueioAgenda.objects.get()
+        self.assertIsNone(bloqueio.medico)
+        self.assertContains(self.client.get(reverse('bloqueio_list')), 'Toda a clínica')
+
+        self.assertRedirects(self.client.post(reverse('bloqueio_delete', args=[bloqueio.pk])), reverse('bloqueio_list'))
+        self.assertFalse(BloqueioAgenda.objects.exists())
+
+
+class DuracaoConsultaTests(TestCase):
+    """Duração configurável por especialidade, médico e consulta, com conflitos por sobreposição de intervalos"""
+
+    def setUp(self):
+        from .cache import cache_agenda
+
+        cache_agenda().clear()
+        self.addCleanup(cache_agenda().clear)
+        self.especialidade = Especialidade.objects.create(nome='Psicologia', duracao_consulta=20)
+        self.medico = criar_medico(self.especialidade, duracao_consulta=30)
+        self.paciente = criar_paciente()
+        self.segunda = date(2030, 1, 7)
+
+    def test_motor_de_intervalos_confere_com_forca_bruta(self):
+        import random
+        from .scheduling import grade_horarios, mesclar_intervalos, slots_em_conflito, sobrepoe
+
+        aleatorio = random.Random(2023)
+        for _ in range(300):
+            intervalos = []
+            for _ in range(aleatorio.randrange(8)):
+                inicio = aleatorio.randrange(0, 24 * 60 - 5, 5)
+                intervalos.append((inicio, inicio + aleatorio.randrange(5, 240, 5)))
+            minutos = {minuto for inicio, fim in intervalos for minuto in range(inicio, fim)}
+            mesclados = mesclar_intervalos(intervalos)
+            self.assertEqual({minuto for inicio, fim in mesclados for minuto in range(inicio, fim)}, minutos)
+            self.assertTrue(all(fim < proximo for (_, fim), (proximo, _) in zip(mesclados, mesclados[1:])))
+
+            inicio = aleatorio.randrange(0, 24 * 60, 5)
+            fim = inicio + aleatorio.randrange(5, 120, 5)
+            self.assertEqual(sobrepoe(inicio, fim, mesclados), bool(minutos & set(range(inicio, fim))))
+
+            duracao = aleatorio.choice([15, 20, 30, 45, 60])
+            grade = grade_horarios(time(aleatorio.randrange(6, 12)), time(aleatorio.randrange(13, 22)), duracao)
+            esperados = {
+                rotulo for horario, rotulo in zip(grade.horarios, grade.rotulos)
+                if minutos & set(range(horario.hour * 60 + horario.minute, horario.hour * 60 + horario.minute + duracao))
+            }
+            self.assertEqual(slots_em_conflito(grade, duracao, intervalos), esperados)
+
+    def test_duracoes_diferentes_na_mesma_agenda(self):
+        # Médico com slots de 30 min e uma consulta de 60 min às 10h: ocupa os slots das 10h e das 10h30
+        Consulta.objects.create(
+            paciente=self.paciente, medico=self.medico, data_hora=data_hora_local(self.segunda, time(10, 0)),
+            duracao_minutos=60,
+        )
+        response = self.client.get(reverse('medico_availability', args=[self.medico.pk]), {'data': '2030-01-07'})
+        self.assertEqual(
+            [horario['value'] for horario in response.json()['horarios_disponiveis']],
+            ['09:00', '09:30', '11:00', '11:30'],
+        )
+
+        dados = {
+            'paciente': self.paciente.pk, 'medico': self.medico.pk, 'status': 'agendada', 'data': '2030-01-07',
+        }
+        # 9h com 90 min alcança a consulta das 10h; 9h com 60 min termina exatamente quando ela começa
+        response = self.client.post(reverse('consulta_create'), {**dados, 'hora': '09:00', 'duracao_minutos': 90})
+        self.assertIn('hora', response.context['form'].errors)
+        response = self.client.post(reverse('consulta_create'), {**dados, 'hora': '09:00', 'duracao_minutos': 60})
+        self.assertRedirects(response, reverse('consulta_list'))
+        # Sem duração informada, vale a do médico
+        response = self.client.post(reverse('consulta_create'), {**dados, 'hora': '11:30'})
+        self.assertRedirects(response, reverse('consulta_list'))
+        self.assertEqual(Consulta.objects.get(data_hora=data_hora_local(self.segunda, time(11, 30))).duracao_minutos, 30)
+        self.assertEqual(Consulta.objects.filter(medico=self.medico).count(), 3)
+
+    def test_consulta_termina_ate_o_fim_do_expediente(self):
+        from .importacao import importar
+        from .remarcacao import consultas_afetadas, propor_remarcacao
+        from .scheduling import grade_horarios
+
+        # A grade só oferece inícios em que a duração padrão cabe no expediente
+        self.assertEqual(grade_horarios(time(9, 0), time(12, 0), 50).rotulos, ('09:00', '09:50', '10:40'))
+
+        dados = {
+            'paciente': self.paciente.pk, 'medico': self.medico.pk, 'status': 'agendada', 'data': '2030-01-07',
+        }
+        response = self.client.post(reverse('consulta_create'), {**dados, 'hora': '11:30', 'duracao_minutos': 60})
+        self.assertIn('fim do expediente', response.context['form'].errors['hora'][0])
+
+        rejeitados = []
+        importar('consulta', [(2, {
+            'paciente_cpf': self.paciente.cpf, 'medico_crm': self.medico.crm, 'data_hora': '2030-01-07 11:30',
+            'duracao_minutos': '60',
+        })], rejeitar=lambda numero, dados, erros: rejeitados.extend(erros))
+        self.assertEqual(rejeitados, ['A consulta termina após o fim do expediente do médico.'])
+
+        # Consulta de 60 min às 11h: com o expediente até 11h30, passa a ser remarcada para as 9h
+        consulta = Consulta.objects.create(
+            paciente=self.paciente, medico=self.medico, data_hora=data_hora_local(self.segunda, time(11, 0)),
+            duracao_minutos=60,
+        )
+        self.medico.hora_fim = time(11, 30)
+        self.medico.save()
+        self.assertEqual(consultas_afetadas(self.medico), [consulta])
+        self.assertEqual(
+            [proposta.nova_data_hora for proposta in propor_remarcacao(self.medico)],
+            [data_hora_local(self.segunda, time(9, 0))],
+        )
+
+    def test_medicos_herdam_a_duracao_da_especialidade(self):
+        herdeiro = criar_medico(self.especialidade, nome='Dra. Herdeira', crm='654321')
+        self.assertEqual((herdeiro.duracao_slot, self.medico.duracao_slot), (20, 30))
+        self.assertEqual(len(herdeiro.grade_horarios.horarios), 9)
+
+        self.especialidade.duracao_consulta = 60
+        self.especialidade.save()
+        herdeiro.refresh_from_db()
+        self.medico.refresh_from_db()
+        self.assertEqual((herdeiro.duracao_slot, self.medico.duracao_slot), (60, 30))
+        self.assertEqual(herdeiro.grade_horarios.rotulos, ('09:00', '10:00', '11:00'))
+
+        # Sem duração própria, o médico volta a seguir a especialidade
+        self.medico.duracao_consulta = None
+        self.medico.save()
+        self.assertEqual(Medico.objects.get(pk=self.medico.pk).duracao_slot, 60)
+
+
+class FusoHorarioTests(TestCase):
+    """Dias locais como intervalos semiabertos com fuso, nas viradas do horário de verão de São Paulo.
+
+    Em 04/11/2018 a meia-noite não existiu (00h -> 01h) e em 16/02/2019 as 23h se repetiram.
+    """
+
+    def setUp(self):
+        from datetime import timezone as dt_timezone
+        from .cache import cache_agenda
+
+        cache_agenda().clear()
+        self.addCleanup(cache_agenda().clear)
+        self.utc = dt_timezone.utc
+        # Sábados e domingos, das 21h às 23h59, em slots de 15 min (último às 23h30, que termina às 23h45)
+        self.medico = criar_medico(
+            dias_trabalho='sabado,domingo', hora_inicio=time(21, 0), hora_fim=time(23, 59), duracao_consulta=15,
+        )
+        self.paciente = criar_paciente()
+
+    def test_limites_dos_dias(self):
+        from .scheduling import inicio_do_dia, periodo_local
+
+        def em_utc(*datas):
+            # Datetimes no mesmo fuso são comparados pelo relógio local; em UTC, pelo instante
+            return tuple(data.astimezone(self.utc) for data in datas)
+
+        self.assertEqual(em_utc(inicio_do_dia(date(2018, 11, 4))), (datetime(2018, 11, 4, 3, 0, tzinfo=self.utc),))
+        inicio, fim = em_utc(*periodo_local(date(2018, 11, 4), date(2018, 11, 4)))
+        self.assertEqual(fim - inicio, timedelta(hours=23))
+        inicio, fim = em_utc(*periodo_local(date(2019, 2, 16), date(2019, 2, 16)))
+        self.assertEqual((inicio, fim - inicio), (datetime(2019, 2, 16, 2, 0, tzinfo=self.utc), timedelta(hours=25)))
+
+    def test_edicao_sem_alteracoes_mantem_o_horario(self):
+        from .forms import ConsultaForm
+
+        consulta = Consulta.objects.create(
+            paciente=self.paciente, medico=self.medico, data_hora=data_hora_local(date(2030, 1, 5), time(21, 30)),
+        )
+        # Lida do banco, data_hora vem em UTC
+        form = ConsultaForm(instance=Consulta.objects.get(pk=consulta.pk))
+        # Data e hora exibidas no horário local (21h30 de sábado), não em UTC (00h30 de domingo)
+        self.assertEqual((form['data'].initial, form['hora'].initial), (date(2030, 1, 5), '21:30'))
+
+        dados = {
+            campo: form[campo].initial for campo in ('paciente', 'medico', 'status', 'duracao_minutos', 'observacoes')
+        }
+        response = self.client.post(reverse('consulta_update', args=[consulta.pk]), {
+            **dados, 'data': form['data'].initial.isoformat(), 'hora': form['hora'].initial,
+        })
+        self.assertRedirects(response, reverse('consulta_list'))
+        consulta.refresh_from_db()
+        self.assertEqual(consulta.data_hora, data_hora_local(date(2030, 1, 5), time(21, 30)))
+
+    def test_ocupacao_nas_viradas(self):
+        from .scheduling import horarios_ocupados_periodo
+
+        for data_hora in [
+            datetime(2018, 11, 4, 2, 30, tzinfo=self.utc),  # sábado 03/11, 23h30 (-03)
+            datetime(2018, 11, 4, 23, 0, tzinfo=self.utc),  # domingo 04/11, 21h (-02)
+            datetime(2019, 2, 17, 2, 0, tzinfo=self.utc),  # sábado 16/02, 23h repetida (-03)
+            datetime(2019, 2, 18, 0, 30, tzinfo=self.utc),  # domingo 17/02, 21h30 (-03)
+        ]:
+            Consulta.objects.create(paciente=self.paciente, medico=self.medico, data_hora=data_hora)
+
+        self.assertEqual(horarios_ocupados_periodo(self.medico, date(2018, 11, 3), date(2018, 11, 4)), {
+            date(2018, 11, 3): {'23:30'}, date(2018, 11, 4): {'21:00'},
+        })
+        self.assertEqual(horarios_ocupados_periodo(self.medico, date(2019, 2, 16), date(2019, 2, 17)), {
+            date(2019, 2, 16): {'23:00'}, date(2019, 2, 17): {'21:30'},
+        })
+        # Consultados dia a dia, os limites de cada dia levam ao mesmo resultado
+        self.assertEqual(horarios_ocupados_periodo(self.medico, date(2019, 2, 17), date(2019, 2, 17)), {
+            date(2019, 2, 17): {'21:30'},
+        })
+
+    def test_formulario_grava_o_horario_com_fuso(self):
+        from .forms import ConsultaForm
+
+        dados = {'paciente': self.paciente.pk, 'medico': self.medico.pk, 'status': 'agendada'}
+        form = ConsultaForm({**dados, 'data': '2018-11-04', 'hora': '21:00'})
+        self.assertTrue(form.is_valid(), form.errors)
+        consulta = form.save()
+        self.assertTrue(timezone.is_aware(consulta.data_hora))
+        self.assertEqual(consulta.data_hora.astimezone(self.utc), datetime(2018, 11, 4, 23, 0, tzinfo=self.utc))
+
+        # Horário repetido no fim do horário de verão: vale a primeira ocorrência (-02)
+        form = ConsultaForm({**dados, 'data': '2019-02-16', 'hora': '23:00'})
+        self.assertTrue(form.is_valid(), form.errors)
+        consulta = form.save()
+        self.assertEqual(consulta.data_hora.astimezone(self.utc), datetime(2019, 2, 17, 1, 0, tzinfo=self.utc))
+        self.assertEqual(Consulta.objects.get(pk=consulta.pk).data_hora, datetime(2019, 2, 17, 1, 0, tzinfo=self.utc))
+
+
+@override_settings(AGENDA_ESPERA_SINCRONA=True)
+class ListaEsperaTests(TestCase):
+    """Lista de espera: horários cancelados são oferecidos às entradas compatíveis, por ordem de chegada"""
+
+    def setUp(self):
+        from .cache import cache_agenda
+
+        cache_agenda().clear()
+        self.addCleanup(cache_agenda().clear)
+        self.medico = criar_medico()
+        self.outro_medico = criar_medico(self.medico.especialidade, nome='Dra. Outra', crm='654321')
+        self.paciente = criar_paciente()
+        self.segunda = date(2030, 1, 7)
+
+    def esperar(self, nome, **kwargs):
+        from .models import ListaEspera
+
+        dados = {'medico': self.medico, 'data_inicio': self.segunda, 'data_fim': self.segunda}
+        dados.update(kwargs)
+        return ListaEspera.objects.create(paciente=criar_paciente(nome=nome, cpf=nome), **dados)
+
+    def agendar(self, hora, paciente=None, medico=None):
+        return Consulta.objects.create(
+            paciente=paciente or self.paciente, medico=medico or self.medico,
+            data_hora=data_hora_local(self.segunda, hora),
+        )
+
+    def test_cancelamento_encaixa_a_primeira_entrada_compativel(self):
+        consulta = self.agendar(time(9, 45))
+        fora_da_janela = self.esperar('Fora da janela', hora_inicio=time(10, 0), hora_fim=time(12, 0))
+        ocupado = self.esperar('Ocupado')
+        self.agendar(time(10, 0), paciente=ocupado.paciente, medico=self.outro_medico)
+        especialidade = self.esperar('Especialidade', medico=None, especialidade=self.medico.especialidade)
+        depois = self.esperar('Depois')
+
+        consulta.status = 'cancelada'
+        with self.assertLogs('agenda.espera', 'INFO') as logs, self.captureOnCommitCallbacks(execute=True):
+            consulta.save()
+        self.assertEqual(len(logs.records), 1)
+
+        especialidade.refresh_from_db()
+        self.assertEqual(especialidade.status, 'atendida')
+        self.assertEqual(
+            (especialidade.consulta.paciente, especialidade.consulta.medico, especialidade.consulta.data_hora),
+            (especialidade.paciente, self.medico, data_hora_local(self.segunda, time(9, 45))),
+        )
+        for entrada in (fora_da_janela, ocupado, depois):
+            entrada.refresh_from_db()
+            self.assertEqual((entrada.status, entrada.consulta), ('aguardando', None))
+
+        # Remarcar (em vez de cancelar) não libera vaga para a lista
+        outra = self.agendar(time(11, 15))
+        outra.data_hora = data_hora_local(self.segunda, time(9, 0))
+        with self.captureOnCommitCallbacks(execute=True):
+            outra.save()
+        depois.refresh_from_db()
+        self.assertEqual(depois.status, 'aguardando')
+
+    def test_cancelamento_em_lote_preenche_as_vagas(self):
+        from .models import SerieConsulta
+        from .recorrencia import cancelar_serie, criar_serie
+
+        serie = SerieConsulta(
+            paciente=self.paciente, medico=self.medico, data_inicio=self.segunda, hora=time(9, 0),
+            intervalo_semanas=1, ocorrencias=3,
+        )
+        criar_serie(serie)
+        primeira = self.esperar('Primeira', data_fim=date(2030, 1, 21))
+        segunda = self.esperar('Segunda', data_fim=date(2030, 1, 21))
+
+        with self.assertLogs('agenda.espera', 'INFO'), self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(cancelar_serie(serie), 3)
+
+        # Cada entrada fica com o primeiro horário liberado ainda livre, por ordem de chegada
+        primeira.refresh_from_db()
+        segunda.refresh_from_db()
+        self.assertEqual(primeira.consulta.data_hora, data_hora_local(self.segunda, time(9, 0)))
+        self.assertEqual(segunda.consulta.data_hora, data_hora_local(date(2030, 1, 14), time(9, 0)))
+        self.assertEqual(Consulta.objects.filter(medico=self.medico, status='agendada').count(), 2)
+
+    def test_cancelamento_em_lote_libera_todos_os_slots_da_consulta(self):
+        from .services import registrar_alteracoes
+
+        # Consulta de 90 min às 9h ocupa os slots das 9h e das 9h45
+        consulta = Consulta.objects.create(
+            paciente=self.paciente, medico=self.medico, data_hora=data_hora_local(self.segunda, time(9, 0)),
+            duracao_minutos=90,
+        )
+        primeira, segunda = self.esperar('Primeira'), self.esperar('Segunda')
+        with self.assertLogs('agenda.espera', 'INFO'), self.captureOnCommitCallbacks(execute=True):
+            Consulta.objects.filter(pk=consulta.pk).update(status='cancelada')
+            antes = (self.medico.pk, consulta.data_hora, 'agendada')
+            registrar_alteracoes([(consulta.pk, antes, (*antes[:2], 'cancelada'), consulta.duracao_minutos)])
+
+        primeira.refresh_from_db()
+        segunda.refresh_from_db()
+        self.assertEqual(
+            [timezone.localtime(entrada.consulta.data_hora).time() for entrada in (primeira, segunda)],
+            [time(9, 0), time(9, 45)],
+        )
+
+    def test_cadastro_e_listagem(self):
+        response = self.client.post(reverse('lista_espera_create'), {
+            'paciente': self.paciente.pk, 'especialidade': self.medico.especialidade.pk,
+            'data_inicio': '2030-01-07', 'data_fim': '2030-01-11', 'hora_inicio': '09:00', 'hora_fim': '11:00',
+        })
+        self.assertRedirects(response, reverse('lista_espera_list'))
+        # Sem médico nem especialidade, ou com a janela invertida, a entrada é recusada
+        response = self.client.post(reverse('lista_espera_create'), {
+            'paciente': self.paciente.pk, 'data_inicio': '2030-01-11', 'data_fim': '2030-01-07',
+        })
+        self.assertTrue(response.context['form'].errors)
+
+        self.esperar('Do médico', medico=self.outro_medico)
+        response = self.client.get(reverse('lista_espera_list'), {'medico': self.outro_medico.pk})
+        self.assertEqual([entrada.paciente.nome for entrada in response.context['listaespera_list']], ['Do médico'])
+        response = self.client.get(reverse('lista_espera_list'))
+        self.assertEqual(len(response.context['listaespera_list']), 2)
@@ -5,11 +5,21 @@ from .views import (
     EspecialidadeCreateView, 
     EspecialidadeUpdateView, 
     EspecialidadeDeleteView,
+    EspecialidadeProximosHorariosView,
     MedicoListView,
     MedicoDetailView,
     MedicoCreateView,
     MedicoUpdateView,
     MedicoDeleteView,
+    remarcacao_medico,
+    BloqueioAgendaListView,
+    BloqueioAgendaCreateView,
+    BloqueioAgendaUpdateView,
+    BloqueioAgendaDeleteView,
+    ListaEsperaListView,
+    ListaEsperaCreateView,
+    ListaEsperaUpdateView,
+    ListaEsperaDeleteView,
     PacienteListView,
     PacienteDetailView,
     PacienteCreateView,
@@ -20,7 +30,16 @@ from .views import (
     ConsultaCreateView,
     ConsultaUpdateView,
     ConsultaDeleteView,
+    SerieConsultaCreateView,
+    serie_consulta_detail,
+    alterar_serie_consulta,
+    cancelar_serie_consulta,
     get_medico_availability,
+    exportar_consultas,
+    agenda_medico_ics,
+    painel_consultas,
+    utilizacao_medicos,
+    exportar_utilizacao_medicos,
 )
 
 urlpatterns = [
@@ -29,20 +48,39 @@ urlpatterns = [
     path('especialidades/novo/', EspecialidadeCreateView.as_view(), name='especialidade_create'),
     path('especialidades/<int:pk>/editar/', EspecialidadeUpdateView.as_view(), name='especialidade_update'),
     path('especialidades/<int:pk>/excluir/', EspecialidadeDeleteView.as_view(), name='especialidade_delete'),   
+    path('especialidades/<int:pk>/proximos-horarios/', EspecialidadeProximosHorariosView.as_view(), name='especialidade_proximos_horarios'),
     path('medicos/', MedicoListView.as_view(), name='medico_list'),
+    path('medicos/utilizacao/', utilizacao_medicos, name='utilizacao_medicos'),
+    path('medicos/utilizacao/csv/', exportar_utilizacao_medicos, name='utilizacao_medicos_csv'),
     path('medicos/<int:pk>/', MedicoDetailView.as_view(), name='medico_detail'),
     path('medicos/novo/', MedicoCreateView.as_view(), name='medico_create'),
     path('medicos/<int:pk>/editar/', MedicoUpdateView.as_view(), name='medico_update'),
     path('medicos/<int:pk>/excluir/', MedicoDeleteView.as_view(), name='medico_delete'),
+    path('medicos/<int:pk>/remarcacao/', remarcacao_medico, name='medico_remarcacao'),
+    path('medicos/<int:medico_id>/agenda.ics', agenda_medico_ics, name='medico_agenda_ics'),
+    path('bloqueios/', BloqueioAgendaListView.as_view(), name='bloqueio_list'),
+    path('bloqueios/novo/', BloqueioAgendaCreateView.as_view(), name='bloqueio_create'),
+    path('bloqueios/<int:pk>/editar/', BloqueioAgendaUpdateView.as_view(), name='bloqueio_update'),
+    path('bloqueios/<int:pk>/excluir/', BloqueioAgendaDeleteView.as_view(), name='bloqueio_delete'),
+    path('espera/', ListaEsperaListView.as_view(), name='lista_espera_list'),
+    path('espera/nova/', ListaEsperaCreateView.as_view(), name='lista_espera_create'),
+    path('espera/<int:pk>/editar/', ListaEsperaUpdateView.as_view(), name='lista_espera_update'),
+    path('espera/<int:pk>/excluir/', ListaEsperaDeleteView.as_view(), name='lista_espera_delete'),
     path('pacientes/', PacienteListView.as_view(), name='paciente_list'),
     path('pacientes/<int:pk>/', PacienteDetailView.as_view(), name='paciente_detail'),
     path('pacientes/novo/', PacienteCreateView.as_view(), name='paciente_create'),
     path('pacientes/<int:pk>/editar/', PacienteUpdateView.as_view(), name='paciente_update'),
     path('pacientes/<int:pk>/excluir/', PacienteDeleteView.as_view(), name='paciente_delete'),
     path('consultas/', ConsultaListView.as_view(), name='consulta_list'),
+    path('consultas/painel/', painel_consultas, name='painel_consultas'),
+    path('consultas/exportar/<str:formato>/', exportar_consultas, name='consulta_exportar'),
     path('consultas/<int:pk>/', ConsultaDetailView.as_view(), name='consulta_detail'),
     path('consultas/novo/', ConsultaCreateView.as_view(), name='consulta_create'),
     path('consultas/<int:pk>/editar/', ConsultaUpdateView.as_view(), name='consulta_update'),
     path('consultas/<int:pk>/excluir/', ConsultaDeleteView.as_view(), name='consulta_delete'),
+    path('consultas/series/nova/', SerieConsultaCreateView.as_view(), name='serie_consulta_create'),
+    path('consultas/series/<int:pk>/', serie_consulta_detail, name='serie_consulta_detail'),
+    path('consultas/series/<int:pk>/alterar/', alterar_serie_consulta, name='serie_consulta_alterar'),
+    path('consultas/series/<int:pk>/cancelar/', cancelar_serie_consulta, name='serie_consulta_cancelar'),
 ]
     
\ No newline at end of file
@@ -0,0 +1,253 @@
+import csv
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+from functools import lru_cache
+
+from django.db import NotSupportedError
+from django.db.models import Count, Func, IntegerField
+from django.utils import timezone
+
+from .exportacao import Eco
+from .models import Consulta, Medico
+from .scheduling import (
+    DURACAO_SLOT_MINUTOS, STATUS_OCUPADOS, agrupar_bloqueios, bloqueios_periodo, grade_horarios, horarios_bloqueados,
+    mascara_para_indices, periodo_local,
+)
+
+DIAS_SEMANA = ['Segunda', 'Terça', 'Quarta', 'Quinta', 'Sexta', 'Sábado', 'Domingo']
+
+CABECALHO_CSV = [
+    'medico_id', 'medico', 'medico_crm', 'especialidade', 'dia_semana', 'hora',
+    'slots_disponiveis', 'slots_ocupados', 'utilizacao',
+]
+
+# 1970-01-01 (época Unix) foi uma quinta-feira: índice 3 com segunda = 0
+_MINUTOS_QUINTA = 3 * 24 * 60
+MINUTOS_SEMANA = 7 * 24 * 60
+
+
+class MinutoDaSemana(Func):
+    """Minuto da semana (0 = segunda 00h00 ... 10079 = domingo 23h59) de um datetime, com o fuso em `minutos`.
+
+    Calculada pelo próprio banco: no SQLite, os Extract* do Django chamam funções Python
+    a cada linha, o que é bem mais lento para agrupar milhões de consultas.
+    """
+    output_field = IntegerField()
+
+    def __init__(self, expressao, minutos, **extra):
+        super().__init__(expressao, deslocamento=_MINUTOS_QUINTA + int(minutos), **extra)
+
+    def as_sql(self, compiler, connection, **extra):
+        raise NotSupportedError(f'MinutoDaSemana não está disponível para {connection.vendor}.')
+
+    def as_sqlite(self, compiler, connection, **extra):
+        return super().as_sql(
+            compiler, connection,
+            template="((CAST(strftime('%%%%s', %(expressions)s) AS INTEGER) / 60 + %(deslocamento)d) %%%% 10080)",
+            **extra,
+        )
+
+    def as_postgresql(self, compiler, connection, **extra):
+        return super().as_sql(
+            compiler, connection,
+            template='((FLOOR(EXTRACT(EPOCH FROM %(expressions)s) / 60)::bigint + %(deslocamento)d) %%%% 10080)',
+            **extra,
+        )
+
+
+def ocorrencias_dias_semana(inicio, fim):
+    """Quantas vezes cada dia da semana (0 = segunda) aparece de inicio a fim (inclusive)"""
+    semanas, resto = divmod((fim - inicio).days + 1, 7)
+    return [semanas + ((dia - inicio.weekday()) % 7 < resto) for dia in range(7)]
+
+
+@lru_cache(maxsize=1024)
+def slots_por_hora(hora_inicio, hora_fim, duracao=DURACAO_SLOT_MINUTOS):
+    """((hora, slots que começam nessa hora), ...) da grade do expediente"""
+    return tuple(sorted(Counter(horario.hour for horario in grade_horarios(hora_inicio, hora_fim, duracao).horarios).items()))
+
+
+def slots_disponiveis(mascara, hora_inicio, hora_fim, duracao, ocorrencias):
+    """Counter {(dia, hora): slots} de um expediente, dadas as ocorrências de cada dia da semana no período"""
+    por_hora = slots_por_hora(hora_inicio, hora_fim, duracao)
+    return Counter({
+        (dia, hora): ocorrencias[dia] * slots
+        for dia in mascara_para_indices(mascara)
+        for hora, slots in por_hora
+        if ocorrencias[dia]
+    })
+
+
+def slots_bloqueados(mascara, hora_inicio, hora_fim, duracao, bloqueios):
+    """Counter {(dia, hora): slots} de um expediente bloqueados nas datas {data: [(hora_inicio, hora_fim)]}"""
+    grade = grade_horarios(hora_inicio, hora_fim, duracao)
+    bloqueados = Counter()
+    for data, intervalos in bloqueios.items():
+        if mascara & (1 << data.weekday()):
+            for rotulo in horarios_bloqueados(grade, intervalos, duracao):
+                bloqueados[data.weekday(), int(rotulo[:2])] += 1
+    return bloqueados
+
+
+def _segmentos_fuso(inicio, fim, fuso):
+    """Divide [inicio, fim) em trechos de deslocamento constante em relação a UTC: [(inicio, fim, minutos)]"""
+    def deslocamento(segundos):
+        return int(datetime.fromtimestamp(segundos, fuso).utcoffset().total_seconds()) // 60
+
+    a, b = int(inicio.timestamp()), int(fim.timestamp())
+    segmentos = []
+    while a < b:
+        minutos = deslocamento(a)
+        # Avança de dia em dia até o deslocamento mudar e então busca o segundo exato da transição
+        baixo, alto = a, min(a + 86400, b)
+        while alto < b and deslocamento(alto) == minutos:
+            baixo, alto = alto, min(alto + 86400, b)
+        if deslocamento(alto - 1) != minutos:
+            alto -= 1
+            while alto - baixo > 1:
+                meio = (baixo + alto) // 2
+                if deslocamento(meio) == minutos:
+                    baixo = meio
+                else:
+                    alto = meio
+        segmentos.append((
+            datetime.fromtimestamp(a, dt_timezone.utc), datetime.fromtimestamp(alto, dt_timezone.utc), minutos,
+        ))
+        a = alto
+    return segmentos
+
+
+def slots_ocupados(inicio, fim, medicos=None):
+    """Counter {(medico_id, dia, hora): slots ocupados} de inicio a fim (inclusive), no horário local.
+
+    Cada consulta ativa ocupa ceil(duração / duração do slot) slots da grade do médico,
+    contados na hora em que cada um começa. Uma consulta agrupada (por início na semana e
+    duração) por trecho do período com o mesmo deslocamento do fuso (um único trecho
+    quando não há horário de verão).
+    """
+    fuso = timezone.get_current_timezone()
+    consultas = Consulta.objects.filter(status__in=STATUS_OCUPADOS)
+    if medicos is not None:
+        consultas = consultas.filter(medico__in=medicos)
+    ocupados = Counter()
+    for comeco, termino, minutos in _segmentos_fuso(*periodo_local(inicio, fim, fuso), fuso):
+        linhas = (
+            consultas.filter(data_hora__gte=comeco, data_hora__lt=termino)
+            .annotate(minuto_semana=MinutoDaSemana('data_hora', minutos)).order_by()
+            .values_list('medico_id', 'medico__duracao_slot', 'minuto_semana', 'duracao_minutos')
+            .annotate(quantidade=Count('id'))
+        )
+        for medico_id, duracao_slot, minuto_semana, duracao, quantidade in linhas:
+            for inicio_slot in range(minuto_semana, minuto_semana + duracao, duracao_slot):
+                ocupados[medico_id, *divmod(inicio_slot % MINUTOS_SEMANA // 60, 24)] += quantidade
+    return ocupados
+
+
+def _utilizacao(ocupados, disponiveis):
+    return ocupados / disponiveis if disponiveis else None
+
+
+def relatorio_utilizacao(inicio, fim, medicos=None):
+    """Utilização (slots ocupados / slots disponíveis) de cada médico de inicio a fim (inclusive).
+
+    Os slots disponíveis são contados pela aritmética da grade semanal (ocorrências
+    de cada dia da semana x slots por hora de cada expediente distinto) e os
+    ocupados, por contagens agrupadas no banco; só os dias com bloqueios (férias,
+    feriados) são percorridos, para descontá-los dos disponíveis.
+    Retorna {'medicos': [...], 'por_dia_hora': {(dia, hora): (disponiveis, ocupados)}, 'totais': {...}};
+    cada médico traz as mesmas células em 'celulas'.
+    """
+    ocorrencias = ocorrencias_dias_semana(inicio, fim)
+    ocupados = slots_ocupados(inicio, fim, medicos)
+    bloqueios = agrupar_bloqueios(bloqueios_periodo(medicos, inicio, fim), inicio, fim)
+    bloqueios_clinica = bloqueios.get(None, {})
+    medicos = Medico.objects.all() if medicos is None else medicos
+    por_medico = {}
+    for (medico_id, dia, hora), quantidade in ocupados.items():
+        por_medico.setdefault(medico_id, {})[dia, hora] = quantidade
+
+    expedientes = {}
+    linhas = []
+    por_dia_hora = {}
+    for medico in medicos.values(
+        'id', 'nome', 'crm', 'especialidade__nome', 'dias_trabalho_mascara', 'hora_inicio', 'hora_fim', 'duracao_slot',
+    ).order_by('nome', 'id'):
+        chave = (medico['dias_trabalho_mascara'], medico['hora_inicio'], medico['hora_fim'], medico['duracao_slot'])
+        if chave not in expedientes:
+            expedientes[chave] = slots_disponiveis(*chave, ocorrencias) - slots_bloqueados(*chave, bloqueios_clinica)
+        disponiveis = expedientes[chave]
+        if medico['id'] in bloqueios:
+            # Bloqueios próprios somados aos da clínica (um slot bloqueado pelos dois conta uma vez)
+            dias = {data: list(intervalos) for data, intervalos in bloqueios_clinica.items()}
+            for data, intervalos in bloqueios[medico['id']].items():
+                dias.setdefault(data, []).extend(intervalos)
+            disponiveis = slots_disponiveis(*chave, ocorrencias) - slots_bloqueados(*chave, dias)
+        ocupados_medico = por_medico.get(medico['id'], {})
+        celulas = {
+            celula: (disponiveis.get(celula, 0), ocupados_medico.get(celula, 0))
+            for celula in sorted(disponiveis.keys() | ocupados_medico.keys())
+        }
+        for celula, (disponivel, ocupado) in celulas.items():
+            soma = por_dia_hora.get(celula, (0, 0))
+            por_dia_hora[celula] = (soma[0] + disponivel, soma[1] + ocupado)
+        total_disponiveis = sum(disponiveis.values())
+        total_ocupados = sum(ocupados_medico.values())
+        linhas.append({
+            'id': medico['id'],
+            'nome': medico['nome'],
+            'crm': medico['crm'],
+            'especialidade': medico['especialidade__nome'],
+            'disponiveis': total_disponiveis,
+            'ocupados': total_ocupados,
+            'utilizacao': _utilizacao(total_ocupados, total_disponiveis),
+            'celulas': celulas,
+        })
+
+    total_disponiveis = sum(linha['disponiveis'] for linha in linhas)
+    total_ocupados = sum(linha['ocupados'] for linha in linhas)
+    return {
+        'medicos': linhas,
+        'por_dia_hora': dict(sorted(por_dia_hora.items())),
+        'totais': {
+            'disponiveis': total_disponiveis,
+            'ocupados': total_ocupados,
+            'utilizacao': _utilizacao(total_ocupados, total_disponiveis),
+        },
+    }
+
+
+def grade_semanal(por_dia_hora):
+    """Linhas [{'hora', 'dias': [célula ou None por dia da semana]}] para exibir como tabela hora x dia"""
+    horas = sorted({hora for _, hora in por_dia_hora})
+    linhas = []
+    for hora in horas:
+        dias = []
+        for dia in range(7):
+            disponiveis, ocupados = por_dia_hora.get((dia, hora), (0, 0))
+            dias.append({
+                'disponiveis': disponiveis,
+                'ocupados': ocupados,
+                'utilizacao': _utilizacao(ocupados, disponiveis),
+            } if disponiveis or ocupados else None)
+        linhas.append({'hora': hora, 'dias': dias})
+    return linhas
+
+
+def linhas_csv(relatorio):
+    """Gera o CSV do relatório, uma linha por médico, dia da semana e hora"""
+    escritor = csv.writer(Eco())
+    yield escritor.writerow(CABECALHO_CSV)
+    for medico in relatorio['medicos']:
+        for (dia, hora), (disponiveis, ocupados) in medico['celulas'].items():
+            utilizacao = _utilizacao(ocupados, disponiveis)
+            yield escritor.writerow([
+                medico['id'],
+                medico['nome'],
+                medico['crm'],
+                medico['especialidade'],
+                DIAS_SEMANA[dia],
+                f'{hora:02d}:00',
+                disponiveis,
+                ocupados,
+                '' if utilizacao is None else f'{utilizacao:.4f}',
+            ])
@@ -1,33 +1,112 @@
+import logging
+
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
-from django.urls import reverse_lazy
-from django.http import JsonResponse
-from django.views.decorators.http import require_http_methods
-from django.shortcuts import get_object_or_404
-from .models import Especialidade, Medico, Paciente, Consulta
-from .forms import ConsultaForm, MedicoForm
+from django.urls import reverse, reverse_lazy
+from django.http import HttpResponseRedirect, JsonResponse
+from django.views.decorators.http import condition, require_http_methods
+from django.shortcuts import get_object_or_404, render
+from django.db.models import Count
+from .agregados import total_consultas_medico
+from .models import Especialidade, Medico, Paciente, Consulta, SerieConsulta, BloqueioAgenda, ListaEspera
+from .forms import (
+    BloqueioAgendaForm, ConsultaFiltroForm, ConsultaForm, EspecialidadeForm, ListaEsperaForm, MedicoForm, PainelFiltroForm, SerieAlteracaoForm, SerieConsultaForm,
+    UtilizacaoFiltroForm,
+)
+from .pagination import CursorInvalido, paginar_keyset
+from .search import buscar_medicos, buscar_pacientes, filtrar_pacientes
+from .services import salvar_consulta
+
+logger = logging.getLogger(__name__)
+
+
+class ConsultasRecentesMixin:
+    """Adiciona ao contexto as últimas consultas do objeto, com os relacionamentos já carregados"""
+    consultas_related = ()
+    consultas_recentes_limite = 5
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['consultas_recentes'] = list(
+            self.object.consultas.select_related(*self.consultas_related)
+            .order_by('-data_hora', '-id')[:self.consultas_recentes_limite]
+        )
+        return context
+
+def _medicos_para_revisao(medicos):
+    """Médicos com consultas futuras fora do expediente atual (uma consulta por médico)"""
+    from .remarcacao import consultas_afetadas
+
+    return [medico for medico in medicos if consultas_afetadas(medico)]
+
+class MedicosDaEspecialidadeMixin:
+    """Carrega a contagem e a lista de médicos da especialidade em consultas únicas"""
+
+    def get_queryset(self):
+        return super().get_queryset().annotate(num_medicos=Count('medicos'))
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['medicos'] = list(self.object.medicos.all())
+        return context
 
 # Especialidade Views
 class EspecialidadeListView(ListView):
     model = Especialidade
     template_name = 'especialidade_list.html'
 
-class EspecialidadeDetailView(DetailView):
+    def get_queryset(self):
+        return super().get_queryset().annotate(num_medicos=Count('medicos'))
+
+class EspecialidadeDetailView(MedicosDaEspecialidadeMixin, DetailView):
     model = Especialidade
     template_name = 'especialidade_detail.html'
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Após mudar a duração das consultas: médicos com consultas futuras fora da nova grade
+        if self.request.GET.get('revisar'):
+            context['medicos_revisao'] = _medicos_para_revisao(context['medicos'])
+        return context
+
+class EspecialidadeProximosHorariosView(DetailView):
+    model = Especialidade
+    template_name = 'especialidade_proximos_horarios.html'
+
+    def get_context_data(self, **kwargs):
+        from .scheduling import MAX_LIMITE_PROXIMOS, proximos_horarios_especialidade
+
+        context = super().get_context_data(**kwargs)
+        a_partir_de, limite = _parse_busca_proximos(self.request)
+        context['a_partir_de'] = a_partir_de
+        context['limite'] = limite
+        context['max_limite'] = MAX_LIMITE_PROXIMOS
+        context['horarios'] = proximos_horarios_especialidade(self.object, a_partir_de, limite)
+        return context
+
 class EspecialidadeCreateView(CreateView):
     model = Especialidade
-    fields = ['nome', 'descricao']
+    form_class = EspecialidadeForm
     template_name = 'especialidade_form.html'
     success_url = reverse_lazy('especialidade_list')
 
 class EspecialidadeUpdateView(UpdateView):
     model = Especialidade
-    fields = ['nome', 'descricao']
+    form_class = EspecialidadeForm
     template_name = 'especialidade_form.html'
     success_url = reverse_lazy('especialidade_list')
 
-class EspecialidadeDeleteView(DeleteView):
+    def form_valid(self, form):
+        resposta = super().form_valid(form)
+        # A nova duração muda a grade dos médicos que a herdam: levar à revisão das consultas afetadas
+        if 'duracao_consulta' in form.changed_data:
+            afetados = _medicos_para_revisao(self.object.medicos.filter(duracao_consulta__isnull=True))
+            if len(afetados) == 1:
+                return HttpResponseRedirect(reverse('medico_remarcacao', args=[afetados[0].pk]))
+            if afetados:
+                return HttpResponseRedirect(f"{reverse('especialidade_detail', args=[self.object.pk])}?revisar=1")
+        return resposta
+
+class EspecialidadeDeleteView(MedicosDaEspecialidadeMixin, DeleteView):
     model = Especialidade
     template_name = 'especialidade_confirm_delete.html'
     success_url = reverse_lazy('especialidade_list')
@@ -37,9 +116,16 @@ class MedicoListView(ListView):
     model = Medico
     template_name = 'medico_list.html'
 
-class MedicoDetailView(DetailView):
+    def get_queryset(self):
+        return super().get_queryset().select_related('especialidade').annotate(num_consultas=total_consultas_medico())
+
+class MedicoDetailView(ConsultasRecentesMixin, DetailView):
     model = Medico
     template_name = 'medico_detail.html'
+    consultas_related = ('paciente',)
+
+    def get_queryset(self):
+        return super().get_queryset().select_related('especialidade').annotate(num_consultas=total_consultas_medico())
 
 class MedicoCreateView(CreateView):
     model = Medico
@@ -53,19 +139,157 @@ class MedicoUpdateView(UpdateView):
     template_name = 'medico_form.html'
     success_url = reverse_lazy('medico_list')
 
-class MedicoDeleteView(DeleteView):
+    def form_valid(self, form):
+        from .remarcacao import consultas_afetadas
+
+        resposta = super().form_valid(form)
+        # Com o expediente ou a especialidade (duração herdada) alterados, levar à revisão das consultas futuras fora dele
+        campos = {'dias_trabalho', 'hora_inicio', 'hora_fim', 'duracao_consulta', 'especialidade'}
+        if campos & set(form.changed_data) and consultas_afetadas(self.object):
+            return HttpResponseRedirect(reverse('medico_remarcacao', args=[self.object.pk]))
+        return resposta
+
+class MedicoDeleteView(ConsultasRecentesMixin, DeleteView):
     model = Medico
     template_name = 'medico_confirm_delete.html'
     success_url = reverse_lazy('medico_list')
+    consultas_related = ('paciente',)
+
+    def get_queryset(self):
+        return super().get_queryset().select_related('especialidade').annotate(num_consultas=Count('consultas'))
+
+@require_http_methods(["GET", "POST"])
+def remarcacao_medico(request, pk):
+    """Consultas futuras fora do expediente atual do médico: proposta (GET) e aplicação em lote (POST)"""
+    from django.db import IntegrityError
+    from .remarcacao import aplicar_remarcacao, propor_remarcacao
+
+    medico = get_object_or_404(Medico.objects.select_related('especialidade'), pk=pk)
+    context = {'medico': medico}
+    if request.method == 'POST':
+        try:
+            remarcadas, canceladas = aplicar_remarcacao(medico, cancelar_todas=request.POST.get('acao') == 'cancelar')
+        except IntegrityError:
+            context['erro'] = 'A agenda foi alterada durante a remarcação. Revise as propostas e tente novamente.'
+        else:
+            context['resultado'] = {'remarcadas': len(remarcadas), 'canceladas': len(canceladas)}
+    context['propostas'] = propor_remarcacao(medico)
+    context['sem_horario'] = sum(1 for proposta in context['propostas'] if proposta.nova_data_hora is None)
+    return render(request, 'medico_remarcacao.html', context)
+
+
+# Bloqueios de agenda (férias, feriados e horários bloqueados)
+class BloqueioAgendaListView(ListView):
+    """Bloqueios vigentes e futuros, da clínica e de cada médico (?medico= filtra um médico)"""
+    model = BloqueioAgenda
+    template_name = 'bloqueio_list.html'
+    paginate_by = 50
+
+    def get_queryset(self):
+        from django.utils import timezone
+
+        bloqueios = super().get_queryset().filter(data_fim__gte=timezone.localdate()).select_related('medico')
+        medico_id = self.request.GET.get('medico')
+        if medico_id and medico_id.isdigit():
+            bloqueios = bloqueios.filter(medico_id=medico_id)
+        return bloqueios
+
+class BloqueioAgendaCreateView(CreateView):
+    model = BloqueioAgenda
+    form_class = BloqueioAgendaForm
+    template_name = 'bloqueio_form.html'
+    success_url = reverse_lazy('bloqueio_list')
+
+    def get_initial(self):
+        # Permite pré-selecionar o médico (ex.: a partir da página do médico)
+        initial = super().get_initial()
+        if self.request.GET.get('medico'):
+            initial['medico'] = self.request.GET['medico']
+        return initial
+
+class BloqueioAgendaUpdateView(UpdateView):
+    model = BloqueioAgenda
+    form_class = BloqueioAgendaForm
+    template_name = 'bloqueio_form.html'
+    success_url = reverse_lazy('bloqueio_list')
+
+class BloqueioAgendaDeleteView(DeleteView):
+    model = BloqueioAgenda
+    template_name = 'bloqueio_confirm_delete.html'
+    success_url = reverse_lazy('bloqueio_list')
+
+class ListaEsperaListView(ListView):
+    """Pacientes aguardando horário com janela vigente (?medico= e ?especialidade= filtram)"""
+    model = ListaEspera
+    template_name = 'lista_espera_list.html'
+    paginate_by = 50
+
+    def get_queryset(self):
+        from django.utils import timezone
+
+        esperas = (
+            super().get_queryset().filter(status='aguardando', data_fim__gte=timezone.localdate())
+            .select_related('paciente', 'medico', 'especialidade')
+        )
+        for campo in ('medico', 'especialidade'):
+            valor = self.request.GET.get(campo)
+            if valor and valor.isdigit():
+                esperas = esperas.filter(**{f'{campo}_id': valor})
+        return esperas
+
+class ListaEsperaCreateView(CreateView):
+    model = ListaEspera
+    form_class = ListaEsperaForm
+    template_name = 'lista_espera_form.html'
+    success_url = reverse_lazy('lista_espera_list')
+
+    def get_initial(self):
+        # Permite pré-selecionar paciente, médico ou especialidade (ex.: a partir das páginas de detalhe)
+        initial = super().get_initial()
+        for campo in ('paciente', 'medico', 'especialidade'):
+            if self.request.GET.get(campo):
+                initial[campo] = self.request.GET[campo]
+        return initial
+
+class ListaEsperaUpdateView(UpdateView):
+    model = ListaEspera
+    form_class = ListaEsperaForm
+    template_name = 'lista_espera_form.html'
+    success_url = reverse_lazy('lista_espera_list')
+
+    def get_queryset(self):
+        return super().get_queryset().filter(status='aguardando')
+
+class ListaEsperaDeleteView(DeleteView):
+    model = ListaEspera
+    template_name = 'lista_espera_confirm_delete.html'
+    success_url = reverse_lazy('lista_espera_list')
 
 # Paciente Views
 class PacienteListView(ListView):
     model = Paciente
     template_name = 'paciente_list.html'
+    paginate_by = 25
+
+    def get_queryset(self):
+        queryset = super().get_queryset().annotate(num_consultas=Count('consultas'))
+        busca = self.request.GET.get('q', '').strip()
+        if busca:
+            return filtrar_pacientes(queryset, busca)
+        return queryset.order_by('nome_busca', 'id')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['busca'] = self.request.GET.get('q', '').strip()
+        return context
 
-class PacienteDetailView(DetailView):
+class PacienteDetailView(ConsultasRecentesMixin, DetailView):
     model = Paciente
     template_name = 'paciente_detail.html'
+    consultas_related = ('medico__especialidade',)
+
+    def get_queryset(self):
+        return super().get_queryset().annotate(num_consultas=Count('consultas'))
 
 class PacienteCreateView(CreateView):
     model = Paciente
@@ -79,27 +303,79 @@ class PacienteUpdateView(UpdateView):
     template_name = 'paciente_form.html'
     success_url = reverse_lazy('paciente_list')
 
-class PacienteDeleteView(DeleteView):
+class PacienteDeleteView(ConsultasRecentesMixin, DeleteView):
     model = Paciente
     template_name = 'paciente_confirm_delete.html'
     success_url = reverse_lazy('paciente_list')
+    consultas_related = ('medico',)
+
+    def get_queryset(self):
+        return super().get_queryset().annotate(num_consultas=Count('consultas'))
 
 # Consulta Views
 class ConsultaListView(ListView):
     model = Consulta
     template_name = 'consulta_list.html'
+    paginate_by = 25
+
+    def get_queryset(self):
+        self.filtro_form = ConsultaFiltroForm(self.request.GET or None)
+        queryset = super().get_queryset().select_related('paciente', 'medico__especialidade')
+        return self.filtro_form.filtrar(queryset)
+
+    def paginate_queryset(self, queryset, page_size):
+        """Paginação por cursor (keyset) em (data_hora, id) no lugar de LIMIT/OFFSET"""
+        try:
+            pagina = paginar_keyset(
+                queryset, page_size,
+                apos=self.request.GET.get('apos'),
+                antes=self.request.GET.get('antes'),
+            )
+        except CursorInvalido:
+            pagina = paginar_keyset(queryset, page_size)
+        return (None, pagina, pagina.object_list, pagina.tem_proxima or pagina.tem_anterior)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Filtros atuais, sem os cursores, para montar os links de paginação
+        parametros = self.request.GET.copy()
+        parametros.pop('apos', None)
+        parametros.pop('antes', None)
+        context['filtro_form'] = self.filtro_form
+        context['filtros_querystring'] = parametros.urlencode()
+        return context
 
 class ConsultaDetailView(DetailView):
     model = Consulta
     template_name = 'consulta_detail.html'
 
-class ConsultaCreateView(CreateView):
+    def get_queryset(self):
+        return super().get_queryset().select_related('paciente', 'medico__especialidade')
+
+class SalvarConsultaMixin:
+    """Salva a consulta pelo serviço de agendamento, tratando conflitos de horário como erro do formulário"""
+
+    def form_valid(self, form):
+        self.object = salvar_consulta(form)
+        if self.object is None:
+            return self.form_invalid(form)
+        return HttpResponseRedirect(self.get_success_url())
+
+class ConsultaCreateView(SalvarConsultaMixin, CreateView):
     model = Consulta
     form_class = ConsultaForm
     template_name = 'consulta_form.html'
     success_url = reverse_lazy('consulta_list')
 
-class ConsultaUpdateView(UpdateView):
+    def get_initial(self):
+        # Permite pré-preencher médico, data e horário (ex.: a partir da busca de próximos horários)
+        initial = super().get_initial()
+        for campo in ('medico', 'data', 'hora'):
+            if self.request.GET.get(campo):
+                initial[campo] = self.request.GET[campo]
+        return initial
+
+class ConsultaUpdateView(SalvarConsultaMixin, UpdateView):
     model = Consulta
     form_class = ConsultaForm
     template_name = 'consulta_form.html'
@@ -110,118 +386,604 @@ class ConsultaDeleteView(DeleteView):
     template_name = 'consulta_confirm_delete.html'
     success_url = reverse_lazy('consulta_list')
 
+    def get_queryset(self):
+        return super().get_queryset().select_related('paciente', 'medico__especialidade')
+
+
+class SerieConsultaCreateView(CreateView):
+    model = SerieConsulta
+    form_class = SerieConsultaForm
+    template_name = 'serie_consulta_form.html'
+
+    def form_valid(self, form):
+        from .recorrencia import criar_serie
+
+        consultas, conflitos = criar_serie(form.instance, form.cleaned_data['ignorar_conflitos'])
+        if not consultas:
+            form.add_conflitos(conflitos)
+            return self.form_invalid(form)
+        self.object = form.instance
+        return HttpResponseRedirect(self.get_success_url())
+
+    def get_success_url(self):
+        return reverse('serie_consulta_detail', args=[self.object.pk])
+
+
+def _contexto_serie(serie, alteracao_form=None):
+    """Série, situação de cada data prevista e formulário de alteração das ocorrências futuras"""
+    from django.utils import timezone
+
+    consultas = {
+        timezone.localtime(consulta.data_hora).date(): consulta
+        for consulta in serie.consultas.order_by('data_hora', 'id')
+    }
+    return {
+        'serie': serie,
+        'ocorrencias': [{'data': data, 'consulta': consultas.pop(data, None)} for data in serie.datas()]
+        + [{'data': data, 'consulta': consulta} for data, consulta in consultas.items()],
+        'alteracao_form': alteracao_form or SerieAlteracaoForm(initial={
+            'hora': serie.hora, 'observacoes': serie.observacoes,
+        }),
+    }
+
+
+@require_http_methods(["GET"])
+def serie_consulta_detail(request, pk):
+    serie = get_object_or_404(SerieConsulta.objects.select_related('paciente', 'medico__especialidade'), pk=pk)
+    return render(request, 'serie_consulta_detail.html', _contexto_serie(serie))
+
+
+@require_http_methods(["POST"])
+def alterar_serie_consulta(request, pk):
+    """Move todas as ocorrências futuras da série para o novo horário, em lote"""
+    from .recorrencia import alterar_serie
+
+    serie = get_object_or_404(SerieConsulta.objects.select_related('paciente', 'medico__especialidade'), pk=pk, cancelada=False)
+    form = SerieAlteracaoForm(request.POST)
+    if form.is_valid():
+        _, conflitos = alterar_serie(serie, form.cleaned_data['hora'], form.cleaned_data['observacoes'])
+        if not conflitos:
+            return HttpResponseRedirect(reverse('serie_consulta_detail', args=[serie.pk]))
+        form.add_conflitos(conflitos)
+    return render(request, 'serie_consulta_detail.html', _contexto_serie(serie, form), status=400)
+
+
+@require_http_methods(["POST"])
+def cancelar_serie_consulta(request, pk):
+    """Cancela a série e todas as ocorrências futuras, em lote"""
+    from .recorrencia import cancelar_serie
+
+    serie = get_object_or_404(SerieConsulta, pk=pk, cancelada=False)
+    cancelar_serie(serie)
+    return HttpResponseRedirect(reverse('serie_consulta_detail', args=[serie.pk]))
+
+
+def _parse_data(texto):
+    """Converte AAAA-MM-DD em date; retorna None para valores ausentes ou inválidos"""
+    from datetime import datetime
+
+    try:
+        return datetime.strptime(texto or '', '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def _parse_data_disponibilidade(request):
+    """Lê o parâmetro data (opcional); retorna (data, None) ou (None, resposta de erro) se for inválido"""
+    texto = request.GET.get('data')
+    data_obj = _parse_data(texto)
+    if texto and data_obj is None:
+        return None, JsonResponse({'success': False, 'error': 'Parâmetro data deve estar no formato AAAA-MM-DD.'}, status=400)
+    return data_obj, None
+
+
+def _resposta_disponibilidade(medico, data_selecionada, horarios_ocupados):
+    """Resposta da API de disponibilidade do dia a partir dos horários ocupados"""
+    horarios_disponiveis = []
+    if medico.hora_inicio and medico.hora_fim:
+        # Slots pré-calculados do expediente, sem os ocupados
+        horarios_disponiveis = [
+            {'value': slot, 'display': slot}
+            for slot in medico.grade_horarios.rotulos
+            if slot not in horarios_ocupados
+        ]
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                'Disponibilidade do médico %s em %s: %d ocupados, %d livres',
+                medico.id, data_selecionada, len(horarios_ocupados), len(horarios_disponiveis),
+                extra={
+                    'medico_id': medico.id,
+                    'data': data_selecionada,
+                    'horarios_ocupados': sorted(horarios_ocupados),
+                    'horarios_disponiveis': [h['value'] for h in horarios_disponiveis],
+                },
+            )
+
+    return JsonResponse({
+        'success': True,
+        'dias_disponiveis': list(medico.dias_trabalho_indices),  # 0=segunda ... 6=domingo
+        'hora_inicio': medico.hora_inicio.strftime('%H:%M'),
+        'hora_fim': medico.hora_fim.strftime('%H:%M'),
+        'horarios_disponiveis': horarios_disponiveis,
+        'dias_trabalho_display': medico.get_dias_trabalho_display()
+    })
+
+
+def _erro_disponibilidade(medico_id, erro):
+    logger.exception('Erro ao calcular a disponibilidade do médico %s', medico_id)
+    return JsonResponse({
+        'success': False,
+        'error': str(erro)
+    })
+
 
 @require_http_methods(["GET"])
 def get_medico_availability(request, medico_id):
     """API endpoint para obter os dias de trabalho e horários disponíveis de um médico"""
     try:
-        from datetime import datetime, timedelta
-        from django.utils import timezone
-        import pytz
-        
+        from .scheduling import horarios_ocupados_periodo
+
         medico = get_object_or_404(Medico, id=medico_id)
-        
-        # Obter data selecionada do parâmetro de consulta (se fornecida)
-        data_selecionada = request.GET.get('data')
-        consulta_id = request.GET.get('consulta_id')  # Para edição de consulta existente
-        
-        # Mapear dias da semana para números (0=domingo, 1=segunda, etc.)
-        dias_semana_map = {
-            'domingo': 6,
-            'segunda': 0,
-            'terca': 1,
-            'quarta': 2,
-            'quinta': 3,
-            'sexta': 4,
-            'sabado': 5
-        }
-        
-        dias_trabalho = medico.dias_trabalho.split(',')
-        dias_disponiveis = [dias_semana_map.get(dia.strip()) for dia in dias_trabalho if dia.strip() in dias_semana_map]
-        
-        # Gerar horários disponíveis em intervalos de 45 minutos
-        horarios_disponiveis = []
-        if medico.hora_inicio and medico.hora_fim:
-            # Converter hora_inicio para datetime para facilitar cálculos
-            inicio = datetime.combine(datetime.today(), medico.hora_inicio)
-            fim = datetime.combine(datetime.today(), medico.hora_fim)
-            
-            # Gerar todos os slots de 45 minutos
-            all_slots = []
-            current_time = inicio
-            while current_time < fim:
-                all_slots.append(current_time.time().strftime('%H:%M'))
-                current_time += timedelta(minutes=45)
-            
-            # Se uma data foi fornecida, verificar consultas já agendadas
-            horarios_ocupados = set()
-            if data_selecionada:
-                try:
-                    data_obj = datetime.strptime(data_selecionada, '%Y-%m-%d').date()
-                    
-                    # Obter timezone local do Brasil
-                    local_tz = pytz.timezone('America/Sao_Paulo')
-                    
-                    # Buscar consultas já agendadas para este médico nesta data
-                    # Filtrar apenas consultas ativas (não canceladas)
-                    consultas_existentes = Consulta.objects.filter(
-                        medico=medico,
-                        data_hora__date=data_obj,
-                        status__in=['agendada', 'realizada']  # Excluir consultas canceladas
-                    )
-                    
-                    # Se estivermos editando uma consulta, excluir ela da verificação
-                    if consulta_id:
-                        try:
-                            consultas_existentes = consultas_existentes.exclude(id=int(consulta_id))
-                        except (ValueError, TypeError):
-                            pass
-                    
-                    # Coletar horários já ocupados
-                    for consulta in consultas_existentes:
-                        # Converter para timezone local antes de extrair o horário
-                        if timezone.is_aware(consulta.data_hora):
-                            # Se o datetime é timezone-aware, converter para local
-                            data_hora_local = consulta.data_hora.astimezone(local_tz)
-                        else:
-                            # Se não é timezone-aware, tornar timezone-aware primeiro
-                            data_hora_naive = timezone.make_aware(consulta.data_hora, local_tz)
-                            data_hora_local = data_hora_naive.astimezone(local_tz)
-                        
-                        horario_consulta = data_hora_local.time().strftime('%H:%M')
-                        horarios_ocupados.add(horario_consulta)
-                        
-                        # Debug: adicionar log para verificar horários ocupados
-                        print(f"Horário ocupado encontrado: {horario_consulta} para consulta ID {consulta.id}")
-                        print(f"  - Original: {consulta.data_hora} (aware: {timezone.is_aware(consulta.data_hora)})")
-                        print(f"  - Local: {data_hora_local}")
-                        
-                except ValueError:
-                    # Data inválida, ignorar filtragem
-                    pass
-            
-            # Filtrar horários disponíveis (remover os ocupados)
-            for slot in all_slots:
-                if slot not in horarios_ocupados:
-                    horarios_disponiveis.append({
-                        'value': slot,
-                        'display': slot
-                    })
-            
-            # Debug: log dos horários disponíveis após filtragem
-            print(f"Horários ocupados: {horarios_ocupados}")
-            print(f"Horários disponíveis após filtragem: {[h['value'] for h in horarios_disponiveis]}")
-        
-        return JsonResponse({
-            'success': True,
-            'dias_disponiveis': dias_disponiveis,
-            'hora_inicio': medico.hora_inicio.strftime('%H:%M'),
-            'hora_fim': medico.hora_fim.strftime('%H:%M'),
-            'horarios_disponiveis': horarios_disponiveis,
-            'dias_trabalho_display': medico.get_dias_trabalho_display()
-        })
+
+        # Data selecionada (opcional) e consulta em edição, se houver
+        data_obj, erro = _parse_data_disponibilidade(request)
+        if erro:
+            return erro
+        consulta_id = request.GET.get('consulta_id')
+
+        horarios_ocupados = set()
+        if data_obj and medico.hora_inicio and medico.hora_fim:
+            # Ocupação do dia em cache
+            horarios_ocupados = horarios_ocupados_periodo(medico, data_obj, data_obj, consulta_id).get(data_obj, set())
+        return _resposta_disponibilidade(medico, request.GET.get('data'), horarios_ocupados)
+    except Exception as e:
+        return _erro_disponibilidade(medico_id, e)
+
+
+@require_http_methods(["GET"])
+async def get_medico_availability_async(request, medico_id):
+    """Versão assíncrona (ASGI) da API de disponibilidade do dia.
+
+    O ORM assíncrono executa as consultas na thread síncrona compartilhada
+    (sync_to_async com thread_sensitive=True): o médico e a ocupação do dia são
+    buscados um após o outro, sem bloquear o event loop enquanto isso.
+    """
+    try:
+        from django.shortcuts import aget_object_or_404
+        from .scheduling import aocupacao_periodo, horarios_indisponiveis
+
+        medico = await aget_object_or_404(Medico, id=medico_id)
+        data_obj, erro = _parse_data_disponibilidade(request)
+        if erro:
+            return erro
+        ocupacao = await aocupacao_periodo(medico_id, data_obj, data_obj) if data_obj else {}
+        ocupados = horarios_indisponiveis(medico, ocupacao, request.GET.get('consulta_id'))
+        return _resposta_disponibilidade(medico, request.GET.get('data'), ocupados.get(data_obj, set()))
     except Exception as e:
+        return _erro_disponibilidade(medico_id, e)
+
+
+def _parse_periodo(request):
+    """Valida start/end/consulta_id; retorna ((inicio, fim, consulta_id), None) ou (None, resposta de erro)"""
+    from datetime import timedelta
+    from .scheduling import MAX_DIAS_PERIODO
+
+    inicio = _parse_data(request.GET.get('start'))
+    fim = _parse_data(request.GET.get('end'))
+    if inicio is None or fim is None:
+        erro = 'Parâmetros start e end são obrigatórios no formato AAAA-MM-DD.'
+    elif fim < inicio:
+        erro = 'A data final deve ser igual ou posterior à data inicial.'
+    elif (fim - inicio) >= timedelta(days=MAX_DIAS_PERIODO):
+        erro = f'O período máximo é de {MAX_DIAS_PERIODO} dias.'
+    else:
+        consulta_id = request.GET.get('consulta_id')  # Para edição de consulta existente
+        try:
+            consulta_id = int(consulta_id) if consulta_id else None
+        except (ValueError, TypeError):
+            consulta_id = None
+        return (inicio, fim, consulta_id), None
+
+    return None, JsonResponse({'success': False, 'error': erro}, status=400)
+
+
+def _resposta_periodo(medico, inicio, fim, dias):
+    return JsonResponse({
+        'success': True,
+        'medico_id': medico.id,
+        'start': inicio.isoformat(),
+        'end': fim.isoformat(),
+        'dias_disponiveis': list(medico.dias_trabalho_indices),
+        'hora_inicio': medico.hora_inicio.strftime('%H:%M'),
+        'hora_fim': medico.hora_fim.strftime('%H:%M'),
+        'dias_trabalho_display': medico.get_dias_trabalho_display(),
+        'dias': dias,
+    })
+
+
+@require_http_methods(["GET"])
+def get_medico_availability_range(request, medico_id):
+    """API endpoint para obter os horários livres de um médico em um período (start a end)"""
+    from .scheduling import disponibilidade_periodo
+
+    medico = get_object_or_404(Medico, id=medico_id)
+    periodo, erro = _parse_periodo(request)
+    if erro:
+        return erro
+    inicio, fim, consulta_id = periodo
+    return _resposta_periodo(medico, inicio, fim, disponibilidade_periodo(medico, inicio, fim, consulta_id))
+
+
+@require_http_methods(["GET"])
+async def get_medico_availability_range_async(request, medico_id):
+    """Versão assíncrona (ASGI) da API de disponibilidade por período (consultas em sequência, como acima)"""
+    from django.shortcuts import aget_object_or_404
+    from .scheduling import aocupacao_periodo, horarios_indisponiveis, montar_disponibilidade
+
+    periodo, erro = _parse_periodo(request)
+    if erro:
+        await aget_object_or_404(Medico, id=medico_id)
+        return erro
+    inicio, fim, consulta_id = periodo
+    medico = await aget_object_or_404(Medico, id=medico_id)
+    ocupados = horarios_indisponiveis(medico, await aocupacao_periodo(medico_id, inicio, fim), consulta_id)
+    return _resposta_periodo(medico, inicio, fim, montar_disponibilidade(medico, inicio, fim, ocupados))
+
+
+def _parse_busca_proximos(request):
+    """Lê os parâmetros a_partir_de (AAAA-MM-DDTHH:MM, opcional) e limite da busca por especialidade"""
+    from datetime import datetime
+    from django.utils import timezone
+    from .scheduling import MAX_LIMITE_PROXIMOS
+
+    a_partir_de = None
+    valor = request.GET.get('a_partir_de')
+    if valor:
+        try:
+            a_partir_de = timezone.make_aware(datetime.fromisoformat(valor).replace(tzinfo=None))
+        except ValueError:
+            a_partir_de = None
+
+    try:
+        limite = int(request.GET.get('limite', 10))
+    except (ValueError, TypeError):
+        limite = 10
+    limite = max(1, min(limite, MAX_LIMITE_PROXIMOS))
+    return a_partir_de, limite
+
+
+
+@require_http_methods(["GET"])
+def estatisticas_cache_disponibilidade(request):
+    """API com os contadores de acertos e falhas do cache de disponibilidade (deste processo)"""
+    from .cache import estatisticas
+
+    return JsonResponse({'success': True, **estatisticas.como_dict()})
+
+@require_http_methods(["GET"])
+def get_especialidade_proximos_horarios(request, especialidade_id):
+    """API endpoint para obter os próximos horários livres entre todos os médicos de uma especialidade"""
+    from django.utils import timezone
+    from .scheduling import proximos_horarios_especialidade
+
+    especialidade = get_object_or_404(Especialidade, id=especialidade_id)
+    a_partir_de, limite = _parse_busca_proximos(request)
+    horarios = proximos_horarios_especialidade(especialidade, a_partir_de, limite)
+
+    return JsonResponse({
+        'success': True,
+        'especialidade_id': especialidade.id,
+        'horarios': [
+            {
+                'medico_id': horario['medico'].id,
+                'medico_nome': horario['medico'].nome,
+                'data': timezone.localtime(horario['data_hora']).date().isoformat(),
+                'hora': timezone.localtime(horario['data_hora']).strftime('%H:%M'),
+                'data_hora': timezone.localtime(horario['data_hora']).isoformat(),
+            }
+            for horario in horarios
+        ],
+    })
+
+
+@require_http_methods(["GET"])
+def eventos_agenda_medico(request, medico_id):
+    """Stream SSE com os horários ocupados e liberados da agenda do médico na data informada"""
+    from django.conf import settings
+    from django.core.handlers.asgi import ASGIRequest
+    from django.http import StreamingHttpResponse
+    from .eventos import afluxo_eventos, canal_agenda, fluxo_eventos
+
+    if not Medico.objects.filter(pk=medico_id).exists():
+        return JsonResponse({'success': False, 'error': 'Médico não encontrado.'}, status=404)
+    data_obj = _parse_data(request.GET.get('data'))
+    if data_obj is None:
         return JsonResponse({
             'success': False,
-            'error': str(e)
+            'error': 'Parâmetro data é obrigatório no formato AAAA-MM-DD.'
+        }, status=400)
+
+    # No ASGI o stream é um gerador assíncrono; no WSGI, cada conexão ocupa uma thread
+    fluxo = afluxo_eventos if isinstance(request, ASGIRequest) else fluxo_eventos
+    response = StreamingHttpResponse(
+        fluxo(canal_agenda(medico_id, data_obj), settings.AGENDA_SSE_KEEPALIVE, settings.AGENDA_SSE_DURACAO_MAXIMA),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # sem buffer em proxies nginx
+    return response
+
+
+def _resposta_busca_pacientes(pacientes):
+    return JsonResponse({
+        'success': True,
+        'resultados': [
+            {'id': paciente.id, 'nome': paciente.nome, 'cpf': paciente.cpf, 'texto': f'{paciente.nome} ({paciente.cpf})'}
+            for paciente in pacientes
+        ],
+    })
+
+
+def _resposta_busca_medicos(medicos):
+    return JsonResponse({
+        'success': True,
+        'resultados': [
+            {'id': medico.id, 'nome': medico.nome, 'crm': medico.crm, 'texto': str(medico)}
+            for medico in medicos
+        ],
+    })
+
+
+@require_http_methods(["GET"])
+def buscar_pacientes_api(request):
+    """API de busca incremental (typeahead) de pacientes por nome ou CPF"""
+    return _resposta_busca_pacientes(buscar_pacientes(request.GET.get('q'), request.GET.get('limite')))
+
+
+@require_http_methods(["GET"])
+async def buscar_pacientes_api_async(request):
+    """Versão assíncrona (ASGI) da busca de pacientes"""
+    from .search import consultar_pacientes
+
+    pacientes = consultar_pacientes(request.GET.get('q'), request.GET.get('limite'))
+    return _resposta_busca_pacientes([paciente async for paciente in pacientes])
+
+
+@require_http_methods(["GET"])
+def buscar_medicos_api(request):
+    """API de busca incremental (typeahead) de médicos por nome ou CRM"""
+    return _resposta_busca_medicos(buscar_medicos(request.GET.get('q'), request.GET.get('limite')))
+
+
+@require_http_methods(["GET"])
+async def buscar_medicos_api_async(request):
+    """Versão assíncrona (ASGI) da busca de médicos"""
+    from .search import consultar_medicos
+
+    medicos = consultar_medicos(request.GET.get('q'), request.GET.get('limite'))
+    return _resposta_busca_medicos([medico async for medico in medicos])
+
+
+def _agendar(dados):
+    """Valida e salva uma nova consulta; retorna (status HTTP, conteúdo JSON)"""
+    from django.utils import timezone
+
+    form = ConsultaForm(dados)
+    if not form.is_valid():
+        return 400, {'success': False, 'errors': form.errors.get_json_data()}
+    consulta = salvar_consulta(form)
+    if consulta is None:
+        # Outro agendamento ocupou o horário entre a consulta de disponibilidade e o envio
+        return 409, {'success': False, 'errors': form.errors.get_json_data()}
+    return 201, {
+        'success': True,
+        'consulta': {
+            'id': consulta.id,
+            'paciente_id': consulta.paciente_id,
+            'medico_id': consulta.medico_id,
+            'data_hora': timezone.localtime(consulta.data_hora).isoformat(),
+            'status': consulta.status,
+        },
+    }
+
+
+@require_http_methods(["POST"])
+def agendar_consulta_api(request):
+    """API de agendamento com os campos do ConsultaForm; conflitos de horário retornam 409"""
+    status, conteudo = _agendar(request.POST)
+    return JsonResponse(conteudo, status=status)
+
+
+@require_http_methods(["POST"])
+async def agendar_consulta_api_async(request):
+    """Versão assíncrona (ASGI) da API de agendamento.
+
+    Validação e gravação rodam juntas em uma única chamada síncrona, para que a
+    transação de salvar_consulta fique em uma só conexão.
+    """
+    from asgiref.sync import sync_to_async
+
+    status, conteudo = await sync_to_async(_agendar)(request.POST)
+    return JsonResponse(conteudo, status=status)
+
+
+@require_http_methods(["GET"])
+def exportar_consultas(request, formato):
+    """Exporta as consultas filtradas em CSV ou iCalendar, em streaming"""
+    from django.http import Http404, HttpResponseBadRequest, StreamingHttpResponse
+    from .exportacao import FORMATOS, consultas_para_exportar
+
+    if formato not in FORMATOS:
+        raise Http404('Formato de exportação inválido')
+    filtro_form = ConsultaFiltroForm(request.GET or None)
+    if filtro_form.is_bound and not filtro_form.is_valid():
+        return HttpResponseBadRequest('Filtros inválidos')
+
+    gerar_linhas, content_type = FORMATOS[formato]
+    consultas = consultas_para_exportar(filtro_form.filtrar(Consulta.objects.all()))
+    response = StreamingHttpResponse(gerar_linhas(consultas), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="consultas.{formato}"'
+    return response
+
+
+def _janela_feed():
+    """Intervalo de datas [início, fim) do feed iCalendar, relativo a hoje"""
+    from datetime import timedelta
+    from django.conf import settings
+    from django.utils import timezone
+
+    hoje = timezone.localdate()
+    return (
+        hoje - timedelta(days=settings.AGENDA_FEED_DIAS_ANTERIORES),
+        hoje + timedelta(days=settings.AGENDA_FEED_DIAS_POSTERIORES + 1),
+    )
+
+
+def _marcador_feed(request, medico_id):
+    """Versão e data da última alteração da agenda do médico (uma consulta por requisição)"""
+    if not hasattr(request, '_marcador_feed'):
+        request._marcador_feed = (
+            Medico.objects.filter(pk=medico_id).values('agenda_versao', 'agenda_atualizada_em').first()
+        )
+    return request._marcador_feed
+
+
+def _etag_feed_medico(request, medico_id):
+    marcador = _marcador_feed(request, medico_id)
+    if marcador is None:
+        return None
+    # A janela acompanha a data de hoje, então ela também faz parte da versão do feed
+    return f'{medico_id}-{marcador["agenda_versao"]}-{_janela_feed()[0].isoformat()}'
+
+
+def _ultima_alteracao_feed_medico(request, medico_id):
+    from django.utils import timezone
+    from .scheduling import inicio_do_dia
+
+    marcador = _marcador_feed(request, medico_id)
+    if marcador is None:
+        return None
+    return max(filter(None, [marcador['agenda_atualizada_em'], inicio_do_dia(timezone.localdate())]))
+
+
+@require_http_methods(["GET", "HEAD"])
+@condition(etag_func=_etag_feed_medico, last_modified_func=_ultima_alteracao_feed_medico)
+def agenda_medico_ics(request, medico_id):
+    """Feed iCalendar da agenda do médico; requisições sem alterações recebem 304"""
+    from django.http import StreamingHttpResponse
+    from .exportacao import FORMATOS, consultas_para_exportar, linhas_ics
+    from .scheduling import inicio_do_dia
+
+    medico = get_object_or_404(Medico, id=medico_id)
+    inicio, fim = _janela_feed()
+    consultas = Consulta.objects.filter(
+        medico=medico,
+        data_hora__gte=inicio_do_dia(inicio),
+        data_hora__lt=inicio_do_dia(fim),
+    )
+    return StreamingHttpResponse(
+        linhas_ics(consultas_para_exportar(consultas), nome=f'Agenda - {medico.nome}'),
+        content_type=FORMATOS['ics'][1],
+    )
+
+
+def _filtro_periodo_form(form_class, request):
+    """Formulário de filtros (painel ou utilização), com os últimos 12 meses como período padrão"""
+    from django.utils import timezone
+    from .agregados import periodo_padrao
+
+    dados = request.GET.copy()
+    inicio, fim = periodo_padrao(timezone.localdate())
+    if not dados.get('inicio'):
+        dados['inicio'] = inicio.isoformat()
+    if not dados.get('fim'):
+        dados['fim'] = fim.isoformat()
+    return form_class(dados)
+
+
+def _resumo_painel(filtros, limite_dimensao=None):
+    """Totais por período, por médico/especialidade e gerais, lidos da tabela de agregados"""
+    from .agregados import STATUS, agregados_periodo, totais_por_dimensao, totais_por_periodo
+
+    agregados = agregados_periodo(
+        filtros['inicio'], filtros['fim'], medico=filtros.get('medico'), especialidade=filtros.get('especialidade'),
+    )
+    por_periodo = totais_por_periodo(agregados, filtros['agrupamento'])
+    totais = {status: sum(linha[status] for linha in por_periodo) for status in STATUS}
+    totais['total'] = sum(totais.values())
+    return {
+        'por_periodo': por_periodo,
+        'por_dimensao': totais_por_dimensao(agregados, filtros['dimensao'])[:limite_dimensao],
+        'totais': totais,
+    }
+
+
+@require_http_methods(["GET"])
+def painel_consultas(request):
+    """Painel de consultas por período, status e médico/especialidade"""
+    form = _filtro_periodo_form(PainelFiltroForm, request)
+    context = {'form': form}
+    if form.is_valid():
+        context.update(_resumo_painel(form.cleaned_data, limite_dimensao=50))
+    return render(request, 'painel_consultas.html', context)
+
+
+@require_http_methods(["GET"])
+def agregados_consultas_api(request):
+    """API com os totais de consultas por período (dia ou mês), status e médico/especialidade"""
+    form = _filtro_periodo_form(PainelFiltroForm, request)
+    if not form.is_valid():
+        return JsonResponse({'success': False, 'errors': form.errors.get_json_data()}, status=400)
+
+    filtros = form.cleaned_data
+    resumo = _resumo_painel(filtros)
+    for linha in resumo['por_periodo']:
+        linha['periodo'] = linha['periodo'].isoformat()
+    return JsonResponse({
+        'success': True,
+        'inicio': filtros['inicio'].isoformat(),
+        'fim': filtros['fim'].isoformat(),
+        'agrupamento': filtros['agrupamento'],
+        'dimensao': filtros['dimensao'],
+        **resumo,
+    })
+
+
+@require_http_methods(["GET"])
+def utilizacao_medicos(request):
+    """Utilização dos médicos (slots ocupados / disponíveis) no período, por dia da semana e hora"""
+    from .utilizacao import DIAS_SEMANA, grade_semanal, relatorio_utilizacao
+
+    form = _filtro_periodo_form(UtilizacaoFiltroForm, request)
+    context = {'form': form, 'dias_semana': DIAS_SEMANA}
+    if form.is_valid():
+        relatorio = relatorio_utilizacao(form.cleaned_data['inicio'], form.cleaned_data['fim'], form.medicos())
+        medicos = sorted(
+            relatorio['medicos'],
+            key=lambda linha: (linha['utilizacao'] is None, -(linha['utilizacao'] or 0), linha['nome']),
+        )
+        context.update({
+            'totais': relatorio['totais'],
+            'grade': grade_semanal(relatorio['por_dia_hora']),
+            'medicos': medicos[:50],
+            'total_medicos': len(medicos),
         })
+    return render(request, 'utilizacao_medicos.html', context)
+
+
+@require_http_methods(["GET"])
+def exportar_utilizacao_medicos(request):
+    """Exporta o relatório de utilização em CSV, uma linha por médico, dia da semana e hora"""
+    from django.http import HttpResponseBadRequest, StreamingHttpResponse
+    from .utilizacao import linhas_csv, relatorio_utilizacao
+
+    form = _filtro_periodo_form(UtilizacaoFiltroForm, request)
+    if not form.is_valid():
+        return HttpResponseBadRequest('Filtros inválidos')
+
+    inicio, fim = form.cleaned_data['inicio'], form.cleaned_data['fim']
+    relatorio = relatorio_utilizacao(inicio, fim, form.medicos())
+    response = StreamingHttpResponse(linhas_csv(relatorio), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="utilizacao_{inicio.isoformat()}_{fim.isoformat()}.csv"'
+    return response
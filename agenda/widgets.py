@@ -0,0 +1,42 @@
+from django import forms
+from django.core.exceptions import ValidationError
+
+
+class AutocompleteSelect(forms.Select):
+    """Select de ModelChoiceField que renderiza apenas a opção selecionada.
+
+    As demais opções são buscadas sob demanda pela API de busca (typeahead) informada
+    em `url`, evitando carregar a tabela inteira a cada renderização do formulário.
+    """
+
+    class Media:
+        js = ['js/autocomplete.js']
+
+    def __init__(self, url, attrs=None, placeholder='Digite para buscar...'):
+        attrs = {'class': 'form-select', **(attrs or {})}
+        attrs['class'] = f"{attrs['class']} autocomplete-select".strip()
+        attrs['data-autocomplete-url'] = url
+        attrs['data-placeholder'] = placeholder
+        super().__init__(attrs)
+
+    def optgroups(self, name, value, attrs=None):
+        valores = [v for v in value if v not in ('', None)]
+        selecionadas = []
+        if valores and hasattr(self.choices, 'queryset'):
+            # Valores vindos de GET/POST: os que não são chaves válidas (ex.: "abc") ficam sem opção
+            chave = self.choices.queryset.model._meta.pk
+            pks = []
+            for valor in valores:
+                try:
+                    pks.append(chave.to_python(valor))
+                except (ValueError, TypeError, ValidationError):
+                    continue
+            queryset = self.choices.queryset.filter(pk__in=pks)
+            selecionadas = [self.choices.choice(obj) for obj in queryset]
+
+        choices_originais = self.choices
+        self.choices = [('', '---------')] + selecionadas
+        try:
+            return super().optgroups(name, value, attrs)
+        finally:
+            self.choices = choices_originais
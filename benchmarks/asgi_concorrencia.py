@@ -0,0 +1,246 @@
+"""Quantos formulários de agendamento abertos ao mesmo tempo um worker ASGI sustenta: APIs síncronas x assíncronas.
+
+Uso (na raiz do projeto):
+
+    python benchmarks/asgi_concorrencia.py
+    python benchmarks/asgi_concorrencia.py --formularios 1 10 50 100 --duracao 10 --limite-p95 250
+
+Chama core.asgi.application diretamente (sem servidor HTTP), em um único event
+loop, como um worker do uvicorn. Cada formulário aberto repete o fluxo da tela
+de agendamento: disponibilidade do período, buscas de paciente e de médico,
+disponibilidade do dia e o envio do agendamento, com uma pausa entre as ações.
+Um nível de concorrência é sustentado quando o p95 das requisições fica abaixo
+de --limite-p95 ms e não há erros.
+
+Observação: o ORM assíncrono do Django executa as consultas em uma thread
+síncrona compartilhada, então as views assíncronas sobrepõem espera de rede e
+cache, mas não executam consultas SQL em paralelo.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import secrets
+import sys
+import time as relogio
+from datetime import timedelta
+from urllib.parse import urlencode
+
+# Requisições lentas são esperadas aqui; não registrá-las no log
+os.environ.setdefault('METRICAS_LIMITE_LENTO_MS', '0')
+
+from comum import banco_temporario, resumir  # noqa: E402
+
+from django.core.management import call_command  # noqa: E402
+from django.urls import reverse  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from agenda.models import Medico, Paciente  # noqa: E402
+
+ROTAS = {
+    'sincrono': {
+        'periodo': 'medico_availability_range',
+        'dia': 'medico_availability',
+        'pacientes': 'paciente_busca_api',
+        'medicos': 'medico_busca_api',
+        'agendar': 'consulta_agendar_api',
+    },
+    'assincrono': {
+        'periodo': 'medico_availability_range_async',
+        'dia': 'medico_availability_async',
+        'pacientes': 'paciente_busca_async_api',
+        'medicos': 'medico_busca_async_api',
+        'agendar': 'consulta_agendar_async_api',
+    },
+}
+
+# Token CSRF sem máscara (32 caracteres), aceito no cabeçalho X-CSRFToken
+TOKEN_CSRF = secrets.token_hex(16)
+
+
+async def chamar(aplicacao, metodo, caminho, parametros=None, dados=None):
+    """Executa uma requisição HTTP na aplicação ASGI e retorna (status, corpo)"""
+    corpo = urlencode(dados).encode() if dados else b''
+    cabecalhos = [(b'host', b'localhost'), (b'cookie', f'csrftoken={TOKEN_CSRF}'.encode())]
+    if dados:
+        cabecalhos += [
+            (b'content-type', b'application/x-www-form-urlencoded'),
+            (b'content-length', str(len(corpo)).encode()),
+            (b'x-csrftoken', TOKEN_CSRF.encode()),
+        ]
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'scheme': 'http',
+        'method': metodo, 'path': caminho, 'raw_path': caminho.encode(), 'root_path': '',
+        'query_string': urlencode(parametros or {}).encode(), 'headers': cabecalhos,
+        'client': ('127.0.0.1', 50000), 'server': ('localhost', 80),
+    }
+    recebido = False
+
+    async def receive():
+        nonlocal recebido
+        if not recebido:
+            recebido = True
+            return {'type': 'http.request', 'body': corpo, 'more_body': False}
+        await asyncio.Future()  # o cliente nunca desconecta
+
+    resposta = {'status': None, 'corpo': []}
+
+    async def send(mensagem):
+        if mensagem['type'] == 'http.response.start':
+            resposta['status'] = mensagem['status']
+        elif mensagem['type'] == 'http.response.body':
+            resposta['corpo'].append(mensagem.get('body', b''))
+
+    await aplicacao(scope, receive, send)
+    return resposta['status'], b''.join(resposta['corpo'])
+
+
+class Formulario:
+    """Um formulário de agendamento aberto, repetindo o fluxo da tela até o prazo"""
+
+    def __init__(self, aplicacao, rotas, dados, pausa, aleatorio, registro):
+        self.aplicacao = aplicacao
+        self.rotas = rotas
+        self.dados = dados
+        self.pausa = pausa
+        self.aleatorio = aleatorio
+        self.registro = registro
+
+    async def requisicao(self, acao, metodo, caminho, parametros=None, dados=None):
+        inicio = relogio.perf_counter()
+        status, corpo = await chamar(self.aplicacao, metodo, caminho, parametros, dados)
+        self.registro.append((acao, (relogio.perf_counter() - inicio) * 1000, status))
+        await asyncio.sleep(self.pausa * self.aleatorio.uniform(0.5, 1.5))
+        return status, corpo
+
+    async def executar(self, prazo):
+        rotas, dados, aleatorio = self.rotas, self.dados, self.aleatorio
+        while relogio.perf_counter() < prazo:
+            medico_id, nome_medico = aleatorio.choice(dados['medicos'])
+            inicio = dados['hoje'] + timedelta(days=aleatorio.randrange(1, 30))
+            fim = inicio + timedelta(days=13)
+
+            status, corpo = await self.requisicao('periodo', 'GET', rotas['periodo'][medico_id], {
+                'start': inicio.isoformat(), 'end': fim.isoformat(),
+            })
+            livres = [
+                (dia['data'], hora)
+                for dia in (json.loads(corpo)['dias'] if status == 200 else [])
+                for hora in dia['horarios_disponiveis']
+            ]
+            await self.requisicao('pacientes', 'GET', rotas['pacientes'], {'q': aleatorio.choice(dados['prefixos'])})
+            await self.requisicao('medicos', 'GET', rotas['medicos'], {'q': nome_medico})
+            if not livres:
+                continue
+            data, hora = aleatorio.choice(livres)
+            await self.requisicao('dia', 'GET', rotas['dia'][medico_id], {'data': data})
+            await self.requisicao('agendar', 'POST', rotas['agendar'], dados={
+                'paciente': aleatorio.choice(dados['pacientes']), 'medico': medico_id,
+                'status': 'agendada', 'data': data, 'hora': hora,
+            })
+
+
+def preparar_rotas(medicos):
+    rotas = {}
+    for modo, nomes in ROTAS.items():
+        rotas[modo] = {
+            'periodo': {medico_id: reverse(nomes['periodo'], args=[medico_id]) for medico_id, _ in medicos},
+            'dia': {medico_id: reverse(nomes['dia'], args=[medico_id]) for medico_id, _ in medicos},
+            'pacientes': reverse(nomes['pacientes']),
+            'medicos': reverse(nomes['medicos']),
+            'agendar': reverse(nomes['agendar']),
+        }
+    return rotas
+
+
+async def nivel(aplicacao, rotas, dados, formularios, duracao, pausa, semente):
+    registro = []
+    prazo = relogio.perf_counter() + duracao
+    inicio = relogio.perf_counter()
+    await asyncio.gather(*(
+        Formulario(aplicacao, rotas, dados, pausa, random.Random(semente + i), registro).executar(prazo)
+        for i in range(formularios)
+    ))
+    decorrido = relogio.perf_counter() - inicio
+    erros = sum(1 for _, _, status in registro if status not in (200, 201, 409))
+    resultado = resumir([duracao_ms for _, duracao_ms, _ in registro])
+    resultado.update({
+        'formularios': formularios,
+        'requisicoes': len(registro),
+        'requisicoes_por_segundo': len(registro) / decorrido,
+        'erros': erros,
+        'por_acao': {
+            acao: resumir([duracao_ms for nome, duracao_ms, _ in registro if nome == acao])
+            for acao in ROTAS['sincrono']
+        },
+    })
+    return resultado
+
+
+async def executar(args, dados):
+    from core.asgi import application
+
+    rotas = preparar_rotas(dados['medicos'])
+    resultados = {}
+    for modo in args.modos:
+        resultados[modo] = []
+        # Aquecimento (conexão, URLconf e cache)
+        await nivel(application, rotas[modo], dados, 2, 1, 0, args.semente)
+        for formularios in args.formularios:
+            resultado = await nivel(
+                application, rotas[modo], dados, formularios, args.duracao, args.pausa / 1000, args.semente,
+            )
+            resultado['sustentado'] = resultado['erros'] == 0 and resultado['p95'] <= args.limite_p95
+            resultados[modo].append(resultado)
+            print(
+                f'{modo:<11} {formularios:>5} formulários  {resultado["requisicoes_por_segundo"]:8.1f} req/s  '
+                f'p50 {resultado["p50"]:8.2f}  p95 {resultado["p95"]:8.2f}  p99 {resultado["p99"]:8.2f} ms  '
+                f'erros {resultado["erros"]}  {"ok" if resultado["sustentado"] else "acima do limite"}'
+            )
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--formularios', type=int, nargs='+', default=[1, 5, 10, 25, 50, 100])
+    parser.add_argument('--modos', nargs='+', choices=ROTAS, default=list(ROTAS))
+    parser.add_argument('--duracao', type=float, default=5, help='Segundos por nível de concorrência')
+    parser.add_argument('--pausa', type=float, default=200, help='Pausa média entre as ações de um formulário (ms)')
+    parser.add_argument('--limite-p95', type=float, default=250, help='p95 máximo (ms) para considerar o nível sustentado')
+    parser.add_argument('--medicos', type=int, default=50)
+    parser.add_argument('--pacientes', type=int, default=5000)
+    parser.add_argument('--consultas', type=int, default=50000)
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--saida', help='Arquivo JSON com os resultados')
+    args = parser.parse_args()
+
+    with banco_temporario():
+        print('Gerando dados...', file=sys.stderr)
+        call_command(
+            'gerar_dados', especialidades=10, medicos=args.medicos, pacientes=args.pacientes,
+            consultas=args.consultas, semente=args.semente, stdout=sys.stderr,
+        )
+        dados = {
+            'hoje': timezone.localdate(),
+            'medicos': [
+                (medico_id, nome.split()[1][:4])
+                for medico_id, nome in Medico.objects.order_by('id').values_list('id', 'nome_busca')
+            ],
+            'pacientes': list(Paciente.objects.values_list('id', flat=True)[:1000]),
+            'prefixos': sorted({nome.split()[0][:3] for nome in Paciente.objects.values_list('nome_busca', flat=True)[:200]}),
+        }
+        resultados = asyncio.run(executar(args, dados))
+
+    print('\nFormulários abertos sustentados por um worker (p95 <= {:.0f} ms, sem erros):'.format(args.limite_p95))
+    for modo, niveis in resultados.items():
+        sustentados = [resultado['formularios'] for resultado in niveis if resultado['sustentado']]
+        print(f'{modo:<11} {max(sustentados) if sustentados else 0}')
+
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as saida:
+            json.dump({'parametros': vars(args), 'resultados': resultados}, saida, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
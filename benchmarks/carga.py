@@ -0,0 +1,294 @@
+"""Gerador de carga HTTP para uma instância local do agenda (runserver, gunicorn ou uvicorn).
+
+Uso (na raiz do projeto, com o servidor rodando em localhost):
+
+    python benchmarks/carga.py sintetizar --requisicoes 5000 --medicos 1-50 --pacientes 1-1000 --saida trafego.jsonl
+    python benchmarks/carga.py reproduzir trafego.jsonl --url http://127.0.0.1:8000 --concorrencia 16
+
+Formato do trace (uma requisição JSON por linha):
+
+    {"endpoint": "disponibilidade", "metodo": "GET", "caminho": "/api/medico/3/availability/?data=2025-08-04"}
+    {"endpoint": "agendamento", "metodo": "POST", "caminho": "/agenda/consultas/novo/",
+     "dados": {"paciente": 7, "medico": 3, "data": "2025-08-04", "hora": "09:45", "status": "agendada"}}
+
+"endpoint" agrupa o relatório (quando ausente, é derivado do caminho) e
+"instante_ms", opcional, é o deslocamento desde o início do trace, respeitado
+com --respeitar-tempo. POSTs recebem o token CSRF obtido com um GET no
+próprio caminho. Apenas endereços locais são aceitos.
+"""
+import argparse
+import http.cookiejar
+import json
+import random
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from datetime import date, timedelta
+
+HOSTS_LOCAIS = {'localhost', '127.0.0.1', '::1'}
+
+# Mistura padrão do tráfego sintetizado (pesos relativos)
+MISTURA_PADRAO = {
+    'disponibilidade': 50,
+    'disponibilidade_periodo': 10,
+    'agendamento': 5,
+    'lista_consultas': 15,
+    'lista_pacientes': 5,
+    'lista_medicos': 5,
+    'busca_pacientes': 10,
+}
+
+
+# Trace
+
+def ler_trace(caminho):
+    with open(caminho, encoding='utf-8') as arquivo:
+        for numero, linha in enumerate(arquivo, start=1):
+            if not linha.strip():
+                continue
+            try:
+                registro = json.loads(linha)
+            except json.JSONDecodeError as exc:
+                raise SystemExit(f'{caminho}:{numero}: JSON inválido ({exc})')
+            registro.setdefault('metodo', 'GET')
+            registro.setdefault('endpoint', nome_endpoint(registro['caminho']))
+            yield registro
+
+
+def nome_endpoint(caminho):
+    """Agrupa caminhos semelhantes ('/agenda/medicos/12/' -> '/agenda/medicos/{id}/')"""
+    return re.sub(r'/\d+(?=/|$)', '/{id}', urllib.parse.urlsplit(caminho).path)
+
+
+def _intervalo(texto):
+    inicio, _, fim = texto.partition('-')
+    return int(inicio), int(fim or inicio)
+
+
+def sintetizar(args):
+    aleatorio = random.Random(args.semente)
+    medicos, pacientes = _intervalo(args.medicos), _intervalo(args.pacientes)
+    mistura = dict(MISTURA_PADRAO)
+    for item in args.mistura or []:
+        nome, _, peso = item.partition('=')
+        if nome not in MISTURA_PADRAO:
+            raise SystemExit(f'Endpoint desconhecido na mistura: {nome}')
+        mistura[nome] = float(peso)
+    nomes, pesos = zip(*mistura.items())
+    hoje = date.today()
+
+    def data_futura():
+        return (hoje + timedelta(days=aleatorio.randint(1, 30))).isoformat()
+
+    def gerar(endpoint):
+        medico = aleatorio.randint(*medicos)
+        if endpoint == 'disponibilidade':
+            return {'metodo': 'GET', 'caminho': f'/api/medico/{medico}/availability/?data={data_futura()}'}
+        if endpoint == 'disponibilidade_periodo':
+            inicio = hoje + timedelta(days=aleatorio.randint(0, 7))
+            return {
+                'metodo': 'GET',
+                'caminho': f'/api/medico/{medico}/availability/range/?start={inicio.isoformat()}'
+                           f'&end={(inicio + timedelta(days=59)).isoformat()}',
+            }
+        if endpoint == 'agendamento':
+            return {
+                'metodo': 'POST', 'caminho': '/agenda/consultas/novo/',
+                'dados': {
+                    'paciente': aleatorio.randint(*pacientes), 'medico': medico, 'status': 'agendada',
+                    'data': data_futura(), 'hora': f'{aleatorio.randint(8, 17):02d}:{aleatorio.choice([0, 15, 30, 45]):02d}',
+                },
+            }
+        if endpoint == 'lista_consultas':
+            return {'metodo': 'GET', 'caminho': aleatorio.choice(['/agenda/consultas/', f'/agenda/consultas/?medico={medico}'])}
+        if endpoint == 'lista_pacientes':
+            return {'metodo': 'GET', 'caminho': '/agenda/pacientes/'}
+        if endpoint == 'lista_medicos':
+            return {'metodo': 'GET', 'caminho': '/agenda/medicos/'}
+        prefixo = ''.join(aleatorio.choice('abcdefghijlmnoprstv') for _ in range(2))
+        return {'metodo': 'GET', 'caminho': f'/api/pacientes/busca/?q={prefixo}'}
+
+    saida = open(args.saida, 'w', encoding='utf-8') if args.saida else sys.stdout
+    try:
+        instante = 0.0
+        for _ in range(args.requisicoes):
+            endpoint = aleatorio.choices(nomes, pesos)[0]
+            registro = {'endpoint': endpoint, **gerar(endpoint), 'instante_ms': round(instante, 1)}
+            instante += aleatorio.expovariate(args.taxa / 1000)
+            saida.write(json.dumps(registro, ensure_ascii=False) + '\n')
+    finally:
+        if saida is not sys.stdout:
+            saida.close()
+
+
+# Execução
+
+class _SemRedirecionamento(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Cliente:
+    """Cliente HTTP de uma thread, com cookies próprios (sessão e CSRF)"""
+
+    def __init__(self, base, timeout):
+        self.base = base.rstrip('/')
+        self.timeout = timeout
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies), _SemRedirecionamento(),
+        )
+
+    def _token_csrf(self, caminho):
+        for cookie in self.cookies:
+            if cookie.name == 'csrftoken':
+                return cookie.value
+        self.requisitar('GET', caminho)
+        return next((cookie.value for cookie in self.cookies if cookie.name == 'csrftoken'), '')
+
+    def requisitar(self, metodo, caminho, dados=None):
+        corpo, cabecalhos = None, {}
+        if metodo == 'POST':
+            dados = {'csrfmiddlewaretoken': self._token_csrf(caminho), **(dados or {})}
+            corpo = urllib.parse.urlencode(dados).encode()
+            cabecalhos = {'Content-Type': 'application/x-www-form-urlencoded', 'Referer': self.base + caminho}
+        requisicao = urllib.request.Request(self.base + caminho, data=corpo, headers=cabecalhos, method=metodo)
+        try:
+            with self.opener.open(requisicao, timeout=self.timeout) as resposta:
+                resposta.read()
+                return resposta.status
+        except urllib.error.HTTPError as erro:
+            erro.read()
+            return erro.code
+
+
+class Estatisticas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.duracoes = defaultdict(list)
+        self.status = defaultdict(lambda: defaultdict(int))
+
+    def registrar(self, endpoint, duracao_ms, status):
+        with self._lock:
+            self.duracoes[endpoint].append(duracao_ms)
+            self.status[endpoint][status] += 1
+
+
+def percentil(valores, p):
+    indice = min(len(valores) - 1, max(0, int(round(p / 100 * len(valores))) - 1))
+    return valores[indice]
+
+
+def relatorio(estatisticas, segundos):
+    linhas = {}
+    todos = []
+    for endpoint in sorted(estatisticas.duracoes):
+        duracoes = sorted(estatisticas.duracoes[endpoint])
+        todos.extend(duracoes)
+        status = dict(estatisticas.status[endpoint])
+        linhas[endpoint] = _resumo(duracoes, segundos, status)
+    linhas['total'] = _resumo(sorted(todos), segundos, {})
+    return linhas
+
+
+def _resumo(duracoes, segundos, status):
+    return {
+        'requisicoes': len(duracoes),
+        'por_segundo': len(duracoes) / segundos if segundos else 0.0,
+        'p50': percentil(duracoes, 50) if duracoes else 0.0,
+        'p95': percentil(duracoes, 95) if duracoes else 0.0,
+        'p99': percentil(duracoes, 99) if duracoes else 0.0,
+        'erros': sum(quantidade for codigo, quantidade in status.items() if codigo == 'erro' or int(codigo) >= 500),
+        'status': {str(codigo): quantidade for codigo, quantidade in sorted(status.items(), key=lambda item: str(item[0]))},
+    }
+
+
+def reproduzir(args):
+    host = urllib.parse.urlsplit(args.url).hostname
+    if host not in HOSTS_LOCAIS:
+        raise SystemExit(f'Apenas endereços locais são aceitos ({", ".join(sorted(HOSTS_LOCAIS))}), recebido: {host}')
+
+    registros = list(ler_trace(args.trace)) * args.repetir
+    if not registros:
+        raise SystemExit('Trace vazio.')
+    estatisticas = Estatisticas()
+    proximo = iter(registros)
+    lock = threading.Lock()
+    inicio = time.perf_counter()
+
+    def trabalhador():
+        cliente = Cliente(args.url, args.timeout)
+        while True:
+            with lock:
+                registro = next(proximo, None)
+            if registro is None:
+                return
+            if args.respeitar_tempo and 'instante_ms' in registro:
+                espera = inicio + registro['instante_ms'] / 1000 - time.perf_counter()
+                if espera > 0:
+                    time.sleep(espera)
+            antes = time.perf_counter()
+            try:
+                status = cliente.requisitar(registro['metodo'], registro['caminho'], registro.get('dados'))
+            except OSError:
+                status = 'erro'
+            estatisticas.registrar(registro['endpoint'], (time.perf_counter() - antes) * 1000, status)
+
+    threads = [threading.Thread(target=trabalhador, daemon=True) for _ in range(args.concorrencia)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    segundos = time.perf_counter() - inicio
+
+    resultado = relatorio(estatisticas, segundos)
+    print(f'{len(registros)} requisições em {segundos:.1f}s com concorrência {args.concorrencia}')
+    print(f'{"endpoint":<32} {"req":>7} {"req/s":>8} {"p50":>8} {"p95":>8} {"p99":>8} {"erros":>6}  status')
+    for endpoint, linha in resultado.items():
+        status = ' '.join(f'{codigo}:{quantidade}' for codigo, quantidade in linha['status'].items())
+        print(
+            f'{endpoint:<32} {linha["requisicoes"]:>7} {linha["por_segundo"]:>8.1f} {linha["p50"]:>8.1f} '
+            f'{linha["p95"]:>8.1f} {linha["p99"]:>8.1f} {linha["erros"]:>6}  {status}'
+        )
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as saida:
+            json.dump({
+                'url': args.url, 'concorrencia': args.concorrencia, 'segundos': segundos, 'endpoints': resultado,
+            }, saida, ensure_ascii=False, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    sintetico = subparsers.add_parser('sintetizar', help='Gera um trace sintético com a mistura de tráfego da clínica')
+    sintetico.add_argument('--requisicoes', type=int, default=1000)
+    sintetico.add_argument('--medicos', default='1-20', help='Intervalo de IDs de médicos (ex.: 1-50)')
+    sintetico.add_argument('--pacientes', default='1-500', help='Intervalo de IDs de pacientes (ex.: 1-1000)')
+    sintetico.add_argument('--mistura', nargs='*', help='Pesos por endpoint (ex.: disponibilidade=70 agendamento=2)')
+    sintetico.add_argument('--taxa', type=float, default=50, help='Requisições por segundo (para instante_ms)')
+    sintetico.add_argument('--semente', type=int)
+    sintetico.add_argument('--saida', help='Arquivo JSONL (padrão: saída padrão)')
+    sintetico.set_defaults(funcao=sintetizar)
+
+    reproducao = subparsers.add_parser('reproduzir', help='Reproduz um trace JSONL contra a instância local')
+    reproducao.add_argument('trace')
+    reproducao.add_argument('--url', default='http://127.0.0.1:8000')
+    reproducao.add_argument('--concorrencia', type=int, default=8)
+    reproducao.add_argument('--repetir', type=int, default=1, help='Quantas vezes percorrer o trace')
+    reproducao.add_argument('--respeitar-tempo', action='store_true', help='Respeita instante_ms de cada requisição')
+    reproducao.add_argument('--timeout', type=float, default=30)
+    reproducao.add_argument('--saida', help='Arquivo JSON com o relatório')
+    reproducao.set_defaults(funcao=reproduzir)
+
+    args = parser.parse_args()
+    args.funcao(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Utilitários compartilhados pelos benchmarks: configuração do Django, banco temporário e medição."""
+import os
+import statistics
+import sys
+import time as relogio
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+os.environ.setdefault('ALLOWED_HOSTS', 'testserver,localhost,127.0.0.1')
+
+import django  # noqa: E402
+
+django.setup()
+
+
+@contextmanager
+def banco_temporario():
+    """Cria o banco de testes, executa o bloco e o remove ao final"""
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    nome_banco = connection.creation.create_test_db(verbosity=0)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(nome_banco, verbosity=0)
+        teardown_test_environment()
+
+
+def proxima_segunda():
+    hoje = date.today()
+    return hoje + timedelta(days=7 - hoje.weekday())
+
+
+def medico_com_agenda(crm='BENCH-1'):
+    """Cria um médico com expediente das 8h às 18h e metade dos horários da próxima segunda ocupados"""
+    from django.utils import timezone
+    from agenda.models import Consulta, Especialidade, Medico, Paciente
+
+    especialidade = Especialidade.objects.create(nome='Clínica Geral')
+    medico = Medico.objects.create(
+        nome='Dra. Benchmark', crm=crm, especialidade=especialidade,
+        hora_inicio=time(8, 0), hora_fim=time(18, 0),
+    )
+    data = proxima_segunda()
+    for i, slot in enumerate(medico.grade_horarios.horarios[::2]):
+        paciente = Paciente.objects.create(nome=f'Paciente {i}', cpf=f'{crm}-{i}', data_nascimento=date(1990, 1, 1))
+        Consulta.objects.create(paciente=paciente, medico=medico, data_hora=timezone.make_aware(datetime.combine(data, slot)))
+    return medico, data
+
+
+def percentil(valores_ordenados, p):
+    if not valores_ordenados:
+        return 0.0
+    indice = min(len(valores_ordenados) - 1, max(0, int(round(p / 100 * len(valores_ordenados))) - 1))
+    return valores_ordenados[indice]
+
+
+def resumir(duracoes_ms):
+    duracoes = sorted(duracoes_ms)
+    return {
+        'media': statistics.fmean(duracoes) if duracoes else 0.0,
+        'p50': percentil(duracoes, 50),
+        'p95': percentil(duracoes, 95),
+        'p99': percentil(duracoes, 99),
+    }
+
+
+def medir(funcao, repeticoes):
+    """Executa funcao() `repeticoes` vezes e resume as durações em ms"""
+    duracoes = []
+    for _ in range(repeticoes):
+        inicio = relogio.perf_counter()
+        funcao()
+        duracoes.append((relogio.perf_counter() - inicio) * 1000)
+    return resumir(duracoes)
+
+
+def formatar(nome, resultado, largura=40):
+    return (
+        f'{nome:<{largura}} média {resultado["media"]:.3f}  p50 {resultado["p50"]:.3f}  '
+        f'p95 {resultado["p95"]:.3f}  p99 {resultado["p99"]:.3f}'
+    )
@@ -0,0 +1,64 @@
+"""Latência de /api/medico/<id>/availability/ com o log de debug desligado e ligado.
+
+Uso (na raiz do projeto):
+
+    python benchmarks/disponibilidade_logging.py --requisicoes 2000
+
+Cria um banco de testes temporário com um médico e uma agenda parcialmente
+ocupada e mede a mesma requisição em três cenários: nível INFO (debug
+desligado), DEBUG com o HandlerFila (escrita em outra thread) e DEBUG com um
+StreamHandler síncrono, como referência do custo de escrever na thread da
+requisição. A saída dos logs vai para /dev/null.
+"""
+import argparse
+import logging
+import os
+
+from comum import banco_temporario, formatar, medico_com_agenda, medir
+
+from django.test import Client
+
+from agenda.logs import FormatadorJSON, HandlerFila
+
+
+def configurar_logger(nivel, handler):
+    logger = logging.getLogger('agenda')
+    for antigo in list(logger.handlers):
+        logger.removeHandler(antigo)
+        antigo.close()
+    logger.addHandler(handler)
+    logger.setLevel(nivel)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requisicoes', type=int, default=1000)
+    args = parser.parse_args()
+
+    with banco_temporario():
+        medico, data = medico_com_agenda()
+        cliente = Client()
+        url = f'/api/medico/{medico.pk}/availability/'
+
+        def requisicao():
+            cliente.get(url, {'data': data.isoformat()})
+
+        medir(requisicao, 50)  # aquecimento (cache de disponibilidade e imports)
+
+        with open(os.devnull, 'w') as nulo:
+            sincrono = logging.StreamHandler(nulo)
+            sincrono.setFormatter(FormatadorJSON())
+            cenarios = [
+                ('debug desligado (INFO)', logging.INFO, HandlerFila(stream=nulo)),
+                ('debug ligado, HandlerFila', logging.DEBUG, HandlerFila(stream=nulo)),
+                ('debug ligado, StreamHandler síncrono', logging.DEBUG, sincrono),
+            ]
+            print(f'{args.requisicoes} requisições por cenário (ms)')
+            for nome, nivel, handler in cenarios:
+                configurar_logger(nivel, handler)
+                print(formatar(nome, medir(requisicao, args.requisicoes)))
+            configurar_logger(logging.INFO, logging.NullHandler())
+
+
+if __name__ == '__main__':
+    main()
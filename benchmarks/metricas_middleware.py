@@ -0,0 +1,70 @@
+"""Custo do MetricasMiddleware: latência das mesmas requisições com e sem o middleware.
+
+Uso (na raiz do projeto):
+
+    python benchmarks/metricas_middleware.py --requisicoes 2000
+
+Mede uma rota sem banco (página inicial), a API de disponibilidade (cache) e a
+lista de consultas (SQL), alternando as configurações em rodadas para reduzir o
+efeito de ruído da máquina.
+"""
+import argparse
+import time
+
+from comum import banco_temporario, formatar, medico_com_agenda, medir, resumir
+
+from django.conf import settings
+from django.test import Client
+from django.test.utils import override_settings
+
+from core.metrics import metricas
+
+MIDDLEWARE_METRICAS = 'core.middleware.MetricasMiddleware'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requisicoes', type=int, default=1000)
+    parser.add_argument('--rodadas', type=int, default=5)
+    args = parser.parse_args()
+
+    com_metricas = list(settings.MIDDLEWARE)
+    if MIDDLEWARE_METRICAS not in com_metricas:
+        com_metricas.insert(0, MIDDLEWARE_METRICAS)
+    sem_metricas = [item for item in com_metricas if item != MIDDLEWARE_METRICAS]
+
+    with banco_temporario():
+        medico, data = medico_com_agenda()
+        rotas = [
+            ('página inicial', '/', {}),
+            ('disponibilidade', f'/api/medico/{medico.pk}/availability/', {'data': data.isoformat()}),
+            ('lista de consultas', '/agenda/consultas/', {}),
+        ]
+        por_rodada = max(1, args.requisicoes // args.rodadas)
+        print(f'{por_rodada * args.rodadas} requisições por cenário (ms)')
+        for nome, url, parametros in rotas:
+            duracoes = {'sem middleware': [], 'com middleware': []}
+            for _ in range(args.rodadas):
+                for cenario, middleware in (('sem middleware', sem_metricas), ('com middleware', com_metricas)):
+                    with override_settings(MIDDLEWARE=middleware):
+                        cliente = Client()
+                        medir(lambda: cliente.get(url, parametros), 20)  # aquecimento
+                        duracoes[cenario].extend(_duracoes(cliente, url, parametros, por_rodada))
+            for cenario, valores in duracoes.items():
+                print(formatar(f'{nome}, {cenario}', resumir(valores), largura=44))
+            sem, com = (resumir(valores)['p50'] for valores in duracoes.values())
+            print(f'{"":<44} sobrecarga p50 {com - sem:+.3f} ms')
+            metricas.zerar()
+
+
+def _duracoes(cliente, url, parametros, repeticoes):
+    valores = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        cliente.get(url, parametros)
+        valores.append((time.perf_counter() - inicio) * 1000)
+    return valores
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""Benchmarks dos caminhos principais do agenda, com resultado em JSON para comparar commits.
+
+Uso (na raiz do projeto):
+
+    python benchmarks/suite.py --escala pequena --saida resultados.json
+    python benchmarks/suite.py --escala media --comparar resultados.json
+
+Cria um banco de testes temporário, popula com o comando gerar_dados na escala
+escolhida e mede listas, detalhes, a API de disponibilidade, o agendamento pelo
+ConsultaForm, a busca e o relatório de utilização. Para cada cenário são
+registrados média, p50, p95, p99 (em ms) e o número de consultas SQL por execução.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+from datetime import datetime, timedelta
+
+from comum import banco_temporario, formatar, medir
+
+import django
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from agenda.cache import cache_agenda
+from agenda.forms import ConsultaForm
+from agenda.models import Consulta, Medico, Paciente
+from agenda.services import salvar_consulta
+from core.middleware import ContadorSQL
+
+ESCALAS = {
+    'minima': {'especialidades': 5, 'medicos': 20, 'pacientes': 500, 'consultas': 5000},
+    'pequena': {'especialidades': 20, 'medicos': 200, 'pacientes': 20000, 'consultas': 200000},
+    'media': {'especialidades': 50, 'medicos': 2000, 'pacientes': 100000, 'consultas': 2000000},
+    'grande': {'especialidades': 50, 'medicos': 2000, 'pacientes': 500000, 'consultas': 10000000},
+}
+
+
+def commit_atual():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def horario_livre(medico):
+    """Primeiro horário livre do médico a partir de amanhã"""
+    from agenda.scheduling import disponibilidade_periodo
+
+    inicio = timezone.localdate() + timedelta(days=1)
+    for dia in disponibilidade_periodo(medico, inicio, inicio + timedelta(days=60)):
+        if dia['horarios_disponiveis']:
+            return dia['data'], dia['horarios_disponiveis'][0]
+    raise RuntimeError(f'Nenhum horário livre para o médico {medico.pk}')
+
+
+def cenarios(cliente):
+    """Retorna [(nome, função)] com os cenários medidos"""
+    medico = Medico.objects.order_by('id').first()
+    paciente = Paciente.objects.order_by('id').first()
+    consulta = Consulta.objects.order_by('id').first()
+    data = timezone.localdate().isoformat()
+    fim_periodo = (timezone.localdate() + timedelta(days=59)).isoformat()
+    inicio_ano = (timezone.localdate() - timedelta(days=365)).isoformat()
+    data_livre, hora_livre = horario_livre(medico)
+    prefixo_nome = paciente.nome_busca.split()[0][:3]
+
+    def get(nome_url, *args, **parametros):
+        url = reverse(nome_url, args=args)
+        return lambda: cliente.get(url, parametros)
+
+    def disponibilidade_sem_cache():
+        cache_agenda().clear()
+        cliente.get(reverse('medico_availability', args=[medico.pk]), {'data': data})
+
+    def agendar():
+        # Validação e gravação completas; a transação é desfeita para repetir o mesmo horário
+        with transaction.atomic():
+            form = ConsultaForm({
+                'paciente': paciente.pk, 'medico': medico.pk, 'status': 'agendada',
+                'data': data_livre, 'hora': hora_livre,
+            })
+            if not form.is_valid() or salvar_consulta(form) is None:
+                raise RuntimeError(f'Agendamento inválido: {form.errors.as_json()}')
+            transaction.set_rollback(True)
+
+    def utilizacao_csv():
+        resposta = cliente.get(reverse('utilizacao_medicos_csv'), {'inicio': inicio_ano, 'fim': data})
+        b''.join(resposta.streaming_content)
+
+    return [
+        ('lista_especialidades', get('especialidade_list')),
+        ('lista_medicos', get('medico_list')),
+        ('lista_pacientes', get('paciente_list')),
+        ('lista_consultas', get('consulta_list')),
+        ('lista_consultas_filtrada', get('consulta_list', status='agendada', medico=medico.pk)),
+        ('detalhe_especialidade', get('especialidade_detail', medico.especialidade_id)),
+        ('detalhe_medico', get('medico_detail', medico.pk)),
+        ('detalhe_paciente', get('paciente_detail', paciente.pk)),
+        ('detalhe_consulta', get('consulta_detail', consulta.pk)),
+        ('disponibilidade', get('medico_availability', medico.pk, data=data)),
+        ('disponibilidade_sem_cache', disponibilidade_sem_cache),
+        ('disponibilidade_periodo', get('medico_availability_range', medico.pk, start=data, end=fim_periodo)),
+        ('agendamento_consulta_form', agendar),
+        ('busca_pacientes_nome', get('paciente_busca_api', q=prefixo_nome)),
+        ('busca_pacientes_cpf', get('paciente_busca_api', q=paciente.cpf_digitos[:6])),
+        ('busca_medicos', get('medico_busca_api', q=medico.nome_busca.split()[1][:3])),
+        ('utilizacao_medicos_ano', get('utilizacao_medicos', inicio=inicio_ano, fim=data)),
+        ('utilizacao_medicos_csv', utilizacao_csv),
+    ]
+
+
+def executar(repeticoes, filtro=None):
+    cliente = Client()
+    resultados = {}
+    for nome, funcao in cenarios(cliente):
+        if filtro and filtro not in nome:
+            continue
+        funcao()  # aquecimento
+        contador = ContadorSQL()
+        with connection.execute_wrapper(contador):
+            funcao()
+        resultado = medir(funcao, repeticoes)
+        resultado['consultas_sql'] = contador.consultas
+        resultados[nome] = resultado
+        print(formatar(nome, resultado, largura=30) + f'  sql {resultado["consultas_sql"]}')
+    return resultados
+
+
+def comparar(resultados, arquivo):
+    with open(arquivo, encoding='utf-8') as entrada:
+        anterior = json.load(entrada)
+    print(f'\nComparação com {arquivo} (commit {anterior.get("commit")}), p50 em ms:')
+    for nome, atual in resultados.items():
+        base = anterior['resultados'].get(nome)
+        if base:
+            variacao = (atual['p50'] - base['p50']) / base['p50'] * 100 if base['p50'] else 0.0
+            print(f'{nome:<30} {base["p50"]:9.3f} -> {atual["p50"]:9.3f}  ({variacao:+.1f}%)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--escala', choices=ESCALAS, default='minima')
+    parser.add_argument('--repeticoes', type=int, default=50)
+    parser.add_argument('--filtro', help='Executa apenas os cenários cujo nome contém este texto')
+    parser.add_argument('--saida', help='Arquivo JSON com os resultados')
+    parser.add_argument('--comparar', help='Arquivo JSON de uma execução anterior')
+    parser.add_argument('--semente', type=int, default=42)
+    args = parser.parse_args()
+
+    with banco_temporario():
+        print(f'Gerando dados na escala "{args.escala}"...', file=sys.stderr)
+        call_command('gerar_dados', semente=args.semente, stdout=sys.stderr, **ESCALAS[args.escala])
+        resultados = executar(args.repeticoes, args.filtro)
+
+    relatorio = {
+        'commit': commit_atual(),
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'escala': args.escala,
+        'dados': ESCALAS[args.escala],
+        'repeticoes': args.repeticoes,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'banco': connection.vendor,
+        'resultados': resultados,
+    }
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as saida:
+            json.dump(relatorio, saida, ensure_ascii=False, indent=2)
+    if args.comparar:
+        comparar(resultados, args.comparar)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+import threading
+from bisect import bisect_left
+
+from django.http import HttpResponse
+
+# Limites (em segundos) dos buckets do histograma de latência
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histograma:
+    """Histograma cumulativo no formato do Prometheus (contagens por limite superior)"""
+
+    def __init__(self, buckets=BUCKETS_LATENCIA):
+        self.buckets = buckets
+        self.contagens = [0] * (len(buckets) + 1)  # o último é o +Inf
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.contagens[bisect_left(self.buckets, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+    def cumulativo(self):
+        acumulado = 0
+        for limite, contagem in zip((*self.buckets, float('inf')), self.contagens):
+            acumulado += contagem
+            yield limite, acumulado
+
+
+class MetricasRota:
+    def __init__(self):
+        self.latencia = Histograma()
+        self.respostas = {}  # (método, status) -> quantidade
+        self.consultas_sql = 0
+        self.tempo_sql = 0.0
+
+
+class RegistroMetricas:
+    """Métricas das requisições agrupadas pelo nome da rota (por processo)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.rotas = {}
+
+    def registrar(self, rota, metodo, status, duracao, consultas_sql, tempo_sql):
+        with self._lock:
+            metricas = self.rotas.get(rota)
+            if metricas is None:
+                metricas = self.rotas[rota] = MetricasRota()
+            metricas.latencia.observar(duracao)
+            chave = (metodo, status)
+            metricas.respostas[chave] = metricas.respostas.get(chave, 0) + 1
+            metricas.consultas_sql += consultas_sql
+            metricas.tempo_sql += tempo_sql
+
+    def zerar(self):
+        with self._lock:
+            self.rotas = {}
+
+    def exportar(self):
+        """Retorna as métricas no formato de texto do Prometheus"""
+        with self._lock:
+            rotas = sorted(self.rotas.items())
+            linhas = [
+                '# HELP agenda_http_request_duration_seconds Latência das requisições por rota.',
+                '# TYPE agenda_http_request_duration_seconds histogram',
+            ]
+            for rota, metricas in rotas:
+                for limite, acumulado in metricas.latencia.cumulativo():
+                    le = '+Inf' if limite == float('inf') else repr(limite)
+                    linhas.append(f'agenda_http_request_duration_seconds_bucket{{view="{rota}",le="{le}"}} {acumulado}')
+                linhas.append(f'agenda_http_request_duration_seconds_sum{{view="{rota}"}} {metricas.latencia.soma:.6f}')
+                linhas.append(f'agenda_http_request_duration_seconds_count{{view="{rota}"}} {metricas.latencia.total}')
+
+            linhas += [
+                '# HELP agenda_http_responses_total Respostas por rota, método e status.',
+                '# TYPE agenda_http_responses_total counter',
+            ]
+            for rota, metricas in rotas:
+                for (metodo, status), quantidade in sorted(metricas.respostas.items()):
+                    linhas.append(
+                        f'agenda_http_responses_total{{view="{rota}",method="{metodo}",status="{status}"}} {quantidade}'
+                    )
+
+            linhas += [
+                '# HELP agenda_db_queries_total Consultas SQL executadas por rota.',
+                '# TYPE agenda_db_queries_total counter',
+            ]
+            linhas += [f'agenda_db_queries_total{{view="{rota}"}} {m.consultas_sql}' for rota, m in rotas]
+            linhas += [
+                '# HELP agenda_db_query_duration_seconds_total Tempo total gasto no banco por rota.',
+                '# TYPE agenda_db_query_duration_seconds_total counter',
+            ]
+            linhas += [f'agenda_db_query_duration_seconds_total{{view="{rota}"}} {m.tempo_sql:.6f}' for rota, m in rotas]
+        return '\n'.join(linhas) + '\n'
+
+
+metricas = RegistroMetricas()
+
+
+def exportar_metricas(request):
+    """Endpoint de métricas no formato de texto do Prometheus"""
+    from agenda.cache import estatisticas
+
+    texto = metricas.exportar() + (
+        '# HELP agenda_cache_disponibilidade_total Leituras do cache de disponibilidade por resultado.\n'
+        '# TYPE agenda_cache_disponibilidade_total counter\n'
+        f'agenda_cache_disponibilidade_total{{resultado="acerto"}} {estatisticas.acertos}\n'
+        f'agenda_cache_disponibilidade_total{{resultado="falha"}} {estatisticas.falhas}\n'
+    )
+    return HttpResponse(texto, content_type='text/plain; version=0.0.4; charset=utf-8')
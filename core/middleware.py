@@ -0,0 +1,82 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+
+from .metrics import metricas
+
+logger = logging.getLogger(__name__)
+
+
+class ContadorSQL:
+    """Execute wrapper que conta as consultas SQL e soma o tempo gasto no banco"""
+
+    def __init__(self):
+        self.consultas = 0
+        self.tempo = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.tempo += time.perf_counter() - inicio
+            self.consultas += 1
+
+
+class MetricasMiddleware:
+    """Registra latência, número de consultas SQL e tempo de banco de cada requisição por rota.
+
+    Requisições acima de METRICAS_LIMITE_LENTO_MS são registradas no log (0 desliga).
+    Em respostas em streaming, apenas a geração da resposta é medida, não o envio do conteúdo.
+    No modo assíncrono (ASGI) as consultas do ORM rodam em outra thread, com outra conexão,
+    e por isso não são contadas.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        contador = ContadorSQL()
+        inicio = time.perf_counter()
+        with connection.execute_wrapper(contador):
+            response = self.get_response(request)
+        self.registrar(request, response, time.perf_counter() - inicio, contador)
+        return response
+
+    async def __acall__(self, request):
+        inicio = time.perf_counter()
+        response = await self.get_response(request)
+        self.registrar(request, response, time.perf_counter() - inicio, ContadorSQL())
+        return response
+
+    def registrar(self, request, response, duracao, contador):
+        rota = self.nome_rota(request)
+        metricas.registrar(rota, request.method, response.status_code, duracao, contador.consultas, contador.tempo)
+        limite_ms = settings.METRICAS_LIMITE_LENTO_MS
+        if limite_ms and duracao * 1000 > limite_ms:
+            logger.warning(
+                'Requisição lenta: %s %s (%s) em %.1f ms, %d consultas SQL em %.1f ms',
+                request.method, request.path, rota, duracao * 1000, contador.consultas, contador.tempo * 1000,
+                extra={
+                    'rota': rota,
+                    'duracao_ms': round(duracao * 1000, 1),
+                    'consultas_sql': contador.consultas,
+                    'tempo_sql_ms': round(contador.tempo * 1000, 1),
+                },
+            )
+
+    @staticmethod
+    def nome_rota(request):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return '<nao_encontrada>'
+        return match.url_name or match.view_name
@@ -38,6 +38,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricasMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -47,6 +48,9 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Requisições mais lentas que este limite (em ms) são registradas no log; 0 desliga
+METRICAS_LIMITE_LENTO_MS = config('METRICAS_LIMITE_LENTO_MS', default=500, cast=int)
+
 ROOT_URLCONF = 'core.urls'
 
 TEMPLATES = [
@@ -71,9 +75,44 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / "db.sqlite3",  # ou o valor que você está usando
+        'OPTIONS': {
+            # Adquire o lock de escrita no início da transação, evitando falhas ao promover
+            # leituras para escrita quando há agendamentos concorrentes
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        'TEST': {
+            # Banco de testes em arquivo para que testes com várias threads usem conexões reais
+            'NAME': BASE_DIR / "test_db.sqlite3",
+        },
+    }
+}
+
+
+# Cache (memória local por padrão; em produção, um backend compartilhado como Redis ou Memcached)
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='agenda'),
     }
 }
 
+# Cache da ocupação diária das agendas (alias em CACHES e validade em segundos)
+AGENDA_CACHE_ALIAS = config('AGENDA_CACHE_ALIAS', default='default')
+AGENDA_CACHE_TIMEOUT = config('AGENDA_CACHE_TIMEOUT', default=300, cast=int)
+
+# Atualização dos horários livres em tempo real (Server-Sent Events): broker de
+# pub/sub (classe com publicar/assinar), intervalo dos comentários de keep-alive e
+# duração máxima de cada conexão, em segundos (o navegador reconecta sozinho)
+AGENDA_BROKER_EVENTOS = config('AGENDA_BROKER_EVENTOS', default='agenda.eventos.BrokerMemoria')
+AGENDA_SSE_KEEPALIVE = config('AGENDA_SSE_KEEPALIVE', default=15, cast=int)
+AGENDA_SSE_DURACAO_MAXIMA = config('AGENDA_SSE_DURACAO_MAXIMA', default=300, cast=int)
+
+# Lista de espera: os horários liberados por cancelamentos são oferecidos aos pacientes
+# em espera por um pool de threads, após o commit (a requisição que cancelou não espera).
+# AGENDA_ESPERA_SINCRONA=True faz o encaixe na própria thread, logo após o commit (testes).
+AGENDA_ESPERA_WORKERS = config('AGENDA_ESPERA_WORKERS', default=2, cast=int)
+AGENDA_ESPERA_SINCRONA = config('AGENDA_ESPERA_SINCRONA', default=False, cast=bool)
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -115,3 +154,31 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Janela do feed iCalendar de cada médico, em dias antes e depois de hoje
+AGENDA_FEED_DIAS_ANTERIORES = config('AGENDA_FEED_DIAS_ANTERIORES', default=30, cast=int)
+AGENDA_FEED_DIAS_POSTERIORES = config('AGENDA_FEED_DIAS_POSTERIORES', default=180, cast=int)
+
+# Logs dos apps agenda e core: registros JSON gravados por uma thread separada (agenda.logs.HandlerFila).
+# Use AGENDA_LOG_LEVEL=DEBUG para ver os detalhes da disponibilidade calculada.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'agenda': {
+            '()': 'agenda.logs.HandlerFila',
+        },
+    },
+    'loggers': {
+        'agenda': {
+            'handlers': ['agenda'],
+            'level': config('AGENDA_LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
+        'core': {
+            'handlers': ['agenda'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
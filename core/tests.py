@@ -0,0 +1,57 @@
+from datetime import time
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from agenda.models import Especialidade, Medico
+
+from .metrics import Histograma, metricas
+
+
+class MetricasMiddlewareTests(TestCase):
+    def setUp(self):
+        metricas.zerar()
+        self.addCleanup(metricas.zerar)
+        especialidade = Especialidade.objects.create(nome='Cardiologia')
+        self.medico = Medico.objects.create(
+            nome='Dr. Teste', crm='123', especialidade=especialidade, hora_inicio=time(9, 0), hora_fim=time(12, 0),
+        )
+
+    def test_registra_latencia_e_sql_por_rota(self):
+        for _ in range(2):
+            self.client.get(reverse('medico_list'))
+        self.client.get('/nao-existe/')
+
+        rota = metricas.rotas['medico_list']
+        self.assertEqual(rota.latencia.total, 2)
+        self.assertEqual(rota.respostas, {('GET', 200): 2})
+        self.assertEqual(rota.consultas_sql, 2)
+        self.assertGreater(rota.tempo_sql, 0)
+        self.assertEqual(metricas.rotas['<nao_encontrada>'].respostas, {('GET', 404): 1})
+
+    def test_endpoint_prometheus(self):
+        self.client.get(reverse('medico_detail', args=[self.medico.pk]))
+        response = self.client.get(reverse('metricas'))
+        self.assertEqual(response.status_code, 200)
+        texto = response.content.decode()
+        self.assertIn('agenda_http_request_duration_seconds_bucket{view="medico_detail",le="+Inf"} 1', texto)
+        self.assertIn('agenda_http_request_duration_seconds_count{view="medico_detail"} 1', texto)
+        self.assertIn('agenda_http_responses_total{view="medico_detail",method="GET",status="200"} 1', texto)
+        self.assertIn('agenda_db_queries_total{view="medico_detail"} 2', texto)
+        self.assertIn('agenda_cache_disponibilidade_total{resultado="acerto"}', texto)
+
+    def test_requisicoes_lentas_no_log(self):
+        with override_settings(METRICAS_LIMITE_LENTO_MS=0):
+            with self.assertNoLogs('core.middleware', level='WARNING'):
+                self.client.get(reverse('medico_list'))
+        with override_settings(METRICAS_LIMITE_LENTO_MS=1e-6):
+            with self.assertLogs('core.middleware', level='WARNING') as capturados:
+                self.client.get(reverse('medico_list'))
+        self.assertEqual(capturados.records[0].rota, 'medico_list')
+        self.assertEqual(capturados.records[0].consultas_sql, 1)
+
+    def test_histograma_cumulativo(self):
+        histograma = Histograma(buckets=(0.1, 1.0))
+        for valor in (0.05, 0.1, 0.5, 3):
+            histograma.observar(valor)
+        self.assertEqual(list(histograma.cumulativo()), [(0.1, 2), (1.0, 3), (float('inf'), 4)])
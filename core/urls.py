@@ -1,14 +1,53 @@
 from django.contrib import admin
 from django.urls import path, include
 from django.shortcuts import render
-from agenda.views import get_medico_availability
+from core.metrics import exportar_metricas
+from agenda.views import (
+    get_medico_availability,
+    get_medico_availability_range,
+    eventos_agenda_medico,
+    estatisticas_cache_disponibilidade,
+    get_especialidade_proximos_horarios,
+    buscar_pacientes_api,
+    buscar_medicos_api,
+    agendar_consulta_api,
+    get_medico_availability_async,
+    get_medico_availability_range_async,
+    buscar_pacientes_api_async,
+    buscar_medicos_api_async,
+    agendar_consulta_api_async,
+    agregados_consultas_api,
+)
 
 def home(request):
-    return render(request, 'home.html')
+    from agenda.agregados import consultas_do_dia
+    from agenda.models import Especialidade, Medico, Paciente
+
+    return render(request, 'home.html', {
+        'consultas_hoje': consultas_do_dia(),
+        'total_pacientes': Paciente.objects.count(),
+        'total_medicos': Medico.objects.count(),
+        'total_especialidades': Especialidade.objects.count(),
+    })
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', home),
+    path('metrics/', exportar_metricas, name='metricas'),
     path('agenda/', include('agenda.urls')),
     path('api/medico/<int:medico_id>/availability/', get_medico_availability, name='medico_availability'),
+    path('api/medico/<int:medico_id>/availability/range/', get_medico_availability_range, name='medico_availability_range'),
+    path('api/medico/<int:medico_id>/eventos/', eventos_agenda_medico, name='medico_eventos'),
+    path('api/disponibilidade/cache/', estatisticas_cache_disponibilidade, name='disponibilidade_cache_api'),
+    path('api/especialidade/<int:especialidade_id>/proximos-horarios/', get_especialidade_proximos_horarios, name='especialidade_proximos_horarios_api'),
+    path('api/pacientes/busca/', buscar_pacientes_api, name='paciente_busca_api'),
+    path('api/medicos/busca/', buscar_medicos_api, name='medico_busca_api'),
+    path('api/consultas/agregados/', agregados_consultas_api, name='consulta_agregados_api'),
+    path('api/consultas/agendar/', agendar_consulta_api, name='consulta_agendar_api'),
+    # Versões assíncronas das APIs usadas pelo formulário de agendamento (servidor ASGI)
+    path('api/async/medico/<int:medico_id>/availability/', get_medico_availability_async, name='medico_availability_async'),
+    path('api/async/medico/<int:medico_id>/availability/range/', get_medico_availability_range_async, name='medico_availability_range_async'),
+    path('api/async/pacientes/busca/', buscar_pacientes_api_async, name='paciente_busca_async_api'),
+    path('api/async/medicos/busca/', buscar_medicos_api_async, name='medico_busca_async_api'),
+    path('api/async/consultas/agendar/', agendar_consulta_api_async, name='consulta_agendar_async_api'),
 ]
@@ -0,0 +1,88 @@
+// Autocomplete para selects com a classe "autocomplete-select".
+// O select original fica oculto (mantendo name/id e o evento "change") e recebe
+// apenas a opção escolhida; as sugestões vêm da URL em data-autocomplete-url.
+document.addEventListener('DOMContentLoaded', function() {
+    document.querySelectorAll('select.autocomplete-select').forEach(function(select) {
+        const url = select.dataset.autocompleteUrl;
+        const wrapper = document.createElement('div');
+        wrapper.className = 'position-relative';
+        const input = document.createElement('input');
+        input.type = 'search';
+        input.className = 'form-control';
+        input.placeholder = select.dataset.placeholder || '';
+        input.autocomplete = 'off';
+        const lista = document.createElement('ul');
+        lista.className = 'dropdown-menu w-100';
+
+        select.parentNode.insertBefore(wrapper, select);
+        wrapper.appendChild(input);
+        wrapper.appendChild(lista);
+        wrapper.appendChild(select);
+        select.style.display = 'none';
+
+        const selecionada = select.options[select.selectedIndex];
+        if (selecionada && selecionada.value) {
+            input.value = selecionada.textContent;
+        }
+
+        function escolher(item) {
+            select.innerHTML = '';
+            const option = document.createElement('option');
+            option.value = item ? item.id : '';
+            option.textContent = item ? item.texto : '';
+            option.selected = true;
+            select.appendChild(option);
+            input.value = item ? item.texto : '';
+            lista.classList.remove('show');
+            select.dispatchEvent(new Event('change'));
+        }
+
+        let timer = null;
+        let ultimaBusca = 0;
+        input.addEventListener('input', function() {
+            clearTimeout(timer);
+            const termo = input.value.trim();
+            if (!termo) {
+                escolher(null);
+                return;
+            }
+            if (termo.length < 2) {
+                lista.classList.remove('show');
+                return;
+            }
+            timer = setTimeout(function() {
+                const busca = ++ultimaBusca;
+                fetch(url + '?' + new URLSearchParams({q: termo}).toString())
+                    .then(response => response.json())
+                    .then(data => {
+                        // Ignorar respostas de buscas anteriores que chegaram fora de ordem
+                        if (busca !== ultimaBusca) {
+                            return;
+                        }
+                        lista.innerHTML = '';
+                        (data.resultados || []).forEach(function(item) {
+                            const li = document.createElement('li');
+                            const a = document.createElement('a');
+                            a.href = '#';
+                            a.className = 'dropdown-item';
+                            a.textContent = item.texto;
+                            a.addEventListener('click', function(event) {
+                                event.preventDefault();
+                                escolher(item);
+                            });
+                            li.appendChild(a);
+                            lista.appendChild(li);
+                        });
+                        lista.classList.toggle('show', lista.children.length > 0);
+                    })
+                    .catch(error => console.error('Erro na busca:', error));
+            }, 250);
+        });
+
+        document.addEventListener('click', function(event) {
+            if (!wrapper.contains(event.target)) {
+                lista.classList.remove('show');
+            }
+        });
+    });
+});